@@ -11,6 +11,10 @@ FOR (t:Terminal) REQUIRE t.terminalId IS UNIQUE;
 CREATE CONSTRAINT transaction_id_unique IF NOT EXISTS 
 FOR (tx:Transaction) REQUIRE tx.transactionId IS UNIQUE;
 
+// Lookup dei quarter per MERGE nell'ingestione dei delta
+CREATE CONSTRAINT quarter_id_unique IF NOT EXISTS 
+FOR (q:Quarter) REQUIRE q.quarterId IS UNIQUE;
+
 // Indici per migliorare le performance delle query
 CREATE INDEX transaction_fraud_idx IF NOT EXISTS 
 FOR (tx:Transaction) ON (tx.fraud);
@@ -25,3 +29,7 @@ FOR (q:Quarter) ON (q.prev_median);
 CREATE INDEX transaction_amount_idx IF NOT EXISTS 
 FOR (tx:Transaction) ON (tx.amount);
 
+// Outlier precalcolati da generate --outliers (letti da q1b_precomputed)
+CREATE INDEX transaction_outlier_idx IF NOT EXISTS 
+FOR (tx:Transaction) ON (tx.potentialOutlier);
+
@@ -12,11 +12,29 @@ echo "========================================"
 CSV_DIR="/init-csv"
 DATA_DIR="/data/databases/neo4j"
 
+# Percorso di un file di import: .csv.gz se presente, altrimenti .csv
+csv_file() {
+    if [ -f "${CSV_DIR}/$1.csv.gz" ]; then
+        echo "${CSV_DIR}/$1.csv.gz"
+    else
+        echo "${CSV_DIR}/$1.csv"
+    fi
+}
+
+# Tipo degli ID scelto da generate --id-type (scritto in dataset.json)
+id_type() {
+    if [ -f "${CSV_DIR}/dataset.json" ] && grep -q '"id_type": "integer"' "${CSV_DIR}/dataset.json"; then
+        echo "integer"
+    else
+        echo "string"
+    fi
+}
+
 # 1. Controlla se ci sono CSV da importare
-if [ -f "${CSV_DIR}/customers.csv" ]; then
+if [ -f "${CSV_DIR}/customers.csv" ] || [ -f "${CSV_DIR}/customers.csv.gz" ]; then
     echo "CSV rilevati in ${CSV_DIR}"
     echo "File trovati:"
-    ls -la ${CSV_DIR}/*.csv 2>/dev/null | awk '{print "   - " $9}'
+    ls -la ${CSV_DIR}/*.csv ${CSV_DIR}/*.csv.gz 2>/dev/null | awk '{print "   - " $9}'
     
     # 2. Controlla se il database ESISTE già
     if [ -d "${DATA_DIR}" ] && [ "$(ls -A ${DATA_DIR} 2>/dev/null)" ]; then
@@ -27,17 +45,19 @@ if [ -f "${CSV_DIR}/customers.csv" ]; then
         # 3. Esegui neo4j-admin import
         START_TIME=$(date +%s)
         
+        echo "Tipo ID: $(id_type)"
         neo4j-admin database import full \
-            --nodes="${CSV_DIR}/customers.csv" \
-            --nodes="${CSV_DIR}/terminals.csv" \
-            --nodes="${CSV_DIR}/transactions.csv" \
-            --nodes="${CSV_DIR}/quarters.csv" \
-            --relationships="${CSV_DIR}/cust_tx.csv" \
-            --relationships="${CSV_DIR}/tx_term.csv" \
-            --relationships="${CSV_DIR}/shares_terminal.csv" \
-            --relationships="${CSV_DIR}/used_terminal.csv" \
-            --relationships="${CSV_DIR}/transaction_quarter.csv" \
-            --relationships="${CSV_DIR}/terminal_quarter.csv" \
+            --id-type="$(id_type)" \
+            --nodes="$(csv_file customers)" \
+            --nodes="$(csv_file terminals)" \
+            --nodes="$(csv_file transactions)" \
+            --nodes="$(csv_file quarters)" \
+            --relationships="$(csv_file cust_tx)" \
+            --relationships="$(csv_file tx_term)" \
+            --relationships="$(csv_file shares_terminal)" \
+            --relationships="$(csv_file used_terminal)" \
+            --relationships="$(csv_file transaction_quarter)" \
+            --relationships="$(csv_file terminal_quarter)" \
             --skip-duplicate-nodes=true \
             --skip-bad-relationships=true \
             --bad-tolerance=10000 \
@@ -0,0 +1,21 @@
+// QUERY 3.b - Outlier precalcolati (dataset generato con --outliers)
+// Il converter scrive su ogni transazione outlier_ratio = amount / prev_median
+// del suo quarter e potentialOutlier = true se il rapporto supera 1.3, con lo
+// stesso filtro di q1b.cypher: qui gli outlier vengono letti tramite l'indice
+// su potentialOutlier, senza attraversare IN_QUARTER per ogni transazione né
+// scrivere il flag. IN_QUARTER viene seguita solo per gli outlier.
+
+MATCH (tx:Transaction)
+WHERE tx.potentialOutlier = true
+MATCH (tx)-[:IN_QUARTER]->(q:Quarter)
+WITH tx, q, tx.outlier_ratio AS ratio
+RETURN 
+    q.quarterId,
+    tx.transactionId,
+    toFloat(tx.amount) AS transaction_amount,
+    toFloat(q.prev_median) AS previous_quarter_median,
+    toFloat(q.prev_median) * 1.3 AS threshold,
+    ratio,
+    round((ratio - 1) * 100, 2) AS percentage_above,
+    'POTENTIAL_OUTLIER' AS status
+ORDER BY ratio DESC;
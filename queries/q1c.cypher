@@ -3,7 +3,10 @@
 // un percorso di grado 3: u1-t1-u2-t2-u3 dove u1=u, u3=y
 // CN3 = 3 customer (u, u2, y) collegati da 2 terminali (t1, t2)
 
-MATCH path = (u:Customer {customerId: $customerId})
+// customerId è una stringa o un intero a seconda di --id-type dell'import
+MATCH (u:Customer)
+WHERE u.customerId IN [toString($customerId), toInteger($customerId)]
+MATCH path = (u)
     -[:USED_TERMINAL]->(t1:Terminal)
     <-[:USED_TERMINAL]-(u2:Customer)
     -[:USED_TERMINAL]->(t2:Terminal)
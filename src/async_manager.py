@@ -0,0 +1,190 @@
+"""neo4j_manager/async_manager.py - Manager asincrono per query concorrenti"""
+
+import asyncio
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import time
+from neo4j import AsyncGraphDatabase, AsyncDriver, Record
+from neo4j.exceptions import ServiceUnavailable, SessionExpired
+
+from base import Neo4jConfig, QueryResult, ResponseParser
+from parsers import default_parsers
+
+
+class BufferedResult:
+    """
+    Record già letti da un AsyncResult, con l'interfaccia di Result usata
+    dai parser (keys, iterazione, single)
+    """
+
+    def __init__(self, keys: List[str], records: List[Record]):
+        self._keys = keys
+        self._records = records
+
+    def keys(self) -> List[str]:
+        return self._keys
+
+    def __iter__(self) -> Iterator[Record]:
+        return iter(self._records)
+
+    def single(self) -> Optional[Record]:
+        return self._records[0] if self._records else None
+
+
+class AsyncNeo4jManager:
+    """
+    Versione asyncio di Neo4jManager, per query indipendenti in parallelo
+
+    Stessi parser e stesso QueryResult: i record di una query vengono letti
+    dal driver asincrono e passati al parser come BufferedResult, quindi un
+    risultato resta in memoria per intero anche con ColumnarParser o
+    SinkParser. Al massimo config.max_concurrency query sono in esecuzione
+    contemporaneamente, ognuna con la propria sessione del pool.
+    """
+
+    def __init__(self, config: Optional[Neo4jConfig] = None):
+        self.config = config or Neo4jConfig()
+        self.driver: Optional[AsyncDriver] = None
+        self._alive = False
+        self._semaphore = asyncio.Semaphore(self.config.max_concurrency)
+        # Una sola riconnessione anche se più query trovano la connessione caduta
+        self._connect_lock = asyncio.Lock()
+        self.parsers = default_parsers()
+
+    async def connect(self) -> bool:
+        """Stabilisce la connessione"""
+        if self.driver:
+            await self.driver.close()
+        try:
+            self.driver = AsyncGraphDatabase.driver(
+                self.config.uri,
+                auth=(self.config.username, self.config.password),
+                max_connection_pool_size=self.config.max_connection_pool_size,
+                connection_acquisition_timeout=self.config.connection_acquisition_timeout
+            )
+
+            # Test connessione
+            async with self.driver.session(database=self.config.database) as session:
+                result = await session.run("RETURN 1")
+                await result.single()
+
+            self._alive = True
+            print(f"✅ Connesso a Neo4j (async): {self.config.uri}")
+            return True
+
+        except Exception as e:
+            print(f"❌ Errore connessione: {e}")
+            if self.driver:
+                await self.driver.close()
+            self.driver = None
+            self._alive = False
+            return False
+
+    async def disconnect(self):
+        """Chiude la connessione"""
+        self._alive = False
+        if self.driver:
+            await self.driver.close()
+            self.driver = None
+            print("🔌 Connessione chiusa")
+
+    def is_connected(self) -> bool:
+        """Verifica se è connesso (stato dell'ultima operazione, senza round trip)"""
+        return self.driver is not None and self._alive
+
+    async def _ensure_connected(self) -> bool:
+        if self.is_connected():
+            return True
+        async with self._connect_lock:
+            return self.is_connected() or await self.connect()
+
+    def _connection_error(self, error: Exception) -> None:
+        """Un errore di connessione fa riconnettere alla query successiva"""
+        if isinstance(error, (ServiceUnavailable, SessionExpired)):
+            self._alive = False
+
+    async def run_cypher(self,
+                         query: str,
+                         params: Optional[Dict] = None,
+                         parser: Union[str, ResponseParser] = 'list') -> QueryResult:
+        """
+        Esegue una query Cypher
+
+        Args:
+            query: Query Cypher da eseguire
+            params: Parametri per la query
+            parser: Nome parser o istanza ResponseParser
+
+        Returns:
+            QueryResult con il risultato; execution_time non include
+            l'attesa di un posto libero nel limite di concorrenza
+        """
+        if not await self._ensure_connected():
+            return QueryResult(
+                success=False,
+                error="Non connesso a Neo4j"
+            )
+
+        params = params or {}
+        if isinstance(parser, str):
+            response_parser = self.parsers.get(parser, self.parsers['list'])
+        else:
+            response_parser = parser
+
+        async with self._semaphore:
+            start_time = time.time()
+            try:
+                async with self.driver.session(database=self.config.database) as session:
+                    result = await session.run(query, params)
+                    records = [record async for record in result]
+                    buffered = BufferedResult(list(result.keys()), records)
+                    summary = await result.consume()
+
+                data = response_parser.parse(buffered, query, params)
+
+                return QueryResult(
+                    success=True,
+                    data=data,
+                    execution_time=time.time() - start_time,
+                    query=query,
+                    result_available_after=summary.result_available_after,
+                    result_consumed_after=summary.result_consumed_after
+                )
+
+            except Exception as e:
+                self._connection_error(e)
+                return QueryResult(
+                    success=False,
+                    error=str(e),
+                    execution_time=time.time() - start_time,
+                    query=query
+                )
+
+    async def run_many(self,
+                       calls: Sequence[Tuple[str, Optional[Dict]]],
+                       parser: Union[str, ResponseParser] = 'list') -> List[QueryResult]:
+        """
+        Esegue più query in parallelo (entro il limite di concorrenza)
+
+        Args:
+            calls: Coppie (query, parametri)
+            parser: Parser usato per tutte le query
+
+        Returns:
+            QueryResult nello stesso ordine di calls
+        """
+        return list(await asyncio.gather(*(
+            self.run_cypher(query, params, parser) for query, params in calls
+        )))
+
+    def register_parser(self, name: str, parser: ResponseParser):
+        """Registra un nuovo parser"""
+        self.parsers[name] = parser
+
+    async def __aenter__(self):
+        """Context manager enter"""
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit"""
+        await self.disconnect()
@@ -24,6 +24,24 @@ class QueryResult:
     error: Optional[str] = None
     execution_time: float = 0.0
     query: Optional[str] = None
+    # Tempi del server dal ResultSummary (ms): primo record pronto, risultato consumato
+    result_available_after: Optional[int] = None
+    result_consumed_after: Optional[int] = None
+    # Albero del piano con le statistiche per operatore (solo con profile=True)
+    profile: Optional[Dict] = None
+
+
+@dataclass
+class WriteMetrics:
+    """Metriche di una scrittura a batch (Neo4jManager.write_batches)"""
+    rows: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
 
 
 @dataclass
@@ -32,4 +50,11 @@ class Neo4jConfig:
     uri: str = "bolt://localhost:7687"
     username: str = "neo4j"
     password: str = "password"
-    database: str = "neo4j"
\ No newline at end of file
+    database: str = "neo4j"
+    # Pool di connessioni del driver
+    max_connection_pool_size: int = 100
+    connection_acquisition_timeout: float = 60.0
+    # Riusa la stessa sessione per tutte le query (non thread-safe)
+    reuse_session: bool = False
+    # Query in esecuzione contemporaneamente con AsyncNeo4jManager
+    max_concurrency: int = 8
\ No newline at end of file
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""Benchmark della generazione del dataset e del client Neo4j"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from base import Neo4jConfig
+from manager import Neo4jManager
+from query_engine import AsyncQueryEngine, QueryEngine
+from neo4j import Record
+from parsers import DataFrameParser, ColumnarParser, CountParser, SinkParser
+from original import (
+    generate_dataset,
+    generate_customer_profiles_table,
+    generate_terminal_profiles_table,
+    get_list_terminals_within_radius,
+    get_lists_terminals_within_radius
+)
+
+
+def bench_generation(n_customers: int, n_terminals: int, nb_days: int,
+                     repeat: int = 1) -> pd.DataFrame:
+    """
+    Confronta il generatore originale (loop per customer/giorno) con
+    quello vettoriale a blocchi
+
+    Args:
+        n_customers: Numero di clienti
+        n_terminals: Numero di terminali
+        nb_days: Numero di giorni
+        repeat: Ripetizioni per engine (si tiene il tempo migliore)
+
+    Returns:
+        DataFrame con tempo e transazioni generate per engine
+    """
+    rows = []
+    for engine in ('loop', 'batch'):
+        best = None
+        n_tx = 0
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            # I tempi parziali stampati da generate_dataset non servono qui
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, _, transactions = generate_dataset(
+                    n_customers=n_customers,
+                    n_terminals=n_terminals,
+                    nb_days=nb_days,
+                    engine=engine
+                )
+            elapsed = time.perf_counter() - start_time
+            best = elapsed if best is None else min(best, elapsed)
+            n_tx = len(transactions)
+
+        rows.append({
+            'engine': engine,
+            'seconds': best,
+            'transactions': n_tx,
+            'tx_per_second': n_tx / best if best else 0.0
+        })
+
+    result = pd.DataFrame(rows)
+    result['speedup'] = result['seconds'].iloc[0] / result['seconds']
+    return result
+
+
+def bench_radius(n_customers: int, n_terminals: int, r: float = 5,
+                 sample: int = 200) -> pd.DataFrame:
+    """
+    Confronta l'assegnazione terminali per customer (apply riga per riga)
+    con l'indice a griglia
+
+    Args:
+        n_customers: Numero di clienti
+        n_terminals: Numero di terminali
+        r: Raggio
+        sample: Customer su cui misurare l'apply (il tempo viene proiettato
+            su n_customers)
+
+    Returns:
+        DataFrame con tempo per metodo
+    """
+    customers = generate_customer_profiles_table(n_customers, random_state=0)
+    terminals = generate_terminal_profiles_table(n_terminals, random_state=1)
+    x_y_terminals = terminals[['x_terminal_id', 'y_terminal_id']].values.astype(float)
+    x_y_customers = customers[['x_customer_id', 'y_customer_id']].values.astype(float)
+
+    sample = min(sample, n_customers)
+    start_time = time.perf_counter()
+    expected = customers.iloc[:sample].apply(
+        lambda x: get_list_terminals_within_radius(x, x_y_terminals=x_y_terminals, r=r), axis=1
+    )
+    apply_seconds = (time.perf_counter() - start_time) * n_customers / max(sample, 1)
+
+    start_time = time.perf_counter()
+    available_terminals = get_lists_terminals_within_radius(x_y_customers, x_y_terminals, r)
+    grid_seconds = time.perf_counter() - start_time
+
+    identical = all(
+        list(map(int, a)) == b.tolist()
+        for a, b in zip(expected, available_terminals[:sample])
+    )
+
+    return pd.DataFrame([
+        {'method': 'apply (stimato)', 'seconds': apply_seconds, 'identical': True},
+        {'method': 'grid', 'seconds': grid_seconds, 'identical': identical},
+    ])
+
+
+# Modalità confrontate da bench_memory: flag aggiuntivi di generate
+MEMORY_MODES = {
+    'normale': [],
+    'compact': ['--compact'],
+    'stream': ['--stream'],
+    'stream+compact': ['--stream', '--compact'],
+}
+
+
+def bench_memory(n_customers: int, n_terminals: int, nb_days: int) -> pd.DataFrame:
+    """
+    Picco di memoria (RSS) di generate + frodi + CSV per ogni modalità
+
+    Ogni modalità gira in un processo separato, così il picco misurato non
+    risente delle esecuzioni precedenti.
+
+    Args:
+        n_customers: Numero di clienti
+        n_terminals: Numero di terminali
+        nb_days: Numero di giorni
+
+    Returns:
+        DataFrame con picco RSS, tempo e dimensione dei CSV per modalità
+    """
+    rows = []
+    for mode, flags in MEMORY_MODES.items():
+        with tempfile.TemporaryDirectory() as folder:
+            start_time = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), 'memory-run',
+                 '--customers', str(n_customers), '--terminals', str(n_terminals),
+                 '--days', str(nb_days), '--output', folder] + flags,
+                check=True, capture_output=True, text=True
+            ).stdout
+            elapsed = time.perf_counter() - start_time
+            csv_bytes = sum(
+                os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)
+            )
+        rows.append({
+            'mode': mode,
+            'peak_rss_mb': int(output.split()[-1]) / 1024,
+            'seconds': elapsed,
+            'csv_mb': csv_bytes / 1024 ** 2
+        })
+
+    result = pd.DataFrame(rows)
+    result['rss_vs_normale'] = result['peak_rss_mb'] / result['peak_rss_mb'].iloc[0]
+    return result
+
+
+def memory_run(args: argparse.Namespace) -> None:
+    """Esegue una generazione e stampa il picco RSS del processo (KB)"""
+    from cli import Cli
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        Cli().generate(args.customers, args.terminals, args.days, args.output,
+                       stream=args.stream, compact=args.compact)
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+# Modalità confrontate da bench_manager: (sessione riusata, probe prima di ogni query)
+MANAGER_MODES = {
+    'probe per query': (False, True),
+    'senza probe': (False, False),
+    'sessione riusata': (True, False),
+}
+
+
+def bench_manager(config: Neo4jConfig, calls: int = 1000, query: str = "RETURN 1",
+                  params: Optional[Dict] = None) -> pd.DataFrame:
+    """
+    Overhead per chiamata di Neo4jManager.run_cypher su una query breve
+
+    'probe per query' riproduce il comportamento precedente (RETURN 1 su una
+    sessione dedicata prima di ogni query), le altre modalità si affidano agli
+    errori del driver, con o senza riuso della sessione.
+
+    Args:
+        config: Connessione (reuse_session viene impostato per modalità)
+        calls: Chiamate per modalità, dopo 10 di riscaldamento
+        query: Query da ripetere
+        params: Parametri della query
+
+    Returns:
+        DataFrame con media e percentili per chiamata (ms)
+    """
+    rows = []
+    for mode, (reuse_session, probe) in MANAGER_MODES.items():
+        mode_config = Neo4jConfig(**{**vars(config), 'reuse_session': reuse_session})
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = Neo4jManager(mode_config)
+            if not manager.connect():
+                raise RuntimeError(f"Connessione a {config.uri} fallita")
+
+        timings = []
+        try:
+            for i in range(calls + 10):
+                start_time = time.perf_counter()
+                if probe:
+                    manager.ping()
+                result = manager.run_cypher(query, params, parser='list')
+                if not result.success:
+                    raise RuntimeError(result.error)
+                if i >= 10:
+                    timings.append(time.perf_counter() - start_time)
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                manager.disconnect()
+
+        ms = np.array(timings) * 1000
+        rows.append({
+            'mode': mode,
+            'mean_ms': ms.mean(),
+            'p50_ms': np.percentile(ms, 50),
+            'p95_ms': np.percentile(ms, 95),
+            'calls_per_second': len(ms) / (ms.sum() / 1000)
+        })
+
+    result = pd.DataFrame(rows)
+    result['speedup'] = result['mean_ms'].iloc[0] / result['mean_ms']
+    return result
+
+
+class RecordStream:
+    """Risultato simulato: espone keys() e itera i record, come neo4j.Result"""
+
+    def __init__(self, keys: List[str], records: List[Record]):
+        self._keys = keys
+        self.records = records
+
+    def keys(self) -> List[str]:
+        return self._keys
+
+    def __iter__(self):
+        return iter(self.records)
+
+
+def bench_parsers(rows: int = 366000) -> pd.DataFrame:
+    """
+    Tempo e picco di memoria Python (tracemalloc) dei parser su un risultato
+    simulato di rows righe, senza database
+
+    I record sono creati prima della misura, quindi il picco riguarda solo
+    ciò che il parser tiene in memoria. Tempo e memoria sono misurati in due
+    passate separate (tracemalloc rallenta l'esecuzione).
+
+    Args:
+        rows: Righe del risultato (default: dimensione di q1b sul dataset 200MB)
+
+    Returns:
+        DataFrame con secondi e picco MB per parser
+    """
+    keys = ['terminalId', 'quarter', 'amount', 'isOutlier']
+    # Righe nella forma di q1b: terminale, quarter, importo, flag
+    records = [
+        Record(zip(keys, (str(i % 5000), f"2018-Q{i % 4 + 1}", i * 0.5, i % 7 == 0)))
+        for i in range(rows)
+    ]
+
+    class ListCountParser:
+        """CountParser precedente"""
+        def parse(self, result, query, params):
+            return len(list(result))
+
+    result_rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        parsers = {
+            'dataframe': DataFrameParser(),
+            'columnar': ColumnarParser(),
+            'count (list)': ListCountParser(),
+            'count': CountParser(),
+            'sink csv': SinkParser(os.path.join(folder, 'result.csv')),
+        }
+        for name, parser in parsers.items():
+            start_time = time.perf_counter()
+            parser.parse(RecordStream(keys, records), '', {})
+            elapsed = time.perf_counter() - start_time
+
+            tracemalloc.start()
+            parser.parse(RecordStream(keys, records), '', {})
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result_rows.append({'parser': name, 'seconds': elapsed, 'peak_mb': peak / 1024 ** 2})
+
+    return pd.DataFrame(result_rows)
+
+
+def bench_async(config: Neo4jConfig, customer_ids: List[str],
+                queries_dir: str = 'queries') -> pd.DataFrame:
+    """
+    get_dataset_info e q1c per più customer: QueryEngine in sequenza contro
+    AsyncQueryEngine in parallelo (config.max_concurrency)
+
+    Args:
+        config: Connessione
+        customer_ids: Customer di partenza delle q1c
+        queries_dir: Cartella delle query
+
+    Returns:
+        DataFrame con secondi per fase e modalità e speedup dell'async
+    """
+    params_list = [{'customerId': customer_id} for customer_id in customer_ids]
+
+    def run_sync() -> Dict[str, float]:
+        timings = {}
+        with contextlib.redirect_stdout(io.StringIO()), QueryEngine(config) as engine:
+            engine.load_queries_from_dir(queries_dir)
+            start_time = time.perf_counter()
+            engine.get_dataset_info()
+            timings['dataset_info'] = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            for params in params_list:
+                engine.execute_query('q1c', params, parser='count')
+            timings['q1c'] = time.perf_counter() - start_time
+        return timings
+
+    async def run_async() -> Dict[str, float]:
+        timings = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            async with AsyncQueryEngine(config) as engine:
+                engine.load_queries_from_dir(queries_dir)
+                start_time = time.perf_counter()
+                await engine.get_dataset_info()
+                timings['dataset_info'] = time.perf_counter() - start_time
+                start_time = time.perf_counter()
+                await engine.execute_many('q1c', params_list, parser='count')
+                timings['q1c'] = time.perf_counter() - start_time
+        return timings
+
+    sync_timings = run_sync()
+    async_timings = asyncio.run(run_async())
+    return pd.DataFrame([
+        {
+            'phase': phase,
+            'sync_seconds': sync_timings[phase],
+            'async_seconds': async_timings[phase],
+            'speedup': sync_timings[phase] / async_timings[phase]
+        }
+        for phase in ('dataset_info', 'q1c')
+    ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark generazione dataset e client Neo4j')
+    subparsers = parser.add_subparsers(dest='command')
+
+    gen_parser = subparsers.add_parser('generation')
+    gen_parser.add_argument('--customers', type=int, default=1000)
+    gen_parser.add_argument('--terminals', type=int, default=100)
+    gen_parser.add_argument('--days', type=int, default=1000)
+    gen_parser.add_argument('--repeat', type=int, default=1)
+
+    radius_parser = subparsers.add_parser('radius')
+    radius_parser.add_argument('--customers', type=int, default=10000)
+    radius_parser.add_argument('--terminals', type=int, default=1000000)
+    radius_parser.add_argument('--radius', type=float, default=5)
+
+    memory_parser = subparsers.add_parser('memory')
+    memory_parser.add_argument('--customers', type=int, default=1000)
+    memory_parser.add_argument('--terminals', type=int, default=200)
+    memory_parser.add_argument('--days', type=int, default=1100)
+
+    manager_parser = subparsers.add_parser('manager')
+    manager_parser.add_argument('--uri', type=str, default='bolt://localhost:7687')
+    manager_parser.add_argument('--user', type=str, default='neo4j')
+    manager_parser.add_argument('--password', type=str, default='StrongPassword123')
+    manager_parser.add_argument('--calls', type=int, default=1000)
+    manager_parser.add_argument('--query', type=str, default='RETURN 1')
+
+    async_parser = subparsers.add_parser('async')
+    async_parser.add_argument('--uri', type=str, default='bolt://localhost:7687')
+    async_parser.add_argument('--user', type=str, default='neo4j')
+    async_parser.add_argument('--password', type=str, default='StrongPassword123')
+    async_parser.add_argument('--customers', type=int, default=50,
+                              help='q1c per i customer 0..N-1')
+    async_parser.add_argument('--concurrency', type=int, default=8)
+
+    parsers_parser = subparsers.add_parser('parsers')
+    parsers_parser.add_argument('--rows', type=int, default=366000)
+
+    # Processo figlio di bench_memory
+    run_parser = subparsers.add_parser('memory-run')
+    run_parser.add_argument('--customers', type=int, required=True)
+    run_parser.add_argument('--terminals', type=int, required=True)
+    run_parser.add_argument('--days', type=int, required=True)
+    run_parser.add_argument('--output', type=str, required=True)
+    run_parser.add_argument('--stream', action='store_true')
+    run_parser.add_argument('--compact', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.command == 'generation':
+        print(f"Benchmark generazione: {args.customers} clienti, "
+              f"{args.terminals} terminali, {args.days} giorni")
+        print(bench_generation(args.customers, args.terminals, args.days, args.repeat)
+              .to_string(index=False))
+    elif args.command == 'radius':
+        print(f"Benchmark assegnazione terminali: {args.customers} clienti, "
+              f"{args.terminals} terminali, r={args.radius}")
+        print(bench_radius(args.customers, args.terminals, args.radius).to_string(index=False))
+    elif args.command == 'memory':
+        print(f"Benchmark memoria: {args.customers} clienti, "
+              f"{args.terminals} terminali, {args.days} giorni")
+        print(bench_memory(args.customers, args.terminals, args.days).to_string(index=False))
+    elif args.command == 'memory-run':
+        memory_run(args)
+    elif args.command == 'manager':
+        config = Neo4jConfig(uri=args.uri, username=args.user, password=args.password)
+        print(f"Benchmark Neo4jManager: {args.calls} chiamate di '{args.query}' su {args.uri}")
+        print(bench_manager(config, args.calls, args.query).to_string(index=False))
+    elif args.command == 'async':
+        config = Neo4jConfig(uri=args.uri, username=args.user, password=args.password,
+                             max_concurrency=args.concurrency)
+        print(f"Benchmark async: {args.customers} q1c, concorrenza {args.concurrency} su {args.uri}")
+        customer_ids = [str(i) for i in range(args.customers)]
+        print(bench_async(config, customer_ids).to_string(index=False))
+    elif args.command == 'parsers':
+        print(f"Benchmark parser: {args.rows} righe simulate")
+        print(bench_parsers(args.rows).to_string(index=False))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Cache su disco, indirizzata per contenuto, degli step di generate/convert"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+
+MANIFEST = 'manifest.json'
+
+# Dimensione massima di default della cache (LRU)
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+
+def code_version(*objects: Any) -> str:
+    """Hash del sorgente di funzioni/classi: cambia quando cambia il codice dello step"""
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()[:16]
+
+
+class StageCache:
+    """
+    Cache degli artefatti degli step della pipeline (profili, terminali nel
+    raggio, transazioni, frodi, CSV).
+
+    La chiave di uno step è l'hash di nome, parametri, versione del codice e
+    chiavi degli step da cui dipende: si calcola senza eseguire nulla, quindi
+    una rerun con gli stessi parametri salta direttamente all'ultimo step in
+    cache. Il manifest tiene dimensione e ultimo uso di ogni artefatto e
+    oltre max_bytes vengono eliminati i meno usati di recente.
+    """
+
+    def __init__(self, root: str = '.cache', max_bytes: int = DEFAULT_MAX_BYTES,
+                 verbose: bool = True):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self.manifest = self._read_manifest()
+        # Un limite più basso della run precedente si applica subito
+        if self.size() > max_bytes:
+            self._evict()
+            self._write_manifest()
+
+    def key(self, stage: str, params: Dict[str, Any], code: str = '',
+            inputs: Iterable[str] = ()) -> str:
+        """
+        Chiave di uno step
+
+        Args:
+            stage: Nome dello step
+            params: Parametri che influenzano l'output (serializzabili in JSON)
+            code: Versione del codice (code_version)
+            inputs: Chiavi degli step a monte
+        """
+        payload = json.dumps(
+            {'stage': stage, 'params': params, 'code': code, 'inputs': list(inputs)},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+    def has(self, key: str) -> bool:
+        return key in self.manifest and os.path.isdir(self._path(key))
+
+    def frame(self, key: str, stage: str, compute: Callable[[], Any]) -> Any:
+        """
+        Oggetto (DataFrame o tuple di DataFrame) dello step: dalla cache se
+        presente, altrimenti calcolato e salvato in pickle
+        """
+        if self.has(key):
+            return self.load(key, stage)
+
+        self.misses += 1
+        value = compute()
+        self.save(key, stage, value)
+        return value
+
+    def load(self, key: str, stage: str) -> Any:
+        """Oggetto in cache (la chiave deve esistere, vedi has)"""
+        self._hit(key, stage)
+        return pd.read_pickle(os.path.join(self._path(key), 'data.pkl'))
+
+    def save(self, key: str, stage: str, value: Any) -> None:
+        """Salva un oggetto (pickle) sotto la chiave"""
+        folder = self._new_entry(key)
+        pd.to_pickle(value, os.path.join(folder, 'data.pkl'))
+        self._store(key, stage)
+
+    def files(self, key: str, stage: str, output_folder: str, filenames: Iterable[str],
+              compute: Callable[[str], Any]) -> bool:
+        """
+        File di output dello step: copiati dalla cache in output_folder se
+        presenti, altrimenti prodotti da compute(output_folder) e salvati.
+        filenames elenca tutti i file che lo step può produrre
+
+        Returns:
+            True se i file arrivano dalla cache
+        """
+        filenames = list(filenames)
+        os.makedirs(output_folder, exist_ok=True)
+        if self.has(key):
+            self._hit(key, stage)
+            cached = set(os.listdir(self._path(key)))
+            for name in filenames:
+                path = os.path.join(output_folder, name)
+                if name in cached:
+                    shutil.copyfile(os.path.join(self._path(key), name), path)
+                elif os.path.exists(path):
+                    # File di una run precedente che questo step non produce
+                    os.remove(path)
+            return True
+
+        self.misses += 1
+        compute(output_folder)
+        folder = self._new_entry(key)
+        for name in filenames:
+            path = os.path.join(output_folder, name)
+            if os.path.exists(path):
+                shutil.copyfile(path, os.path.join(folder, name))
+        self._store(key, stage)
+        return False
+
+    def size(self) -> int:
+        return sum(entry['bytes'] for entry in self.manifest.values())
+
+    def summary(self) -> str:
+        return (f"Cache {self.root}: {self.hits} hit, {self.misses} miss, "
+                f"{len(self.manifest)} artefatti, {self.size() / 1024 ** 2:.1f}MB")
+
+    # =====================================================
+    # MANIFEST E LRU
+    # =====================================================
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _new_entry(self, key: str) -> str:
+        folder = self._path(key)
+        if os.path.isdir(folder):
+            shutil.rmtree(folder)
+        os.makedirs(folder)
+        return folder
+
+    def _hit(self, key: str, stage: str) -> None:
+        self.hits += 1
+        self.manifest[key]['last_used'] = time.time()
+        self._write_manifest()
+        if self.verbose:
+            print(f"   [cache] {stage}: hit")
+
+    def _store(self, key: str, stage: str) -> None:
+        folder = self._path(key)
+        self.manifest[key] = {
+            'stage': stage,
+            'bytes': sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)),
+            'created': time.time(),
+            'last_used': time.time()
+        }
+        self._evict(keep=key)
+        self._write_manifest()
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Elimina gli artefatti usati meno di recente finché la cache supera max_bytes"""
+        by_age: List[str] = sorted(self.manifest, key=lambda k: self.manifest[k]['last_used'])
+        total = self.size()
+        for key in by_age:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self.manifest[key]['bytes']
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            del self.manifest[key]
+
+    def _read_manifest(self) -> Dict[str, Dict[str, Any]]:
+        path = os.path.join(self.root, MANIFEST)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            manifest: Optional[Dict[str, Dict[str, Any]]] = json.load(f)
+        # Artefatti rimossi a mano non vengono considerati
+        return {key: entry for key, entry in (manifest or {}).items() if os.path.isdir(self._path(key))}
+
+    def _write_manifest(self) -> None:
+        path = os.path.join(self.root, MANIFEST)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(path + '.tmp', path)
@@ -1,16 +1,37 @@
 import argparse
-from typing import Tuple
-from original import generate_dataset, add_frauds
-from converters import Converters
-from query_engine import QueryExecutor
+import time
+from typing import Optional, Tuple
+import converters
+import original
+import sizing
+from original import (
+    generate_dataset, add_frauds, generate_profiles,
+    generate_transactions_chunks, add_frauds_stream, DAYS_PER_BLOCK,
+    generate_customer_profiles_table, generate_terminal_profiles_table,
+    assign_terminals, generate_transactions
+)
+from converters import Converters, ID_TYPES
+from cache import StageCache, code_version
+from columnar import ColumnarWriter, load_dataset, read_schema, save_dataset
+from delta import DEFAULT_BATCH_SIZE, STATE_FILE, DeltaIngestor, generate_delta, read_state, write_state
+from manager import Neo4jManager
+from sizing import CSV_FILES, SizeModel, SHAPE_POLICIES, parse_size, dataset_size
+from cn3_batch import DEFAULT_WORKERS
+from query_engine import QueryEngine, QueryExecutor
+from query_benchmark import (DEFAULT_QUERIES, DEFAULT_THRESHOLD, QueryBenchmark,
+                             compare_benchmark, parse_sweep, save_benchmark)
+from plan_check import DEFAULT_BASELINE, DEFAULT_ROW_FACTOR, check_plans
+from result_cache import ResultCache
 from base import Neo4jConfig
 
+# Limite di clienti/terminali del dataset pilota usato per la stima delle dimensioni
+PILOT_MAX_ENTITIES = 2000
+
 
 class Cli:
     """Classe per gestire i comandi CLI e chiamare i servizi"""
     
     def __init__(self):
-        self.converter = Converters()
         self.query_executor = None
     
     def parse_args(self) -> argparse.Namespace:
@@ -25,16 +46,119 @@ class Cli:
         gen_parser.add_argument('--terminals', type=int, default=200)
         gen_parser.add_argument('--days', type=int, default=90)
         gen_parser.add_argument('--output', type=str, default='init-data')
-        gen_parser.add_argument('--size', type=str, choices=['50MB', '100MB', '200MB'])
+        gen_parser.add_argument('--size', type=str, help='Dimensione target dei CSV, es. 200MB o 2GB')
+        gen_parser.add_argument('--shape', type=str, choices=SHAPE_POLICIES, default='days')
+        gen_parser.add_argument('--workers', type=int, default=1)
+        gen_parser.add_argument('--stream', action='store_true')
+        gen_parser.add_argument('--chunk-days', type=int, default=DAYS_PER_BLOCK)
+        gen_parser.add_argument('--compact', action='store_true',
+                                help='Tipi ridotti (int32/float32/categorie) per meno memoria')
+        gen_parser.add_argument('--compress', action='store_true',
+                                help='Scrive i CSV come .csv.gz')
+        gen_parser.add_argument('--write-workers', type=int, default=1,
+                                help='Processi per la scrittura parallela dei CSV')
+        gen_parser.add_argument('--id-type', type=str, choices=ID_TYPES, default='string',
+                                help='integer: ID tutti interi (neo4j-admin --id-type=integer)')
+        gen_parser.add_argument('--outliers', action='store_true',
+                                help='Precalcola rapporto e flag outlier di q1b sulle transazioni')
+        gen_parser.add_argument('--cache', type=str,
+                                help='Cartella della cache degli step (riusa gli step invariati)')
+        gen_parser.add_argument('--cache-max-size', type=str, default='5GB')
+        gen_parser.add_argument('--raw', type=str,
+                                help='Cartella in cui salvare il dataset grezzo in formato colonnare')
+        
+        # Comando: convert (CSV da un dataset salvato con generate --raw)
+        convert_parser = subparsers.add_parser('convert')
+        convert_parser.add_argument('--raw', type=str, required=True)
+        convert_parser.add_argument('--output', type=str, default='init-data')
+        convert_parser.add_argument('--compact', action='store_true')
+        convert_parser.add_argument('--compress', action='store_true')
+        convert_parser.add_argument('--write-workers', type=int, default=1)
+        convert_parser.add_argument('--id-type', type=str, choices=ID_TYPES, default='string')
+        convert_parser.add_argument('--outliers', action='store_true')
+        convert_parser.add_argument('--no-frauds', action='store_true',
+                                    help='Esporta senza iniettare le frodi')
+        convert_parser.add_argument('--no-mmap', action='store_true',
+                                    help='Legge le colonne in memoria invece di mapparle')
+        
+        # Comando: delta (solo i giorni aggiunti a un dataset esistente)
+        delta_parser = subparsers.add_parser('delta')
+        delta_parser.add_argument('--base', type=str, default='init-data',
+                                  help=f'Cartella con {STATE_FILE} (generate o delta precedente)')
+        delta_parser.add_argument('--days', type=int, required=True,
+                                  help='Giorni totali dopo il delta')
+        delta_parser.add_argument('--output', type=str, default='delta-data')
+        delta_parser.add_argument('--compact', action='store_true')
+        delta_parser.add_argument('--compress', action='store_true')
+        delta_parser.add_argument('--ingest', action='store_true',
+                                  help='Applica subito il delta al database in esecuzione')
+        delta_parser.add_argument('--uri', type=str, default='bolt://localhost:7687')
+        delta_parser.add_argument('--user', type=str, default='neo4j')
+        delta_parser.add_argument('--password', type=str, default='StrongPassword123')
+        delta_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        
+        # Comando: ingest (applica un delta già esportato)
+        ingest_parser = subparsers.add_parser('ingest')
+        ingest_parser.add_argument('--input', type=str, default='delta-data')
+        ingest_parser.add_argument('--uri', type=str, default='bolt://localhost:7687')
+        ingest_parser.add_argument('--user', type=str, default='neo4j')
+        ingest_parser.add_argument('--password', type=str, default='StrongPassword123')
+        ingest_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
         
         # Comando: query
         query_parser = subparsers.add_parser('query')
+        query_parser.add_argument('action', nargs='?', choices=['plan-check', 'cn3'],
+                                  help='plan-check: EXPLAIN delle query confrontato con la baseline; '
+                                       'cn3: query 3.c per molti customer (--customers)')
         query_parser.add_argument('--name', type=str)
         query_parser.add_argument('--all', action='store_true')
         query_parser.add_argument('--uri', type=str, default='bolt://localhost:7687')
         query_parser.add_argument('--user', type=str, default='neo4j')
         query_parser.add_argument('--password', type=str, default='StrongPassword123')
         query_parser.add_argument('--output', type=str, default='results')
+        query_parser.add_argument('--precomputed-outliers', action='store_true',
+                                  help='Query 3.b da outlier precalcolati (generate --outliers)')
+        query_parser.add_argument('--pool-size', type=int, default=100,
+                                  help='Connessioni massime del pool del driver')
+        query_parser.add_argument('--acquisition-timeout', type=float, default=60.0,
+                                  help='Secondi di attesa di una connessione libera del pool')
+        query_parser.add_argument('--reuse-session', action='store_true',
+                                  help='Una sola sessione per tutte le query')
+        query_parser.add_argument('--result-cache', type=str,
+                                  help='Cartella della cache dei risultati (riusa i risultati '
+                                       'finché il database non cambia)')
+        query_parser.add_argument('--result-cache-entries', type=int, default=32,
+                                  help='Risultati tenuti anche in memoria')
+        query_parser.add_argument('--profile', action='store_true',
+                                  help='Esegue le query con PROFILE e salva piani e db hits')
+        query_parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE,
+                                  help='Baseline dei piani per plan-check')
+        query_parser.add_argument('--update-baseline', action='store_true',
+                                  help='plan-check: riscrive la baseline con i piani attuali')
+        query_parser.add_argument('--row-factor', type=float, default=DEFAULT_ROW_FACTOR,
+                                  help='plan-check: crescita massima delle righe stimate')
+        query_parser.add_argument('--customers', type=str, default='all',
+                                  help="cn3: 'all' o file con un customerId per riga")
+        query_parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                                  help='cn3: lookup q1c in parallelo')
+        
+        # Comando: benchmark (query ripetute con statistiche)
+        bench_parser = subparsers.add_parser('benchmark')
+        bench_parser.add_argument('--queries', type=str, default=','.join(DEFAULT_QUERIES))
+        bench_parser.add_argument('--warmup', type=int, default=3)
+        bench_parser.add_argument('--iterations', type=int, default=20)
+        bench_parser.add_argument('--sweep', type=str, action='append', default=[],
+                                  help='QUERY.PARAM=VALORI: 1,2,3 | 0..99 | @file (ripetibile)')
+        bench_parser.add_argument('--parser', type=str, default='count',
+                                  help='Parser dei risultati (count misura senza DataFrame)')
+        bench_parser.add_argument('--output', type=str, default='results/benchmark')
+        bench_parser.add_argument('--baseline', type=str,
+                                  help='benchmark.json di una run precedente da confrontare')
+        bench_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                  help='Peggioramento del p50 considerato regressione (0.1 = +10%%)')
+        bench_parser.add_argument('--uri', type=str, default='bolt://localhost:7687')
+        bench_parser.add_argument('--user', type=str, default='neo4j')
+        bench_parser.add_argument('--password', type=str, default='StrongPassword123')
         
         # Comando: extend
         extend_parser = subparsers.add_parser('extend')
@@ -42,28 +166,63 @@ class Cli:
         extend_parser.add_argument('--user', type=str, default='neo4j')
         extend_parser.add_argument('--password', type=str, default='StrongPassword123')
         extend_parser.add_argument('--output', type=str, default='results')
+        extend_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        extend_parser.add_argument('--parallelism', type=int, default=4,
+                                   help='Batch di scrittura in parallelo')
+        extend_parser.add_argument('--server-side', action='store_true',
+                                   help='Estensione con extend_transactions.cypher (rand() nel server)')
         
         return parser.parse_args()
     
-    def estimate_parameters(self, target_size_mb: str) -> Tuple[int, int, int]:
+    def estimate_parameters(self, target_size: str, shape: str = 'days',
+                            n_customers: int = 1000, n_terminals: int = 200,
+                            nb_days: int = 90,
+                            cache: Optional[StageCache] = None,
+                            id_type: str = 'string') -> Tuple[int, int, int]:
         """
         Stima i parametri per raggiungere la dimensione target
         
         Args:
-            target_size_mb: Dimensione target ('50MB', '100MB', '200MB', '500MB')
+            target_size: Dimensione target (es. '50MB', '200MB', '2GB')
+            shape: Come crescere rispetto alla forma di partenza ('days',
+                'customers', 'balanced')
+            n_customers, n_terminals, nb_days: Forma di partenza
+            cache: Cache in cui riusare il modello già calibrato
+            id_type: Tipo degli ID dei CSV (cambia i byte per riga)
             
         Returns:
             Tuple (n_customers, n_terminals, nb_days)
         """
-        size_map = {
-            '50MB': (1000, 100, 120),
-            '100MB': (1000, 100, 365),
-            '200MB': (1000, 100, 1000),
-        }
-        return size_map.get(target_size_mb, (1000, 200, 90))
+        target_bytes = parse_size(target_size)
+        
+        print(f"Calibrazione modello dimensione (dataset pilota)...")
+        model = SizeModel(
+            pilot_customers=min(n_customers, PILOT_MAX_ENTITIES),
+            pilot_terminals=min(n_terminals, PILOT_MAX_ENTITIES),
+            id_type=id_type
+        )
+        if cache is None:
+            model.calibrate()
+        else:
+            # Il pilota dipende da tutto il generatore e dal converter
+            model = cache.frame(
+                cache.key('size_model', vars(model), code_version(original, converters, sizing)),
+                'modello dimensione', model.calibrate
+            )
+        params = model.solve(target_bytes, shape, n_customers, n_terminals, nb_days)
+        
+        predicted = model.predict_total(*params)
+        print(f"   Target: {target_size} ({target_bytes} byte), forma: {shape}")
+        print(f"   Stima: {predicted / 1024 ** 2:.1f}MB con clienti={params[0]}, "
+              f"terminali={params[1]}, giorni={params[2]}")
+        return params
     
     def generate(self, n_customers: int, n_terminals: int, nb_days: int, 
-                 output_folder: str) -> None:
+                 output_folder: str, workers: int = 1, stream: bool = False,
+                 chunk_days: int = DAYS_PER_BLOCK, compact: bool = False,
+                 compress: bool = False, write_workers: int = 1,
+                 cache: Optional[StageCache] = None, raw_folder: Optional[str] = None,
+                 id_type: str = 'string', outliers: bool = False) -> None:
         """
         Genera il dataset e lo converte in CSV
         
@@ -72,48 +231,386 @@ class Cli:
             n_terminals: Numero di terminali
             nb_days: Numero di giorni
             output_folder: Cartella di output
+            workers: Processi per la generazione delle transazioni
+            stream: Genera, aggiunge frodi e scrive a chunk di giorni (memoria costante)
+            chunk_days: Giorni per chunk in modalità stream
+            compact: ID int32, coordinate float32 e colonne stringa categoriche
+            compress: Scrive .csv.gz invece di .csv
+            write_workers: Processi per la scrittura dei CSV
+            cache: Cache degli step; se presente vengono rieseguiti solo gli
+                step il cui output non è già in cache
+            raw_folder: Cartella in cui salvare customers, terminals e
+                transazioni (senza frodi) in formato colonnare per convert
+            id_type: 'string' o 'integer' (ID interi per neo4j-admin --id-type=integer)
+            outliers: Scrive outlier_ratio e potentialOutlier sulle transazioni
         """
         print(f"Generazione dataset...")
         print(f"   Clienti: {n_customers}")
         print(f"   Terminali: {n_terminals}")
         print(f"   Giorni: {nb_days}")
+        print(f"   Worker: {workers}")
+        
+        converter = Converters(compact=compact, compress=compress, write_workers=write_workers,
+                               id_type=id_type, outliers=outliers)
+        if compact:
+            print(f"   Compact: int32/float32, chiavi categoriche")
+        
+        raw_params = {'n_customers': n_customers, 'n_terminals': n_terminals,
+                      'nb_days': nb_days, 'start_date': "2018-04-01", 'compact': compact}
+        # Stato per delta: il numero di transazioni viene contato durante la conversione
+        state = {'n_customers': n_customers, 'n_terminals': n_terminals,
+                 'nb_days': nb_days, 'start_date': "2018-04-01", 'n_transactions': 0,
+                 'id_type': id_type, 'outliers': outliers}
+        
+        if cache is not None:
+            self.generate_cached(cache, converter, n_customers, n_terminals, nb_days,
+                                 output_folder, workers, stream, chunk_days, compact,
+                                 raw_folder, raw_params, state)
+            print(cache.summary())
+            print(f"\nDataset generato in {output_folder}/")
+            return
+        
+        if stream:
+            print(f"   Streaming: chunk da {chunk_days} giorni")
+            customers, terminals = generate_profiles(
+                n_customers=n_customers,
+                n_terminals=n_terminals,
+                compact=compact
+            )
+            chunks = generate_transactions_chunks(
+                customers,
+                nb_days=nb_days,
+                chunk_days=chunk_days,
+                workers=workers,
+                compact=compact
+            )
+            
+            # Le transazioni grezze vengono salvate chunk per chunk, prima delle frodi
+            writer = None
+            if raw_folder:
+                writer = ColumnarWriter(raw_folder, raw_params)
+                writer.write('customers', customers)
+                writer.write('terminals', terminals)
+                chunks = writer.tee('transactions', chunks)
+            
+            print(f"\nConversione in CSV (streaming)...")
+            converter.to_csv_stream(
+                customers, terminals,
+                self._counted(add_frauds_stream(customers, terminals, chunks, compact=compact), state),
+                output_folder
+            )
+            write_state(output_folder, state)
+            
+            if writer is not None:
+                writer.close()
+                print(f"Dataset grezzo salvato in {raw_folder}/")
+            
+            print(f"\nDataset generato in {output_folder}/")
+            return
         
         # Genera dataset
         customers, terminals, transactions = generate_dataset(
             n_customers=n_customers,
             n_terminals=n_terminals,
-            nb_days=nb_days
+            nb_days=nb_days,
+            workers=workers,
+            compact=compact
         )
         
+        if raw_folder:
+            save_dataset(raw_folder, customers, terminals, transactions, raw_params)
+            print(f"Dataset grezzo salvato in {raw_folder}/")
+        
         # Aggiungi frodi
-        transactions = add_frauds(customers, terminals, transactions)
+        transactions = add_frauds(customers, terminals, transactions, compact=compact)
         
         # Converti in CSV
         print(f"\nConversione in CSV...")
-        self.converter.to_csv(customers, terminals, transactions, output_folder)
+        converter.to_csv(customers, terminals, transactions, output_folder)
+        state['n_transactions'] = len(transactions)
+        write_state(output_folder, state)
         
         print(f"\nDataset generato in {output_folder}/")
     
+    def generate_cached(self, cache: StageCache, converter: Converters, n_customers: int,
+                        n_terminals: int, nb_days: int, output_folder: str, workers: int = 1,
+                        stream: bool = False, chunk_days: int = DAYS_PER_BLOCK,
+                        compact: bool = False, raw_folder: Optional[str] = None,
+                        raw_params: Optional[dict] = None, state: Optional[dict] = None) -> None:
+        """
+        Come generate, ma ogni step (profili customer, profili terminali,
+        terminali nel raggio, transazioni, frodi, CSV) passa dalla cache.
+        
+        Le chiavi dipendono solo da parametri, codice e chiavi a monte, quindi
+        vengono calcolate prima di eseguire qualsiasi step: se i CSV sono in
+        cache non viene caricato nient'altro, altrimenti si risale fino
+        all'ultimo step valido. Worker e modalità stream non cambiano l'output
+        e non fanno parte delle chiavi.
+        """
+        start_date = "2018-04-01"
+        customers_key = cache.key(
+            'customer_profiles', {'n_customers': n_customers, 'random_state': 0},
+            code_version(generate_customer_profiles_table)
+        )
+        terminals_key = cache.key(
+            'terminal_profiles', {'n_terminals': n_terminals, 'random_state': 1},
+            code_version(generate_terminal_profiles_table)
+        )
+        radius_key = cache.key(
+            'radius', {'r': 5, 'compact': compact},
+            code_version(assign_terminals, original.get_lists_terminals_within_radius,
+                         original.compact_dtypes),
+            [customers_key, terminals_key]
+        )
+        transactions_key = cache.key(
+            'transactions', {'nb_days': nb_days, 'start_date': start_date},
+            code_version(generate_transactions, original.generate_transactions_batch,
+                         original.draw_customer_block),
+            [radius_key]
+        )
+        frauds_key = cache.key(
+            'frauds', {},
+            code_version(add_frauds, original.apply_frauds_scenario_2,
+                         original.apply_frauds_scenario_3, original.window_slices,
+                         original.index_transactions_by),
+            [transactions_key]
+        )
+        csv_key = cache.key(
+            'csv', {'compact': compact, 'compress': converter.compress, 'id_type': converter.id_type,
+                    'outliers': converter.outliers},
+            code_version(converters), [frauds_key]
+        )
+        
+        profiles = {}
+        
+        def load_profiles():
+            def compute():
+                customers = cache.frame(
+                    customers_key, 'profili customer',
+                    lambda: generate_customer_profiles_table(n_customers, random_state=0)
+                )
+                terminals = cache.frame(
+                    terminals_key, 'profili terminali',
+                    lambda: generate_terminal_profiles_table(n_terminals, random_state=1)
+                )
+                assign_terminals(customers, terminals, compact=compact)
+                return customers, terminals
+            
+            if not profiles:
+                profiles['value'] = cache.frame(radius_key, 'terminali nel raggio', compute)
+            return profiles['value']
+        
+        def load_transactions():
+            return cache.frame(
+                transactions_key, 'transazioni',
+                lambda: generate_transactions(load_profiles()[0], start_date=start_date,
+                                              nb_days=nb_days, workers=workers, compact=compact)
+            )
+        
+        def load_frauds():
+            def compute():
+                customers, terminals = load_profiles()
+                return add_frauds(customers, terminals, load_transactions(), compact=compact)
+            
+            return cache.frame(frauds_key, 'frodi', compute)
+        
+        raw_writer = {}
+        
+        def stream_chunks():
+            # Le transazioni grezze vengono salvate chunk per chunk, prima delle frodi
+            customers, terminals = load_profiles()
+            chunks = generate_transactions_chunks(
+                customers, start_date=start_date, nb_days=nb_days,
+                chunk_days=chunk_days, workers=workers, compact=compact
+            )
+            if raw_folder:
+                writer = ColumnarWriter(raw_folder, raw_params)
+                writer.write('customers', customers)
+                writer.write('terminals', terminals)
+                raw_writer['value'] = writer
+                chunks = writer.tee('transactions', chunks)
+            return chunks
+        
+        def convert(folder: str) -> None:
+            if stream:
+                # In streaming transazioni e frodi non passano dalla cache
+                customers, terminals = load_profiles()
+                chunks = stream_chunks()
+                print(f"\nConversione in CSV (streaming)...")
+                converter.to_csv_stream(
+                    customers, terminals,
+                    self._counted(add_frauds_stream(customers, terminals, chunks, compact=compact),
+                                  state if state is not None else {'n_transactions': 0}),
+                    folder
+                )
+            else:
+                transactions = load_frauds()
+                customers, terminals = load_profiles()
+                print(f"\nConversione in CSV...")
+                converter.to_csv(customers, terminals, transactions, folder)
+                if state is not None:
+                    state['n_transactions'] = len(transactions)
+            if state is not None:
+                write_state(folder, state)
+        
+        filenames = [name + suffix for name in CSV_FILES for suffix in ('', '.gz')] + [STATE_FILE]
+        cache.files(csv_key, 'CSV', output_folder, filenames, convert)
+        
+        if raw_folder and stream:
+            if 'value' not in raw_writer:
+                # CSV dalla cache: le transazioni vengono rigenerate a chunk solo per il dataset grezzo
+                for _ in stream_chunks():
+                    pass
+            raw_writer['value'].close()
+            print(f"Dataset grezzo salvato in {raw_folder}/")
+        elif raw_folder:
+            # Le transazioni in cache sono quelle senza frodi
+            customers, terminals = load_profiles()
+            save_dataset(raw_folder, customers, terminals, load_transactions(), raw_params)
+            print(f"Dataset grezzo salvato in {raw_folder}/")
+    
+    def convert(self, raw_folder: str, output_folder: str, compact: bool = False,
+                compress: bool = False, write_workers: int = 1, frauds: bool = True,
+                mmap: bool = True, id_type: str = 'string', outliers: bool = False) -> None:
+        """
+        Converte in CSV un dataset salvato con generate --raw, senza rigenerarlo
+        
+        Args:
+            raw_folder: Cartella del dataset colonnare
+            output_folder: Cartella di output dei CSV
+            compact: Riduce i tipi prima della conversione
+            compress: Scrive .csv.gz
+            write_workers: Processi per la scrittura dei CSV
+            frauds: Se False le transazioni vengono esportate senza frodi
+            mmap: Colonne in memory map invece che lette in memoria
+            id_type: 'string' o 'integer'
+            outliers: Scrive outlier_ratio e potentialOutlier sulle transazioni
+        """
+        params = read_schema(raw_folder)['params']
+        print(f"Conversione dataset grezzo da {raw_folder}/")
+        for name, value in params.items():
+            print(f"   {name}: {value}")
+        
+        start_time = time.perf_counter()
+        customers, terminals, transactions = load_dataset(raw_folder, mmap=mmap)
+        print(f"   Caricamento: {len(transactions)} transazioni in "
+              f"{time.perf_counter() - start_time:.2f}s")
+        
+        if compact:
+            for frame in (customers, terminals, transactions):
+                original.compact_dtypes(frame)
+        
+        if frauds:
+            transactions = add_frauds(customers, terminals, transactions, compact=compact)
+        else:
+            transactions['TX_FRAUD'] = 0
+            transactions['TX_FRAUD_SCENARIO'] = 0
+        
+        print(f"\nConversione in CSV...")
+        converter = Converters(compact=compact, compress=compress, write_workers=write_workers,
+                               id_type=id_type, outliers=outliers)
+        converter.to_csv(customers, terminals, transactions, output_folder)
+        write_state(output_folder, {
+            'n_customers': params['n_customers'], 'n_terminals': params['n_terminals'],
+            'nb_days': params['nb_days'], 'start_date': params['start_date'],
+            'n_transactions': len(transactions), 'id_type': id_type, 'outliers': outliers
+        })
+        
+        print(f"\nDataset convertito in {output_folder}/")
+    
+    def delta(self, base_folder: str, nb_days: int, output_folder: str,
+              compact: bool = False, compress: bool = False) -> None:
+        """
+        Esporta solo le modifiche per portare il dataset a nb_days giorni
+        
+        Args:
+            base_folder: Cartella con lo stato del dataset di partenza (i CSV di
+                generate o un delta precedente, per applicarli in catena)
+            nb_days: Giorni totali dopo il delta
+            output_folder: Cartella dei CSV del delta
+            compact: Tipi ridotti durante la generazione
+            compress: Scrive .csv.gz
+        """
+        state = read_state(base_folder)
+        print(f"Delta del dataset in {base_folder}/")
+        print(f"   Clienti: {state['n_customers']}")
+        print(f"   Terminali: {state['n_terminals']}")
+        print(f"   Giorni: {state['nb_days']} -> {nb_days}")
+        
+        delta = generate_delta(state, nb_days, compact=compact)
+        
+        print(f"\nConversione delta in CSV...")
+        # ID e proprietà del delta come quelli già importati
+        converter = Converters(compact=compact, compress=compress,
+                               id_type=state.get('id_type', 'string'),
+                               outliers=state.get('outliers', False))
+        converter.to_csv_delta(delta.before, delta.after, delta.base_days, delta.changed_from,
+                               output_folder)
+        write_state(output_folder, {**state, 'nb_days': nb_days, 'base_days': delta.base_days,
+                                    'n_transactions': delta.n_transactions})
+        
+        print(f"\nDelta generato in {output_folder}/")
+    
+    def run_ingest_command(self, args, folder: str) -> None:
+        """Applica i CSV di un delta al database"""
+        config = Neo4jConfig(
+            uri=args.uri,
+            username=args.user,
+            password=args.password
+        )
+        
+        manager = Neo4jManager(config)
+        if not manager.connect():
+            print("Errore: impossibile connettersi a Neo4j")
+            return
+        
+        try:
+            DeltaIngestor(manager, args.batch_size).ingest(folder)
+        finally:
+            manager.disconnect()
+    
+    @staticmethod
+    def _counted(chunks, state: dict):
+        """Conta le transazioni dei chunk in state['n_transactions']"""
+        for chunk in chunks:
+            state['n_transactions'] += len(chunk)
+            yield chunk
+    
     def run_query_command(self, args) -> None:
         """Esegue comando query"""
         config = Neo4jConfig(
             uri=args.uri,
             username=args.user,
-            password=args.password
+            password=args.password,
+            max_connection_pool_size=args.pool_size,
+            connection_acquisition_timeout=args.acquisition_timeout,
+            reuse_session=args.reuse_session
         )
         
-        executor = QueryExecutor(config)
+        cache = ResultCache(args.result_cache, args.result_cache_entries) if args.result_cache else None
+        executor = QueryExecutor(config, cache, args.profile)
         
         if not executor.connect():
             print("Errore: impossibile connettersi a Neo4j")
+            if args.action in ('plan-check', 'cn3'):
+                raise SystemExit(1)
             return
         
         # Carica query
         executor.load_queries()
         
         try:
-            if args.all:
-                executor.run_all_queries_simple(args.output)
+            if args.action == 'plan-check':
+                print("\n=== PLAN CHECK ===\n")
+                if not check_plans(executor.engine, args.baseline, args.update_baseline,
+                                   args.row_factor):
+                    raise SystemExit(1)
+            elif args.action == 'cn3':
+                print("\n=== CN3 BATCH ===\n")
+                if not executor.run_cn3_batch(args.customers, args.output, args.workers):
+                    raise SystemExit(1)
+            elif args.all:
+                executor.run_all_queries_simple(args.output, args.precomputed_outliers)
             elif args.name:
                 executor.engine.execute_query(args.name)
             else:
@@ -122,6 +619,34 @@ class Cli:
             executor.disconnect()
     
     
+    def run_benchmark_command(self, args) -> None:
+        """Esegue comando benchmark"""
+        sweeps = [parse_sweep(spec) for spec in args.sweep]
+        config = Neo4jConfig(uri=args.uri, username=args.user, password=args.password)
+        engine = QueryEngine(config)
+        
+        if not engine.connect():
+            print("Errore: impossibile connettersi a Neo4j")
+            raise SystemExit(1)
+        
+        engine.load_queries_from_dir()
+        
+        try:
+            print("\n=== BENCHMARK QUERY ===\n")
+            benchmark = QueryBenchmark(engine, args.warmup, args.iterations, args.parser)
+            environment = benchmark.environment()
+            stats = benchmark.run([name.strip() for name in args.queries.split(',')], sweeps)
+            print()
+            print(stats.to_string(index=False))
+            # Confronto prima del salvataggio: la baseline può essere l'output della run precedente
+            regressed = args.baseline and not compare_benchmark(stats, environment, args.baseline,
+                                                                args.threshold)
+            save_benchmark(args.output, stats, environment, benchmark.samples)
+            if regressed:
+                raise SystemExit(1)
+        finally:
+            engine.disconnect()
+    
     def run_extend_command(self, args) -> None:
         """Esegue comando extend"""
         import os
@@ -144,8 +669,11 @@ class Cli:
             
             # 1. Estendi transazioni
             print("1. Estensione transazioni...")
-            executor.engine.load_query('extend_tx', 'queries/extend_transactions.cypher')
-            m1 = executor.engine.execute_query('extend_tx')
+            if args.server_side:
+                executor.engine.load_query('extend_tx', 'queries/extend_transactions.cypher')
+                m1 = executor.engine.execute_query('extend_tx')
+            else:
+                m1 = executor.extend_transactions(args.batch_size, args.parallelism)
             
             # 2. Crea relazioni FREQUENT_COLLABORATOR
             print("\n2. Creazione relazioni FREQUENT_COLLABORATOR...")
@@ -155,18 +683,9 @@ class Cli:
             # 3. Calcola statistiche per giorno
             print("\n3. Calcolo statistiche per giorno settimana...")
             executor.engine.load_query('stats_day', 'queries/stats_by_day.cypher')
-            m3 = executor.engine.execute_query('stats_day')
-            
-            # Salva risultati statistiche
+            m3 = executor.engine.export_query('stats_day', f"{args.output}/stats_by_day.csv")
             if m3.success:
-                result = executor.engine.manager.run_cypher(
-                    executor.engine.queries['stats_day'],
-                    parser='dataframe'
-                )
-                if result.success:
-                    import pandas as pd
-                    result.data.to_csv(f"{args.output}/stats_by_day.csv", index=False)
-                    print(f"\nStatistiche salvate in {args.output}/stats_by_day.csv")
+                print(f"\nStatistiche salvate in {args.output}/stats_by_day.csv")
             
             # Salva tempi esecuzione
             executor.engine.save_results_simple(args.output)
@@ -181,21 +700,52 @@ class Cli:
         args = self.parse_args()
         
         if args.command == 'generate':
+            cache = StageCache(args.cache, parse_size(args.cache_max_size)) if args.cache else None
+            
             if args.size:
-                n_customers, n_terminals, nb_days = self.estimate_parameters(args.size)
+                n_customers, n_terminals, nb_days = self.estimate_parameters(
+                    args.size, args.shape, args.customers, args.terminals, args.days, cache,
+                    args.id_type
+                )
             else:
                 n_customers = args.customers
                 n_terminals = args.terminals
                 nb_days = args.days
             
-            self.generate(n_customers, n_terminals, nb_days, args.output)
+            self.generate(n_customers, n_terminals, nb_days, args.output, args.workers,
+                          args.stream, args.chunk_days, args.compact, args.compress,
+                          args.write_workers, cache, args.raw, args.id_type, args.outliers)
+            
+            if args.size and args.compress:
+                # Il target si riferisce ai CSV non compressi
+                print(f"Dimensione CSV compressi: {dataset_size(args.output) / 1024 ** 2:.1f}MB")
+            elif args.size:
+                actual = dataset_size(args.output)
+                target = parse_size(args.size)
+                print(f"Dimensione CSV: {actual / 1024 ** 2:.1f}MB "
+                      f"(target {args.size}, scarto {(actual - target) / target * 100:+.1f}%)")
+        
+        elif args.command == 'convert':
+            self.convert(args.raw, args.output, args.compact, args.compress,
+                         args.write_workers, not args.no_frauds, not args.no_mmap, args.id_type,
+                         args.outliers)
+        
+        elif args.command == 'delta':
+            self.delta(args.base, args.days, args.output, args.compact, args.compress)
+            if args.ingest:
+                self.run_ingest_command(args, args.output)
+        
+        elif args.command == 'ingest':
+            self.run_ingest_command(args, args.input)
         
         elif args.command == 'query':
             self.run_query_command(args)
         
+        elif args.command == 'benchmark':
+            self.run_benchmark_command(args)
         elif args.command == 'extend':
             self.run_extend_command(args)
         
         else:
-            print("Usa: generate, query o extend")
+            print("Usa: generate, convert, delta, ingest, query, benchmark o extend")
 
@@ -0,0 +1,126 @@
+"""Query 3.c (CN3) per molti customer con un pool di worker asincroni"""
+
+import asyncio
+import dataclasses
+import gzip
+import os
+import time
+from typing import Any, Dict, List, Sequence
+
+import pandas as pd
+
+from async_manager import AsyncNeo4jManager
+from base import Neo4jConfig
+from manager import Neo4jManager
+from profiling import latency_stats
+
+
+DEFAULT_WORKERS = 8
+
+CUSTOMER_IDS_QUERY = """
+MATCH (c:Customer)
+RETURN c.customerId AS id
+ORDER BY id
+"""
+
+
+def read_customers(spec: str, manager: Neo4jManager) -> List[str]:
+    """
+    Customer di partenza: 'all' per tutti quelli del database, altrimenti un
+    file con un customerId per riga (righe vuote e # commenti ignorati)
+    """
+    if spec == 'all':
+        result = manager.run_cypher(CUSTOMER_IDS_QUERY, parser='columnar')
+        if not result.success:
+            raise RuntimeError(f"Lettura dei customer fallita: {result.error}")
+        return [str(customer_id) for customer_id in result.data['id'].tolist()]
+    with open(spec) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+async def _lookups(config: Neo4jConfig, query: str, customers: Sequence[str],
+                   output_file: str, workers: int) -> List[Dict[str, Any]]:
+    """
+    workers coroutine prendono i customer dallo stesso iteratore: ognuna
+    ha al massimo una q1c in corso, quindi il pool del driver non serve mai
+    più di workers connessioni. Le righe vengono scritte appena una lookup
+    finisce, nell'ordine di completamento.
+    """
+    manager = AsyncNeo4jManager(dataclasses.replace(config, max_concurrency=workers))
+    if not await manager.connect():
+        raise RuntimeError("Impossibile connettersi a Neo4j")
+
+    pending = iter(customers)
+    lookups: List[Dict[str, Any]] = []
+    report_every = max(1, len(customers) // 10)
+    opener = gzip.open if output_file.endswith('.gz') else open
+
+    try:
+        with opener(output_file, 'wt', newline='') as f:
+            header = True
+
+            async def worker() -> None:
+                nonlocal header
+                # next() sull'iteratore condiviso è sincrono: ogni customer va a un solo worker
+                for customer in pending:
+                    result = await manager.run_cypher(query, {'customerId': customer}, 'columnar')
+                    rows = 0
+                    if result.success:
+                        rows = len(result.data)
+                        # Scrittura nel thread del loop: le righe di due lookup non si mescolano.
+                        # Anche un risultato vuoto ha le colonne, buone per l'intestazione
+                        if rows or header:
+                            result.data.to_csv(f, index=False, header=header)
+                            header = False
+                    lookups.append({
+                        'customer': customer,
+                        'seconds': result.execution_time,
+                        'server_ms': result.result_available_after,
+                        'rows': rows,
+                        'success': result.success,
+                        'error': result.error
+                    })
+                    if len(lookups) % report_every == 0:
+                        print(f"   {len(lookups)}/{len(customers)} customer")
+
+            await asyncio.gather(*(worker() for _ in range(min(workers, len(customers)))))
+    finally:
+        await manager.disconnect()
+    return lookups
+
+
+def run_cn3_batch(config: Neo4jConfig, query: str, customers: Sequence[str],
+                  output_file: str, workers: int = DEFAULT_WORKERS) -> Dict[str, Any]:
+    """
+    Esegue q1c per ogni customer con workers lookup in parallelo
+
+    Args:
+        config: Connessione (il pool deve avere almeno workers connessioni)
+        query: Testo di q1c, con parametro $customerId
+        customers: customerId di partenza
+        output_file: CSV (o .csv.gz) unico con le righe di tutte le lookup;
+            customer_start indica la lookup di provenienza
+        workers: Lookup in esecuzione contemporaneamente
+
+    Returns:
+        Dizionario con customers, rows, errors, seconds, customers_per_second,
+        le statistiche di latenza (latency_stats) e lookups, una riga per customer
+    """
+    folder = os.path.dirname(output_file)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    start_time = time.perf_counter()
+    lookups = asyncio.run(_lookups(config, query, customers, output_file, workers))
+    seconds = time.perf_counter() - start_time
+
+    succeeded = [lookup for lookup in lookups if lookup['success']]
+    return {
+        'customers': len(lookups),
+        'rows': sum(lookup['rows'] for lookup in succeeded),
+        'errors': len(lookups) - len(succeeded),
+        'seconds': seconds,
+        'customers_per_second': len(lookups) / seconds if seconds > 0 else 0.0,
+        **latency_stats([lookup['seconds'] for lookup in succeeded]),
+        'lookups': pd.DataFrame(lookups),
+    }
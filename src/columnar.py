@@ -0,0 +1,152 @@
+"""Formato colonnare su disco del dataset grezzo, ricaricato in memory map"""
+
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+SCHEMA = 'schema.json'
+
+TABLES = ('customers', 'terminals', 'transactions')
+
+
+class ColumnarWriter:
+    """
+    Scrive tabelle come un file binario per colonna (<tabella>/<colonna>.bin)
+    più uno schema JSON con dtype e numero di righe.
+
+    Le colonne vengono scritte in append, quindi una tabella può arrivare a
+    chunk (es. generate_transactions_chunks). Le colonne di liste (es.
+    available_terminals) sono salvate come valori concatenati più offset.
+    """
+
+    def __init__(self, folder: str, params: Optional[Dict[str, Any]] = None):
+        self.folder = folder
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        self.params = params or {}
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, table: str, frame: pd.DataFrame) -> None:
+        """Aggiunge le righe di frame alla tabella"""
+        table_folder = os.path.join(self.folder, table)
+        schema = self.tables.get(table)
+        if schema is None:
+            os.makedirs(table_folder, exist_ok=True)
+            schema = {'rows': 0, 'columns': {}}
+            self.tables[table] = schema
+            for column in frame.columns:
+                schema['columns'][column] = self._column_schema(frame[column])
+                for path in self._column_files(table_folder, column, schema['columns'][column]):
+                    open(path, 'wb').close()
+
+        for column, spec in schema['columns'].items():
+            values = frame[column]
+            if spec['kind'] == 'ragged':
+                lengths = values.map(len).to_numpy(np.int64)
+                flat = (np.concatenate([np.asarray(v) for v in values]) if len(values)
+                        else np.array([], dtype=spec['dtype']))
+                offsets = spec['values'] + np.cumsum(lengths)
+                if schema['rows'] == 0:
+                    offsets = np.concatenate([[0], offsets])
+                self._append(os.path.join(table_folder, f'{column}.values.bin'), flat.astype(spec['dtype']))
+                self._append(os.path.join(table_folder, f'{column}.offsets.bin'), offsets)
+                spec['values'] += int(lengths.sum())
+            else:
+                self._append(os.path.join(table_folder, f'{column}.bin'),
+                             values.to_numpy().astype(spec['dtype'], copy=False))
+        schema['rows'] += len(frame)
+
+    def tee(self, table: str, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """Scrive ogni chunk e lo passa allo step successivo"""
+        for chunk in chunks:
+            self.write(table, chunk)
+            yield chunk
+
+    def close(self) -> None:
+        """Scrive lo schema: fino a qui il dataset non è leggibile"""
+        with open(os.path.join(self.folder, SCHEMA), 'w') as f:
+            json.dump({'params': self.params, 'tables': self.tables}, f, indent=2)
+
+    def _column_schema(self, values: pd.Series) -> Dict[str, Any]:
+        if values.dtype == object:
+            first = next((v for v in values if v is not None), None)
+            if first is None or not hasattr(first, '__len__'):
+                raise TypeError(f"Colonna {values.name} non supportata dal formato colonnare")
+            return {'kind': 'ragged', 'dtype': np.asarray(first).dtype.str, 'values': 0}
+        return {'kind': 'array', 'dtype': values.dtype.str}
+
+    def _column_files(self, table_folder: str, column: str, spec: Dict[str, Any]):
+        if spec['kind'] == 'ragged':
+            return [os.path.join(table_folder, f'{column}.values.bin'),
+                    os.path.join(table_folder, f'{column}.offsets.bin')]
+        return [os.path.join(table_folder, f'{column}.bin')]
+
+    @staticmethod
+    def _append(path: str, array: np.ndarray) -> None:
+        with open(path, 'ab') as f:
+            np.ascontiguousarray(array).tofile(f)
+
+
+def save_dataset(folder: str, customers: pd.DataFrame, terminals: pd.DataFrame,
+                 transactions: pd.DataFrame, params: Optional[Dict[str, Any]] = None) -> None:
+    """Salva customers, terminals e transactions in formato colonnare"""
+    writer = ColumnarWriter(folder, params)
+    writer.write('customers', customers)
+    writer.write('terminals', terminals)
+    writer.write('transactions', transactions)
+    writer.close()
+
+
+def read_schema(folder: str) -> Dict[str, Any]:
+    path = os.path.join(folder, SCHEMA)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Dataset colonnare non trovato in {folder} (manca {SCHEMA})")
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_table(folder: str, table: str, mmap: bool = True) -> pd.DataFrame:
+    """
+    Carica una tabella del dataset colonnare
+
+    Args:
+        folder: Cartella del dataset
+        table: Nome della tabella
+        mmap: Se True le colonne sono memory map in sola lettura (nessuna
+            copia finché non vengono modificate), altrimenti lette in memoria
+
+    Returns:
+        DataFrame con le colonne originali
+    """
+    schema = read_schema(folder)['tables'][table]
+    table_folder = os.path.join(folder, table)
+    rows = schema['rows']
+
+    def read(path: str, dtype: str, count: int) -> np.ndarray:
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        if mmap:
+            return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+        return np.fromfile(path, dtype=dtype, count=count)
+
+    columns = {}
+    for column, spec in schema['columns'].items():
+        if spec['kind'] == 'ragged':
+            values = read(os.path.join(table_folder, f'{column}.values.bin'), spec['dtype'], spec['values'])
+            offsets = read(os.path.join(table_folder, f'{column}.offsets.bin'), '<i8', rows + 1 if rows else 0)
+            columns[column] = pd.Series(
+                [values[offsets[i]:offsets[i + 1]] for i in range(rows)], dtype=object
+            )
+        else:
+            columns[column] = read(os.path.join(table_folder, f'{column}.bin'), spec['dtype'], rows)
+
+    # copy=False: le colonne restano le memory map, senza consolidamento in blocchi
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_dataset(folder: str, mmap: bool = True) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Carica (customers, terminals, transactions) dal dataset colonnare"""
+    return tuple(load_table(folder, table, mmap) for table in TABLES)
@@ -1,9 +1,85 @@
+import gzip
 import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import numpy as np
 import pandas as pd
 
 
+# Righe di shares_terminal.csv scritte per blocco
+SHARES_CHUNK_ROWS = 1_000_000
+
+ID_TYPES = ('string', 'integer')
+
+# ID intero dei quarter: terminale * QUARTER_ID_STRIDE + trimestri dal primo
+# trimestre del 2018 (T5_Y2018_Q2 -> 5001). Non dipende dai giorni generati,
+# quindi resta uguale nei delta
+QUARTER_ID_EPOCH = 2018 * 4
+QUARTER_ID_STRIDE = 1000
+
+# Soglia di q1b: outlier se amount / prev_median del quarter supera la soglia
+OUTLIER_THRESHOLD = 1.3
+
+# Livello gzip dei .csv.gz: il default (9) triplica il tempo di scrittura per
+# pochi punti percentuali di compressione
+GZIP_LEVEL = 1
+
+
+def write_csv_file(frame: pd.DataFrame, path: str, append: bool = False) -> Tuple[int, float]:
+    """
+    Scrive un DataFrame in CSV (gzip se path termina in .gz), in append senza
+    header per i chunk successivi. Funzione di modulo per i processi del writer.
+
+    Returns:
+        Tuple (byte aggiunti al file, secondi)
+    """
+    start_time = time.perf_counter()
+    size_before = os.path.getsize(path) if append and os.path.exists(path) else 0
+    frame.to_csv(
+        path,
+        index=False,
+        mode='a' if append else 'w',
+        header=not append,
+        date_format='%Y-%m-%d %H:%M:%S',
+        compression={'method': 'gzip', 'compresslevel': GZIP_LEVEL} if path.endswith('.gz') else None
+    )
+    return os.path.getsize(path) - size_before, time.perf_counter() - start_time
+
+
 class Converters:
 
+    def __init__(self, compact: bool = False, compress: bool = False, write_workers: int = 1,
+                 id_type: str = 'string', outliers: bool = False):
+        """
+        Args:
+            compact: Se True le transazioni non vengono copiate, year/quarter sono
+                interi piccoli e le colonne stringa ripetute per ogni transazione
+                (quarter_id, ID terminale, :LABEL/:TYPE) sono categoriche a codici
+                interi: il testo viene prodotto solo durante la scrittura del CSV
+            compress: Scrive .csv.gz (letti direttamente da neo4j-admin import)
+            write_workers: Processi che serializzano i file in parallelo
+                (1 = scrittura sequenziale nel processo corrente)
+            id_type: 'string' (terminali 'T<n>', quarter 'T<n>_Y<anno>_Q<q>') o
+                'integer': tutti gli ID sono interi, da importare con
+                neo4j-admin --id-type=integer (ID più corti e mappa degli
+                ID dell'import più piccola)
+            outliers: Aggiunge alle transazioni outlier_ratio (float) e
+                potentialOutlier (boolean, solo sugli outlier) calcolati come
+                in q1b, così q1b_precomputed li legge senza ricalcolarli
+        """
+        if id_type not in ID_TYPES:
+            raise ValueError(f"id_type non valido: {id_type} ({', '.join(ID_TYPES)})")
+        self.compact = compact
+        self.id_type = id_type
+        self.outliers = outliers
+        self.compress = compress
+        self.write_workers = write_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._write_stats: Dict[str, List[float]] = {}
+        self._write_start = 0.0
+
     def to_csv(
         self,
         customers: pd.DataFrame,
@@ -13,14 +89,14 @@ class Converters:
     ) -> str:
 
         os.makedirs(output_folder, exist_ok=True)
+        self._start_writes()
 
         # =====================================================
         # PREPARAZIONE TRANSAZIONI (YEAR / QUARTER)
         # =====================================================
-        tx = transactions.copy()
-        tx['year'] = tx['TX_DATETIME'].dt.year
-        tx['quarter'] = tx['TX_DATETIME'].dt.quarter
-        
+        tx = transactions.copy(deep=not self.compact)
+        self._add_quarter_columns(tx)
+
         # DEBUG: Verifica range date
         print(f"Date range transazioni: {tx['TX_DATETIME'].min()} to {tx['TX_DATETIME'].max()}")
         print(f"Anni unici: {sorted(tx['year'].unique())}")
@@ -30,38 +106,11 @@ class Converters:
         # SOLUZIONE SEMPLICE: Quarter solo per combinazioni REALI
         # =====================================================
         # 1. Calcola mediana per ogni combo reale (TERMINAL_ID, year, quarter)
-        median_q = (
-            tx.groupby(['TERMINAL_ID', 'year', 'quarter'])['TX_AMOUNT']
-            .median()
-            .reset_index(name='current_median')
-        )
-        
-        # 2. Crea Quarter nodes SOLO per combo reali
-        quarter_nodes = median_q.copy()
-        
-        # 3. Calcola quarter precedente per OGNI riga
-        quarter_nodes['prev_year'] = quarter_nodes['year']
-        quarter_nodes['prev_quarter'] = quarter_nodes['quarter'] - 1
-        
-        quarter_nodes.loc[quarter_nodes['prev_quarter'] == 0, 'prev_quarter'] = 4
-        quarter_nodes.loc[quarter_nodes['prev_quarter'] == 4, 'prev_year'] -= 1
-        
-        # 4. Aggiungi prev_median (se esiste)
-        # Crea mappa per lookup veloce
-        median_map = median_q.set_index(['TERMINAL_ID', 'year', 'quarter'])['current_median'].to_dict()
-        
-        quarter_nodes['prev_median'] = quarter_nodes.apply(
-            lambda r: median_map.get((r['TERMINAL_ID'], r['prev_year'], r['prev_quarter']), None),
-            axis=1
-        )
-        
-        # 5. Crea ID Quarter (deve essere uguale a quello usato nelle transazioni!)
-        quarter_nodes['TERMINAL_ID_STR'] = 'T' + quarter_nodes['TERMINAL_ID'].astype(str)
-        quarter_nodes['quarterId:ID(Quarter)'] = quarter_nodes.apply(
-            lambda r: f"T{r['TERMINAL_ID']}_Y{r['year']}_Q{r['quarter']}",
-            axis=1
-        )
-        
+        median_q = self._quarter_medians(tx)
+
+        # 2-5. Crea Quarter nodes SOLO per combo reali
+        quarter_nodes = self._quarter_nodes(median_q)
+
         print(f"\nQuarter nodes creati: {len(quarter_nodes)}")
         print(f"Terminali coperti: {quarter_nodes['TERMINAL_ID'].nunique()}")
         print(f"Range anni: {quarter_nodes['year'].min()} - {quarter_nodes['year'].max()}")
@@ -75,7 +124,566 @@ class Converters:
             .count()
             .reset_index(name='total_tx_count')
         )
+        self._write_customers(customers, total_tx, output_folder)
+
+        # =====================================================
+        # 2. TERMINALS
+        # =====================================================
+        self._write_terminals(terminals, output_folder)
+
+        # =====================================================
+        # 2b. QUARTER NODES + 2c. TERMINAL -> QUARTER (RELAZIONE)
+        # =====================================================
+        quarter_csv, terminal_quarter_rel = self._write_quarters(quarter_nodes, output_folder)
+
+        print(f"\nPrime 5 Quarter nodes:")
+        print(quarter_csv.head())
+
+        # =====================================================
+        # 3. TRANSACTIONS - DEVE usare lo STESSO quarter_id!
+        # =====================================================
+        # Crea quarter_id PERFETTAMENTE UGUALI a quelli in quarter_nodes
+        tx['quarter_id'] = self._quarter_ids(tx)
+
+        # VERIFICA: tutte le transazioni hanno un quarter_id valido?
+        valid_quarter_ids = set(quarter_nodes['quarterId:ID(Quarter)'])
+        tx['has_valid_quarter'] = tx['quarter_id'].isin(valid_quarter_ids)
+
+        print(f"\nTransazioni totali: {len(tx)}")
+        print(f"Transazioni con quarter_id valido: {tx['has_valid_quarter'].sum()}")
+        print(f"Transazioni senza quarter_id valido: {len(tx) - tx['has_valid_quarter'].sum()}")
+
+        # Mostra transazioni problematiche
+        if not tx['has_valid_quarter'].all():
+            problematic = tx[~tx['has_valid_quarter']]
+            print("\nTransazioni problematiche (prime 5):")
+            print(problematic[['TRANSACTION_ID', 'TERMINAL_ID', 'year', 'quarter', 'quarter_id']].head())
+
+            # Crea Quarter nodes mancanti per queste transazioni
+            missing_quarters = problematic[['TERMINAL_ID', 'year', 'quarter']].drop_duplicates()
+            print(f"\nCreazione di {len(missing_quarters)} quarter nodes mancanti...")
+
+            # Un solo append per tutti i quarter mancanti
+            missing_ids = self._quarter_labels(missing_quarters)
+            new_quarters = pd.DataFrame({
+                'quarterId:ID(Quarter)': missing_ids,
+                'year': missing_quarters['year'],
+                'quarter': missing_quarters['quarter'],
+                'current_median': 0.0,  # Default
+                'prev_median': None,
+                ':LABEL': 'Quarter'
+            })
+            quarter_csv = pd.concat([quarter_csv, new_quarters], ignore_index=True)
+
+            # Aggiungi relazioni Terminal->Quarter
+            new_rels = pd.DataFrame({
+                ':START_ID(Terminal)': self._terminal_labels(missing_quarters['TERMINAL_ID']),
+                ':END_ID(Quarter)': missing_ids,
+                ':TYPE': 'HAS_QUARTER'
+            })
+            terminal_quarter_rel = pd.concat([terminal_quarter_rel, new_rels], ignore_index=True)
+
+            # Salva versioni aggiornate
+            self._write_frame(quarter_csv, f'{output_folder}/quarters.csv')
+            self._write_frame(terminal_quarter_rel, f'{output_folder}/terminal_quarter.csv')
+
+        if self.outliers:
+            self._add_outliers(tx, median_q)
+        self._write_frame(self._transactions_csv(tx), f'{output_folder}/transactions.csv')
+
+        # =====================================================
+        # 3b. TRANSAZIONE -> QUARTER (SOLO relazioni valide!)
+        # =====================================================
+        # Filtra SOLO transazioni con quarter_id valido
+        if self.compact and tx['has_valid_quarter'].all():
+            tx_valid = tx
+        else:
+            tx_valid = tx[tx['has_valid_quarter']].copy()
+
+        transaction_quarter_rel = self._transaction_quarter_rel(tx_valid)
+        self._write_frame(transaction_quarter_rel, f'{output_folder}/transaction_quarter.csv')
+        print(f"Relazioni Transaction->Quarter create: {len(transaction_quarter_rel)}")
+
+        # =====================================================
+        # 4. CUSTOMER -> TRANSACTION
+        # =====================================================
+        self._write_frame(self._cust_tx_rel(transactions), f'{output_folder}/cust_tx.csv')
+
+        # =====================================================
+        # 5. TRANSACTION -> TERMINAL
+        # =====================================================
+        self._write_frame(self._tx_term_rel(transactions), f'{output_folder}/tx_term.csv')
+
+        # =====================================================
+        # 6. CUSTOMER -> TERMINAL (USED_TERMINAL)
+        # =====================================================
+        used_terminal = (
+            transactions
+            .groupby(['CUSTOMER_ID', 'TERMINAL_ID'])
+            .size()
+            .reset_index(name='tx_count')
+        )
+        self._write_used_terminal(used_terminal, output_folder)
+
+        # =====================================================
+        # 7. CUSTOMER ↔ CUSTOMER (SHARES_TERMINAL)
+        # =====================================================
+        self._write_shares_terminal(used_terminal, output_folder)
+
+        self._finish_writes()
+
+        # =====================================================
+        # VERIFICA FINALE
+        # =====================================================
+        print(f"\n✅ CONVERSIONE COMPLETATA")
+        print(f"Cartella: {output_folder}")
+
+        # Verifica consistenza
+        print("\n=== VERIFICA CONSISTENZA ===")
+        quarters_set = set(quarter_csv['quarterId:ID(Quarter)'])
+        tx_quarters_set = set(tx['quarter_id'].unique())
+
+        print(f"Quarter nodes nel file: {len(quarters_set)}")
+        print(f"Quarter unici nelle transazioni: {len(tx_quarters_set)}")
+
+        missing = tx_quarters_set - quarters_set
+        if missing:
+            print(f"⚠️  Quarter mancanti in nodes: {len(missing)}")
+            print(f"Esempi: {list(missing)[:5]}")
+        else:
+            print("✅ Tutti i quarter delle transazioni hanno un nodo corrispondente")
+
+        # Verifica relazioni (conteggio delle righe senza rileggere il file)
+        with self._open_written(f'{output_folder}/transaction_quarter.csv') as f:
+            rel_rows = sum(1 for _ in f) - 1
+        print(f"\nRelazioni Transaction->Quarter: {rel_rows}")
+
+        return output_folder
+
+    def to_csv_stream(
+        self,
+        customers: pd.DataFrame,
+        terminals: pd.DataFrame,
+        chunks: Iterable[pd.DataFrame],
+        output_folder: str = "init-data"
+    ) -> str:
+        """
+        Come to_csv, ma consuma le transazioni a chunk ordinati per TX_DATETIME
+        (es. add_frauds_stream) senza mai tenerle tutte in memoria.
+
+        I file delle transazioni vengono scritti in append chunk per chunk.
+        Conteggi per customer, USED_TERMINAL e mediane dei quarter chiusi sono
+        tenuti in accumulatori la cui dimensione non dipende dal numero di giorni;
+        solo gli importi del quarter ancora aperto restano in memoria.
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        self._start_writes()
+
+        total_tx: Optional[pd.Series] = None
+        used_counts: Optional[pd.Series] = None
+        closed_medians = []
+        open_amounts: Optional[pd.DataFrame] = None
+        n_transactions = 0
+        append = False
+
+        for chunk in chunks:
+            if len(chunk) == 0:
+                continue
+
+            tx = chunk.copy(deep=not self.compact)
+            self._add_quarter_columns(tx)
+            tx['quarter_id'] = self._quarter_ids(tx)
+
+            # I chunk sono in ordine di tempo: i quarter precedenti a quello
+            # dell'ultima transazione del chunk non riceveranno altre transazioni
+            amounts = tx[['TERMINAL_ID', 'year', 'quarter', 'TX_AMOUNT']]
+            open_amounts = amounts if open_amounts is None else pd.concat([open_amounts, amounts])
+            last = tx['TX_DATETIME'].max()
+            period = open_amounts['year'] * 4 + open_amounts['quarter']
+            closed = period < last.year * 4 + last.quarter
+            if closed.any():
+                closed_medians.append(self._quarter_medians(open_amounts[closed]))
+                open_amounts = open_amounts[~closed]
+
+            if self.outliers:
+                # Il quarter precedente di ogni transazione del chunk è già chiuso
+                self._add_outliers(tx, pd.concat(closed_medians) if closed_medians else None)
+
+            # Ogni transazione ha il proprio quarter node: i quarter vengono
+            # creati dalle stesse transazioni, quindi tutte le relazioni sono valide
+            self._write_frame(self._transactions_csv(tx), f'{output_folder}/transactions.csv', append)
+            self._write_frame(self._transaction_quarter_rel(tx), f'{output_folder}/transaction_quarter.csv', append)
+            self._write_frame(self._cust_tx_rel(tx), f'{output_folder}/cust_tx.csv', append)
+            self._write_frame(self._tx_term_rel(tx), f'{output_folder}/tx_term.csv', append)
+            append = True
+            n_transactions += len(tx)
+
+            chunk_total = tx.groupby('CUSTOMER_ID')['TRANSACTION_ID'].count()
+            total_tx = chunk_total if total_tx is None else total_tx.add(chunk_total, fill_value=0)
+
+            chunk_used = tx.groupby(['CUSTOMER_ID', 'TERMINAL_ID']).size()
+            used_counts = chunk_used if used_counts is None else used_counts.add(chunk_used, fill_value=0)
+
+        if open_amounts is not None and len(open_amounts) > 0:
+            closed_medians.append(self._quarter_medians(open_amounts))
+
+        if not append:
+            self._finish_writes()
+            print("Nessuna transazione da convertire")
+            return output_folder
+
+        # Stesso ordinamento del groupby di to_csv
+        median_q = (
+            pd.concat(closed_medians)
+            .sort_values(['TERMINAL_ID', 'year', 'quarter'])
+            .reset_index(drop=True)
+        )
+        quarter_nodes = self._quarter_nodes(median_q)
+        self._write_quarters(quarter_nodes, output_folder)
 
+        total_tx = total_tx.astype('int64').rename_axis('CUSTOMER_ID').reset_index(name='total_tx_count')
+        self._write_customers(customers, total_tx, output_folder)
+        self._write_terminals(terminals, output_folder)
+
+        used_terminal = (
+            used_counts
+            .astype('int64')
+            .sort_index()
+            .reset_index(name='tx_count')
+        )
+        self._write_used_terminal(used_terminal, output_folder)
+        self._write_shares_terminal(used_terminal, output_folder)
+        self._finish_writes()
+
+        print(f"\n✅ CONVERSIONE COMPLETATA (streaming)")
+        print(f"Cartella: {output_folder}")
+        print(f"Transazioni: {n_transactions}")
+        print(f"Quarter nodes: {len(quarter_nodes)}")
+        print(f"Relazioni USED_TERMINAL: {len(used_terminal)}")
+
+        return output_folder
+
+    def to_csv_delta(
+        self,
+        before: pd.DataFrame,
+        after: pd.DataFrame,
+        base_days: int,
+        changed_from: int,
+        output_folder: str = "delta-data"
+    ) -> str:
+        """
+        Scrive solo le differenze tra due versioni della coda del dataset
+        (delta.generate_delta): before fino a base_days, after con i giorni
+        aggiunti. Entrambe partono dall'inizio di un quarter e coincidono prima
+        di changed_from.
+
+        File scritti, con gli stessi header dei CSV di import:
+        - transactions.csv, cust_tx.csv, tx_term.csv, transaction_quarter.csv:
+          transazioni dei giorni nuovi e le loro relazioni
+        - transactions_updated.csv: transazioni esistenti a cui le frodi dei
+          giorni nuovi cambiano importo o flag
+        - quarters.csv, terminal_quarter.csv: quarter nuovi o con mediane cambiate
+        - used_terminal.csv, customer_tx_count.csv: incrementi di tx_count e
+          total_tx_count
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        self._start_writes()
+
+        # Quarter di entrambe le versioni: il primo quarter serve solo come
+        # prev_median (e per il rapporto degli outlier) del successivo
+        medians = []
+        for tx in (before, after):
+            tx = tx[['TERMINAL_ID', 'TX_DATETIME', 'TX_AMOUNT']].copy()
+            self._add_quarter_columns(tx)
+            medians.append(self._quarter_medians(tx))
+        if self.outliers:
+            # Mediane cambiate cambiano anche il rapporto di transazioni esistenti
+            before, after = before.copy(), after.copy()
+            for tx, median_q in zip((before, after), medians):
+                self._add_quarter_columns(tx)
+                self._add_outliers(tx, median_q)
+
+        new_tx = after[after['TX_TIME_DAYS'] >= base_days].copy(deep=not self.compact)
+        self._add_quarter_columns(new_tx)
+        new_tx['quarter_id'] = self._quarter_ids(new_tx)
+
+        self._write_frame(self._transactions_csv(new_tx), f'{output_folder}/transactions.csv')
+        self._write_frame(self._transaction_quarter_rel(new_tx), f'{output_folder}/transaction_quarter.csv')
+        self._write_frame(self._cust_tx_rel(new_tx), f'{output_folder}/cust_tx.csv')
+        self._write_frame(self._tx_term_rel(new_tx), f'{output_folder}/tx_term.csv')
+
+        # Stesse righe nelle due versioni: after ha solo le transazioni nuove in coda
+        old = after.iloc[:len(before)]
+        in_window = (old['TX_TIME_DAYS'] >= changed_from).to_numpy()
+        changed = in_window & (
+            (old['TX_AMOUNT'].to_numpy() != before['TX_AMOUNT'].to_numpy())
+            | (old['TX_FRAUD'].to_numpy() != before['TX_FRAUD'].to_numpy())
+        )
+        if self.outliers:
+            ratio_after = old['outlier_ratio'].to_numpy()
+            ratio_before = before['outlier_ratio'].to_numpy()
+            changed |= in_window & ~(
+                (ratio_after == ratio_before) | (np.isnan(ratio_after) & np.isnan(ratio_before))
+            )
+        updated = old[changed]
+        self._write_frame(self._transactions_csv(updated), f'{output_folder}/transactions_updated.csv')
+
+        # Quarter dal quarter di changed_from
+        quarters = [self._quarter_nodes(median_q) for median_q in medians]
+        first_changed = after.loc[after['TX_TIME_DAYS'] >= changed_from, 'TX_DATETIME'].min()
+        first_period = first_changed.year * 4 + first_changed.quarter - 1
+        quarters_before, quarters_after = [
+            q[self._periods(q['year'], q['quarter']) >= first_period] for q in quarters
+        ]
+        compared = quarters_after.merge(
+            quarters_before[['quarterId:ID(Quarter)', 'current_median', 'prev_median']],
+            on='quarterId:ID(Quarter)', how='left', suffixes=('', '_before'), indicator=True
+        )
+        is_new = (compared['_merge'] == 'left_only').to_numpy()
+        median_changed = (compared['current_median'] != compared['current_median_before']).to_numpy()
+        prev_changed = ~(
+            (compared['prev_median'] == compared['prev_median_before'])
+            | (compared['prev_median'].isna() & compared['prev_median_before'].isna())
+        ).to_numpy()
+        self._write_quarters(quarters_after[is_new | median_changed | prev_changed], output_folder)
+
+        used_terminal = (
+            new_tx
+            .groupby(['CUSTOMER_ID', 'TERMINAL_ID'])
+            .size()
+            .reset_index(name='tx_count')
+        )
+        self._write_used_terminal(used_terminal, output_folder)
+
+        customer_tx = (
+            new_tx
+            .groupby('CUSTOMER_ID')
+            .size()
+            .reset_index(name='tx_count')
+            .rename(columns={'CUSTOMER_ID': 'customerId'})
+        )
+        self._write_frame(customer_tx, f'{output_folder}/customer_tx_count.csv')
+        self._finish_writes()
+
+        print(f"\n✅ DELTA COMPLETATO")
+        print(f"Cartella: {output_folder}")
+        print(f"Transazioni nuove: {len(new_tx)}")
+        print(f"Transazioni aggiornate: {len(updated)}")
+        print(f"Quarter nuovi o cambiati: {int((is_new | median_changed | prev_changed).sum())}")
+        print(f"Coppie USED_TERMINAL incrementate: {len(used_terminal)}")
+
+        return output_folder
+
+    # =====================================================
+    # STEP CONDIVISI TRA to_csv E to_csv_stream
+    # =====================================================
+
+    def _write_frame(self, frame: pd.DataFrame, path: str, append: bool = False) -> None:
+        """
+        Scrive un DataFrame, in append senza header per i chunk successivi.
+
+        Con write_workers > 1 la scrittura viene solo accodata al pool: file
+        diversi vengono serializzati in parallelo, mentre le scritture sullo
+        stesso file attendono la precedente per mantenere l'ordine dei chunk.
+        """
+        if self.compress:
+            path += '.gz'
+        if not append:
+            # Evita che resti la versione del file nell'altro formato
+            other = path[:-3] if path.endswith('.gz') else path + '.gz'
+            if os.path.exists(other):
+                os.remove(other)
+
+        previous = self._pending.pop(path, None)
+        if previous is not None:
+            self._record_write(path, previous.result())
+
+        if self._pool is None:
+            self._record_write(path, write_csv_file(frame, path, append))
+        else:
+            self._pending[path] = self._pool.submit(write_csv_file, frame, path, append)
+
+    def _start_writes(self) -> None:
+        """Azzera le statistiche e avvia il pool di scrittura"""
+        self._write_stats = {}
+        self._pending = {}
+        self._write_start = time.perf_counter()
+        if self.write_workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.write_workers)
+
+    def _finish_writes(self) -> None:
+        """Attende le scritture in corso, chiude il pool e stampa byte e throughput"""
+        for path, future in self._pending.items():
+            self._record_write(path, future.result())
+        self._pending = {}
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+        elapsed = time.perf_counter() - self._write_start
+        total_bytes = sum(size for size, _ in self._write_stats.values())
+        print(f"\n=== SCRITTURA CSV ({self.write_workers} processi"
+              f"{', gzip' if self.compress else ''}) ===")
+        for path, (size, seconds) in sorted(self._write_stats.items(), key=lambda item: -item[1][0]):
+            throughput = size / 1024 ** 2 / seconds if seconds else 0.0
+            print(f"   {os.path.basename(path):<28} {size / 1024 ** 2:9.1f}MB "
+                  f"{seconds:7.2f}s {throughput:7.1f}MB/s")
+        print(f"   Totale: {total_bytes / 1024 ** 2:.1f}MB in {elapsed:.2f}s di conversione "
+              f"({total_bytes / 1024 ** 2 / elapsed if elapsed else 0.0:.1f}MB/s)")
+
+    def _record_write(self, path: str, result: Tuple[int, float]) -> None:
+        size, seconds = result
+        stats = self._write_stats.setdefault(path, [0, 0.0])
+        stats[0] += size
+        stats[1] += seconds
+
+    def _open_written(self, path: str):
+        """Apre in lettura un file scritto da _write_frame (anche .gz)"""
+        if self.compress:
+            return gzip.open(path + '.gz', 'rb')
+        return open(path, 'rb')
+
+    def _add_quarter_columns(self, tx: pd.DataFrame) -> None:
+        """Aggiunge year e quarter da TX_DATETIME"""
+        tx['year'] = tx['TX_DATETIME'].dt.year
+        tx['quarter'] = tx['TX_DATETIME'].dt.quarter
+        if self.compact:
+            tx['year'] = tx['year'].astype(np.int16)
+            tx['quarter'] = tx['quarter'].astype(np.int8)
+
+    def _constant(self, value: str, n: int) -> Union[str, pd.Categorical]:
+        """Colonna costante (:LABEL, :TYPE): categorica a un livello in modalità compact"""
+        if self.compact:
+            return pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), [value])
+        return value
+
+    def _terminal_labels(self, terminal_ids: pd.Series) -> pd.Series:
+        """ID terminale esportato: 'T<n>' o l'intero n"""
+        if self.id_type == 'integer':
+            return terminal_ids.astype(np.int64)
+        return 'T' + terminal_ids.astype(str)
+
+    def _terminal_keys(self, terminal_ids: pd.Series) -> pd.Series:
+        """ID terminale 'T<n>' di ogni riga"""
+        if self.id_type == 'integer':
+            # Gli interi sono già compatti: nessuna stringa da condividere
+            return terminal_ids
+        if self.compact and len(terminal_ids) > 0:
+            # I codici sono gli stessi ID: le stringhe esistono una volta per terminale
+            codes = terminal_ids.to_numpy()
+            categories = 'T' + pd.Series(np.arange(codes.max() + 1)).astype(str)
+            return pd.Series(pd.Categorical.from_codes(codes, categories), index=terminal_ids.index)
+        return self._terminal_labels(terminal_ids)
+
+    def _quarter_medians(self, tx: pd.DataFrame) -> pd.DataFrame:
+        """Mediana di TX_AMOUNT per (TERMINAL_ID, year, quarter)"""
+        return (
+            tx.groupby(['TERMINAL_ID', 'year', 'quarter'])['TX_AMOUNT']
+            .median()
+            .reset_index(name='current_median')
+        )
+
+    def _quarter_nodes(self, median_q: pd.DataFrame) -> pd.DataFrame:
+        """Quarter nodes con prev_median e ID a partire dalle mediane"""
+        quarter_nodes = median_q.copy()
+
+        # 3. Calcola quarter precedente per OGNI riga
+        quarter_nodes['prev_year'] = quarter_nodes['year']
+        quarter_nodes['prev_quarter'] = quarter_nodes['quarter'] - 1
+
+        quarter_nodes.loc[quarter_nodes['prev_quarter'] == 0, 'prev_quarter'] = 4
+        quarter_nodes.loc[quarter_nodes['prev_quarter'] == 4, 'prev_year'] -= 1
+
+        # 4. Aggiungi prev_median (se esiste): chiave intera di periodo e merge
+        # con le mediane spostate di un trimestre in avanti
+        period = self._periods(quarter_nodes['year'], quarter_nodes['quarter'])
+        previous = pd.DataFrame({
+            'TERMINAL_ID': quarter_nodes['TERMINAL_ID'].to_numpy(),
+            'period': period + 1,
+            'prev_median': quarter_nodes['current_median'].to_numpy()
+        })
+        quarter_nodes['prev_median'] = pd.DataFrame({
+            'TERMINAL_ID': quarter_nodes['TERMINAL_ID'].to_numpy(),
+            'period': period
+        }).merge(previous, on=['TERMINAL_ID', 'period'], how='left')['prev_median'].to_numpy()
+
+        # 5. Crea ID Quarter (deve essere uguale a quello usato nelle transazioni!)
+        quarter_nodes['TERMINAL_ID_STR'] = self._terminal_labels(quarter_nodes['TERMINAL_ID'])
+        quarter_nodes['quarterId:ID(Quarter)'] = self._quarter_labels(quarter_nodes)
+        return quarter_nodes
+
+    def _add_outliers(self, tx: pd.DataFrame, median_q: Optional[pd.DataFrame]) -> None:
+        """
+        Aggiunge outlier_ratio (amount / mediana del quarter precedente dello
+        stesso terminale, NaN se manca o non è positiva) e potential_outlier
+        (ratio > OUTLIER_THRESHOLD), come il filtro di q1b
+        """
+        period = self._periods(tx['year'], tx['quarter'])
+        prev_median = np.full(len(tx), np.nan)
+        if median_q is not None and len(median_q) > 0:
+            # Mediane indicizzate per (terminale, trimestre successivo)
+            previous = pd.DataFrame({
+                'TERMINAL_ID': median_q['TERMINAL_ID'].to_numpy(np.int64),
+                'period': self._periods(median_q['year'], median_q['quarter']) + 1,
+                'prev_median': median_q['current_median'].to_numpy()
+            })
+            prev_median = pd.DataFrame({
+                'TERMINAL_ID': tx['TERMINAL_ID'].to_numpy(np.int64),
+                'period': period
+            }).merge(previous, on=['TERMINAL_ID', 'period'], how='left')['prev_median'].to_numpy()
+
+        valid = prev_median > 0
+        ratio = np.full(len(tx), np.nan)
+        ratio[valid] = tx['TX_AMOUNT'].to_numpy(np.float64)[valid] / prev_median[valid]
+        tx['outlier_ratio'] = ratio
+        tx['potential_outlier'] = valid & (ratio > OUTLIER_THRESHOLD)
+
+    def _periods(self, year: pd.Series, quarter: pd.Series) -> np.ndarray:
+        """Indice intero del trimestre: trimestri consecutivi differiscono di 1"""
+        return year.to_numpy(np.int64) * 4 + quarter.to_numpy(np.int64) - 1
+
+    def _quarter_labels(self, quarters: pd.DataFrame) -> pd.Series:
+        """ID 'T<terminale>_Y<anno>_Q<trimestre>' da TERMINAL_ID, year, quarter"""
+        if self.id_type == 'integer':
+            offset = self._periods(quarters['year'], quarters['quarter']) - QUARTER_ID_EPOCH
+            if len(offset) and (offset.min() < 0 or offset.max() >= QUARTER_ID_STRIDE):
+                raise ValueError("Trimestri fuori dal range degli ID interi dei quarter")
+            return pd.Series(
+                quarters['TERMINAL_ID'].to_numpy(np.int64) * QUARTER_ID_STRIDE + offset,
+                index=quarters.index
+            )
+        return (
+            'T' + quarters['TERMINAL_ID'].astype(str)
+            + '_Y' + quarters['year'].astype(str)
+            + '_Q' + quarters['quarter'].astype(str)
+        )
+
+    def _quarter_ids(self, tx: pd.DataFrame) -> pd.Series:
+        """quarter_id di ogni transazione, uguale a quarterId:ID(Quarter)"""
+        if len(tx) == 0:
+            return pd.Series([], index=tx.index, dtype=object)
+
+        # Chiave intera (terminale, trimestre): l'ID viene formattato una volta
+        # per quarter distinto e distribuito alle transazioni per codice
+        period = self._periods(tx['year'], tx['quarter'])
+        first_period = period.min()
+        span = period.max() - first_period + 1
+        keys = tx['TERMINAL_ID'].to_numpy(np.int64) * span + (period - first_period)
+        unique_keys, codes = np.unique(keys, return_inverse=True)
+        codes = codes.ravel()
+        periods = unique_keys % span + first_period
+        labels = self._quarter_labels(pd.DataFrame({
+            'TERMINAL_ID': unique_keys // span,
+            'year': periods // 4,
+            'quarter': periods % 4 + 1
+        }))
+
+        if self.compact and self.id_type == 'string':
+            return pd.Series(pd.Categorical.from_codes(codes, labels), index=tx.index)
+        return pd.Series(labels.to_numpy()[codes], index=tx.index)
+
+    def _write_customers(self, customers: pd.DataFrame, total_tx: pd.DataFrame,
+                         output_folder: str) -> None:
         customers_df = (
             customers
             .merge(total_tx, on='CUSTOMER_ID', how='left')
@@ -97,26 +705,23 @@ class Converters:
         })
 
         customers_csv[':LABEL'] = 'Customer'
-        customers_csv.to_csv(f'{output_folder}/customers.csv', index=False)
-
-        # =====================================================
-        # 2. TERMINALS
-        # =====================================================
-        terminals['TERMINAL_ID'] = 'T' + terminals['TERMINAL_ID'].astype(str)
+        self._write_frame(customers_csv, f'{output_folder}/customers.csv')
 
+    def _write_terminals(self, terminals: pd.DataFrame, output_folder: str) -> None:
         terminals_csv = terminals.rename(columns={
             'TERMINAL_ID': 'terminalId:ID(Terminal)',
             'x_terminal_id': 'x',
             'y_terminal_id': 'y'
         })
 
+        terminals_csv['terminalId:ID(Terminal)'] = self._terminal_labels(terminals_csv['terminalId:ID(Terminal)'])
         terminals_csv[':LABEL'] = 'Terminal'
         terminals_csv = terminals_csv[['terminalId:ID(Terminal)', 'x', 'y', ':LABEL']]
-        terminals_csv.to_csv(f'{output_folder}/terminals.csv', index=False)
+        self._write_frame(terminals_csv, f'{output_folder}/terminals.csv')
 
-        # =====================================================
-        # 2b. QUARTER NODES
-        # =====================================================
+    def _write_quarters(self, quarter_nodes: pd.DataFrame,
+                        output_folder: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Scrive quarters.csv e terminal_quarter.csv"""
         # Crea CSV Quarter - SOLO colonne essenziali
         quarter_csv = quarter_nodes[[
             'quarterId:ID(Quarter)',
@@ -125,76 +730,21 @@ class Converters:
             'current_median',
             'prev_median'
         ]].copy()
-        
+
         quarter_csv[':LABEL'] = 'Quarter'
-        quarter_csv.to_csv(f'{output_folder}/quarters.csv', index=False)
-        
-        print(f"\nPrime 5 Quarter nodes:")
-        print(quarter_csv.head())
+        self._write_frame(quarter_csv, f'{output_folder}/quarters.csv')
 
-        # =====================================================
-        # 2c. TERMINAL -> QUARTER (RELAZIONE)
-        # =====================================================
         terminal_quarter_rel = pd.DataFrame({
             ':START_ID(Terminal)': quarter_nodes['TERMINAL_ID_STR'],
             ':END_ID(Quarter)': quarter_nodes['quarterId:ID(Quarter)'],
             ':TYPE': 'HAS_QUARTER'
         })
-        
-        terminal_quarter_rel = terminal_quarter_rel.drop_duplicates()
-        terminal_quarter_rel.to_csv(f'{output_folder}/terminal_quarter.csv', index=False)
 
-        # =====================================================
-        # 3. TRANSACTIONS - DEVE usare lo STESSO quarter_id!
-        # =====================================================
-        # Crea quarter_id PERFETTAMENTE UGUALI a quelli in quarter_nodes
-        tx['quarter_id'] = tx.apply(
-            lambda r: f"T{r['TERMINAL_ID']}_Y{r['year']}_Q{r['quarter']}",
-            axis=1
-        )
-        
-        # VERIFICA: tutte le transazioni hanno un quarter_id valido?
-        valid_quarter_ids = set(quarter_nodes['quarterId:ID(Quarter)'])
-        tx['has_valid_quarter'] = tx['quarter_id'].isin(valid_quarter_ids)
-        
-        print(f"\nTransazioni totali: {len(tx)}")
-        print(f"Transazioni con quarter_id valido: {tx['has_valid_quarter'].sum()}")
-        print(f"Transazioni senza quarter_id valido: {len(tx) - tx['has_valid_quarter'].sum()}")
-        
-        # Mostra transazioni problematiche
-        if not tx['has_valid_quarter'].all():
-            problematic = tx[~tx['has_valid_quarter']]
-            print("\nTransazioni problematiche (prime 5):")
-            print(problematic[['TRANSACTION_ID', 'TERMINAL_ID', 'year', 'quarter', 'quarter_id']].head())
-            
-            # Crea Quarter nodes mancanti per queste transazioni
-            missing_quarters = problematic[['TERMINAL_ID', 'year', 'quarter']].drop_duplicates()
-            print(f"\nCreazione di {len(missing_quarters)} quarter nodes mancanti...")
-            
-            for _, row in missing_quarters.iterrows():
-                quarter_id = f"T{row['TERMINAL_ID']}_Y{row['year']}_Q{row['quarter']}"
-                new_quarter = pd.DataFrame([{
-                    'quarterId:ID(Quarter)': quarter_id,
-                    'year': row['year'],
-                    'quarter': row['quarter'],
-                    'current_median': 0.0,  # Default
-                    'prev_median': None,
-                    ':LABEL': 'Quarter'
-                }])
-                quarter_csv = pd.concat([quarter_csv, new_quarter], ignore_index=True)
-                
-                # Aggiungi relazione Terminal->Quarter
-                new_rel = pd.DataFrame([{
-                    ':START_ID(Terminal)': f"T{row['TERMINAL_ID']}",
-                    ':END_ID(Quarter)': quarter_id,
-                    ':TYPE': 'HAS_QUARTER'
-                }])
-                terminal_quarter_rel = pd.concat([terminal_quarter_rel, new_rel], ignore_index=True)
-            
-            # Salva versioni aggiornate
-            quarter_csv.to_csv(f'{output_folder}/quarters.csv', index=False)
-            terminal_quarter_rel.to_csv(f'{output_folder}/terminal_quarter.csv', index=False)
+        terminal_quarter_rel = terminal_quarter_rel.drop_duplicates()
+        self._write_frame(terminal_quarter_rel, f'{output_folder}/terminal_quarter.csv')
+        return quarter_csv, terminal_quarter_rel
 
+    def _transactions_csv(self, tx: pd.DataFrame) -> pd.DataFrame:
         transactions_csv = tx[[
             'TRANSACTION_ID',
             'TX_AMOUNT',
@@ -207,27 +757,25 @@ class Converters:
             'TX_FRAUD': 'fraud'
         })
 
-        transactions_csv[':LABEL'] = 'Transaction'
-        transactions_csv.to_csv(f'{output_folder}/transactions.csv', index=False)
+        if self.outliers:
+            # Proprietà tipizzate per neo4j-admin; campo vuoto = proprietà assente,
+            # quindi potentialOutlier esiste solo sugli outlier come dopo q1b
+            transactions_csv['outlier_ratio:float'] = tx['outlier_ratio'].to_numpy()
+            transactions_csv['potentialOutlier:boolean'] = pd.Categorical.from_codes(
+                np.where(tx['potential_outlier'].to_numpy(), 0, -1).astype(np.int8), ['true']
+            )
 
-        # =====================================================
-        # 3b. TRANSAZIONE -> QUARTER (SOLO relazioni valide!)
-        # =====================================================
-        # Filtra SOLO transazioni con quarter_id valido
-        tx_valid = tx[tx['has_valid_quarter']].copy()
-        
-        transaction_quarter_rel = pd.DataFrame({
+        transactions_csv[':LABEL'] = self._constant('Transaction', len(transactions_csv))
+        return transactions_csv
+
+    def _transaction_quarter_rel(self, tx_valid: pd.DataFrame) -> pd.DataFrame:
+        return pd.DataFrame({
             ':START_ID(Transaction)': tx_valid['TRANSACTION_ID'],
             ':END_ID(Quarter)': tx_valid['quarter_id'],
-            ':TYPE': 'IN_QUARTER'
+            ':TYPE': self._constant('IN_QUARTER', len(tx_valid))
         })
-        
-        transaction_quarter_rel.to_csv(f'{output_folder}/transaction_quarter.csv', index=False)
-        print(f"Relazioni Transaction->Quarter create: {len(transaction_quarter_rel)}")
 
-        # =====================================================
-        # 4. CUSTOMER -> TRANSACTION
-        # =====================================================
+    def _cust_tx_rel(self, transactions: pd.DataFrame) -> pd.DataFrame:
         cust_tx = transactions[[
             'CUSTOMER_ID',
             'TRANSACTION_ID'
@@ -236,39 +784,30 @@ class Converters:
             'TRANSACTION_ID': ':END_ID(Transaction)'
         })
 
-        cust_tx[':TYPE'] = 'MADE_TRANSACTION'
-        cust_tx.to_csv(f'{output_folder}/cust_tx.csv', index=False)
+        cust_tx[':TYPE'] = self._constant('MADE_TRANSACTION', len(cust_tx))
+        return cust_tx
 
-        # =====================================================
-        # 5. TRANSACTION -> TERMINAL
-        # =====================================================
+    def _tx_term_rel(self, transactions: pd.DataFrame) -> pd.DataFrame:
         tx_term = transactions[[
             'TRANSACTION_ID',
             'TERMINAL_ID'
         ]].copy()
 
-        tx_term['TERMINAL_ID'] = 'T' + tx_term['TERMINAL_ID'].astype(str)
+        tx_term['TERMINAL_ID'] = self._terminal_keys(tx_term['TERMINAL_ID'])
 
         tx_term = tx_term.rename(columns={
             'TRANSACTION_ID': ':START_ID(Transaction)',
             'TERMINAL_ID': ':END_ID(Terminal)'
         })
 
-        tx_term[':TYPE'] = 'AT_TERMINAL'
-        tx_term.to_csv(f'{output_folder}/tx_term.csv', index=False)
-
-        # =====================================================
-        # 6. CUSTOMER -> TERMINAL (USED_TERMINAL)
-        # =====================================================
-        used_terminal = (
-            transactions
-            .groupby(['CUSTOMER_ID', 'TERMINAL_ID'])
-            .size()
-            .reset_index(name='tx_count')
-        )
+        tx_term[':TYPE'] = self._constant('AT_TERMINAL', len(tx_term))
+        return tx_term
 
+    def _write_used_terminal(self, used_terminal: pd.DataFrame, output_folder: str) -> None:
+        """Scrive used_terminal.csv da (CUSTOMER_ID, TERMINAL_ID, tx_count)"""
+        used_terminal = used_terminal.copy()
         used_terminal[':START_ID(Customer)'] = used_terminal['CUSTOMER_ID']
-        used_terminal[':END_ID(Terminal)'] = 'T' + used_terminal['TERMINAL_ID'].astype(str)
+        used_terminal[':END_ID(Terminal)'] = self._terminal_labels(used_terminal['TERMINAL_ID'])
         used_terminal[':TYPE'] = 'USED_TERMINAL'
 
         used_terminal_csv = used_terminal[[
@@ -278,60 +817,76 @@ class Converters:
             ':TYPE'
         ]]
 
-        used_terminal_csv.to_csv(f'{output_folder}/used_terminal.csv', index=False)
-
-        # =====================================================
-        # 7. CUSTOMER ↔ CUSTOMER (SHARES_TERMINAL)
-        # =====================================================
-        cust_term_map = (
-            transactions
-            .groupby('CUSTOMER_ID')['TERMINAL_ID']
-            .apply(set)
-            .to_dict()
-        )
-
-        shares_records = []
-        customer_ids = list(cust_term_map.keys())
-
-        for i, c1 in enumerate(customer_ids):
-            for c2 in customer_ids[i + 1:]:
-                shared = cust_term_map[c1] & cust_term_map[c2]
-                for t in shared:
-                    shares_records.append({
-                        ':START_ID(Customer)': c1,
-                        ':END_ID(Customer)': c2,
-                        'terminal_id': f'T{t}',
-                        ':TYPE': 'SHARES_TERMINAL'
-                    })
-
-        pd.DataFrame(shares_records).to_csv(
-            f'{output_folder}/shares_terminal.csv',
-            index=False
-        )
-
-        # =====================================================
-        # VERIFICA FINALE
-        # =====================================================
-        print(f"\n✅ CONVERSIONE COMPLETATA")
-        print(f"Cartella: {output_folder}")
-        
-        # Verifica consistenza
-        print("\n=== VERIFICA CONSISTENZA ===")
-        quarters_set = set(quarter_csv['quarterId:ID(Quarter)'])
-        tx_quarters_set = set(tx['quarter_id'].unique())
-        
-        print(f"Quarter nodes nel file: {len(quarters_set)}")
-        print(f"Quarter unici nelle transazioni: {len(tx_quarters_set)}")
-        
-        missing = tx_quarters_set - quarters_set
-        if missing:
-            print(f"⚠️  Quarter mancanti in nodes: {len(missing)}")
-            print(f"Esempi: {list(missing)[:5]}")
-        else:
-            print("✅ Tutti i quarter delle transazioni hanno un nodo corrispondente")
-        
-        # Verifica relazioni
-        rel_df = pd.read_csv(f'{output_folder}/transaction_quarter.csv')
-        print(f"\nRelazioni Transaction->Quarter: {len(rel_df)}")
-
-        return output_folder
\ No newline at end of file
+        self._write_frame(used_terminal_csv, f'{output_folder}/used_terminal.csv')
+
+    def _write_shares_terminal(self, used_terminal: pd.DataFrame, output_folder: str,
+                               chunk_rows: int = SHARES_CHUNK_ROWS) -> None:
+        """
+        Scrive shares_terminal.csv: una riga (c1, c2, t) per ogni coppia di
+        customer c1 < c2 che usano lo stesso terminale t.
+
+        Le coppie vengono enumerate dall'indice invertito terminale -> customer,
+        quindi il costo dipende solo dalle coppie che esistono davvero. Le righe
+        sono prodotte ordinate per (c1, c2, t) in array colonnari e scritte a
+        blocchi di circa chunk_rows righe, spezzati sui cambi di c1.
+        """
+        path = f'{output_folder}/shares_terminal.csv'
+        columns = [':START_ID(Customer)', ':END_ID(Customer)', 'terminal_id', ':TYPE']
+
+        pairs = used_terminal[['CUSTOMER_ID', 'TERMINAL_ID']].to_numpy(np.int64)
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        customers = pairs[:, 0]
+        terminals = pairs[:, 1]
+        n_rows = len(pairs)
+
+        if n_rows == 0:
+            self._write_frame(pd.DataFrame(columns=columns), path)
+            return
+
+        # Indice invertito: customer di ogni terminale, in ordine crescente
+        by_terminal = np.lexsort((customers, terminals))
+        terminal_customers = customers[by_terminal]
+        position = np.empty(n_rows, dtype=np.int64)
+        position[by_terminal] = np.arange(n_rows)
+        group_end = np.searchsorted(terminals[by_terminal], terminals, side='right')
+        # Per ogni (c1, t) i partner c2 > c1 seguono c1 nella lista di t
+        n_partners = group_end - position - 1
+
+        terminal_labels = self._terminal_labels(pd.Series(np.arange(terminals.max() + 1)))
+        cumulative = np.concatenate([[0], np.cumsum(n_partners)])
+        bounds = np.append(np.flatnonzero(np.diff(customers, prepend=-1)), n_rows)
+        bound_rows = cumulative[bounds]
+
+        append = False
+        i = 0
+        while i < len(bounds) - 1:
+            # Blocco di customer interi con al più chunk_rows coppie (almeno uno)
+            j = np.searchsorted(bound_rows, bound_rows[i] + chunk_rows, side='right') - 1
+            j = max(j, i + 1)
+            start, end = bounds[i], bounds[j]
+            i = j
+
+            counts = n_partners[start:end]
+            total = counts.sum()
+            if total == 0:
+                continue
+            offsets = np.cumsum(counts) - counts
+            partner = np.arange(total) - np.repeat(offsets - position[start:end] - 1, counts)
+
+            c1 = np.repeat(customers[start:end], counts)
+            c2 = terminal_customers[partner]
+            t = np.repeat(terminals[start:end], counts)
+            order = np.lexsort((t, c2, c1))
+
+            shares = pd.DataFrame({
+                ':START_ID(Customer)': c1[order],
+                ':END_ID(Customer)': c2[order],
+                'terminal_id': (t[order] if self.id_type == 'integer'
+                                else pd.Categorical.from_codes(t[order], terminal_labels)),
+                ':TYPE': pd.Categorical.from_codes(np.zeros(total, dtype=np.int8), ['SHARES_TERMINAL'])
+            })
+            self._write_frame(shares, path, append)
+            append = True
+
+        if not append:
+            self._write_frame(pd.DataFrame(columns=columns), path)
@@ -0,0 +1,343 @@
+"""Delta di nuovi giorni di transazioni: CSV delle sole differenze e ingestione online"""
+
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import pandas as pd
+
+from original import add_frauds, generate_profiles, generate_transactions_batch, compact_dtypes
+from manager import Neo4jManager
+
+
+# Stato del dataset (parametri e numero di transazioni) scritto accanto ai CSV
+STATE_FILE = 'dataset.json'
+
+START_DATE = "2018-04-01"
+
+# Una transazione del giorno d dipende dalle finestre dello scenario 2 iniziate
+# fino a 27 giorni prima e da quelle dello scenario 3 fino a 13 giorni prima;
+# la popolazione di queste ultime parte a sua volta da d - 13 - 13. Rigenerando
+# da d - 40 le transazioni dal giorno d in poi sono identiche al dataset completo
+FRAUD_REACH_DAYS = 27 + 13
+
+# Una finestra dello scenario 3 iniziata dopo base_days - 14 include giorni nuovi:
+# la scelta delle transazioni cambia e con essa importi e frodi dei giorni vecchi
+SCENARIO_3_DAYS = 14
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Chiavi di row che contengono ID: interi se il dataset usa id_type integer
+ID_KEYS = ('id', 'customer', 'terminal', 'tx', 'quarter')
+
+
+def write_state(folder: str, state: Dict[str, Any]) -> None:
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, STATE_FILE), 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+def read_state(folder: str) -> Dict[str, Any]:
+    path = os.path.join(folder, STATE_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Stato del dataset non trovato in {folder} (manca {STATE_FILE})")
+    with open(path) as f:
+        return json.load(f)
+
+
+@dataclass
+class Delta:
+    """Transazioni della finestra rigenerata prima e dopo i nuovi giorni"""
+    before: pd.DataFrame
+    after: pd.DataFrame
+    base_days: int
+    nb_days: int
+    changed_from: int
+    n_transactions: int
+
+
+def delta_window(base_days: int, start_date: str = START_DATE) -> Tuple[int, int, int]:
+    """
+    Giorni da rigenerare per passare da base_days giorni a più giorni
+
+    Returns:
+        Tuple (primo giorno generato, primo giorno dei quarter ricalcolati,
+        primo giorno le cui transazioni possono cambiare)
+    """
+    start = pd.Timestamp(start_date)
+    changed_from = max(0, base_days - SCENARIO_3_DAYS + 1)
+    # Le mediane cambiano dal quarter di changed_from; serve anche il quarter
+    # precedente per prev_median
+    previous_quarter = (start + pd.Timedelta(days=changed_from)).to_period('Q') - 1
+    quarters_from = max(0, (previous_quarter.start_time - start).days)
+    return max(0, quarters_from - FRAUD_REACH_DAYS), quarters_from, changed_from
+
+
+def generate_delta(state: Dict[str, Any], nb_days: int, compact: bool = False) -> Delta:
+    """
+    Rigenera solo la finestra di giorni che i nuovi giorni possono toccare
+
+    Le transazioni sono deterministiche per (customer, blocco di giorni) e le
+    frodi di un giorno dipendono solo dalle finestre vicine, quindi la finestra
+    viene generata due volte (fino a base_days e fino a nb_days): le due
+    versioni coincidono con le code del dataset di partenza e di quello
+    completo. Il costo dipende dai giorni nuovi, non dalla storia.
+
+    Args:
+        state: Stato del dataset di partenza (read_state)
+        nb_days: Giorni totali dopo il delta
+        compact: Tipi ridotti come generate --compact
+    """
+    base_days = state['nb_days']
+    start_date = state.get('start_date', START_DATE)
+    if nb_days <= base_days:
+        raise ValueError(f"Il dataset ha già {base_days} giorni (richiesti {nb_days})")
+
+    first_day, quarters_from, changed_from = delta_window(base_days, start_date)
+    print(f"Delta giorni {base_days}..{nb_days - 1} (rigenerati dal giorno {first_day})")
+
+    customers, terminals = generate_profiles(
+        n_customers=state['n_customers'],
+        n_terminals=state['n_terminals'],
+        compact=compact
+    )
+
+    start_time = time.time()
+    window = generate_transactions_batch(
+        customers, start_date=start_date, nb_days=nb_days, first_day=first_day, compact=compact
+    )
+    # Stesso ordinamento di generate_transactions: la finestra è una coda del dataset
+    window = window.sort_values('TX_DATETIME', kind='stable').reset_index(drop=True)
+    first_id = state['n_transactions'] - int((window['TX_TIME_DAYS'] < base_days).sum())
+    window.insert(0, 'TRANSACTION_ID', first_id + window.index.values)
+    if compact:
+        compact_dtypes(window)
+    print("Time to generate delta window: {0:.2}s".format(time.time() - start_time))
+
+    before = add_frauds(customers, terminals, window[window['TX_TIME_DAYS'] < base_days].copy(),
+                        compact=compact, first_day=first_day)
+    after = add_frauds(customers, terminals, window, compact=compact, first_day=first_day)
+
+    # Solo i giorni con valori definitivi: quarter ricalcolati in poi
+    return Delta(
+        before=before[before['TX_TIME_DAYS'] >= quarters_from],
+        after=after[after['TX_TIME_DAYS'] >= quarters_from],
+        base_days=base_days,
+        nb_days=nb_days,
+        changed_from=changed_from,
+        n_transactions=first_id + len(after)
+    )
+
+
+# =====================================================
+# INGESTIONE ONLINE
+# =====================================================
+
+# (file, colonne -> chiavi di row, query): nell'ordine di applicazione.
+# Le proprietà restano stringhe come dopo neo4j-admin import
+DELTA_STEPS: List[Tuple[str, Dict[str, str], str]] = [
+    ('quarters.csv', {
+        'quarterId:ID(Quarter)': 'id', 'year': 'year', 'quarter': 'quarter',
+        'current_median': 'current_median', 'prev_median': 'prev_median'
+    }, """
+        UNWIND $rows AS row
+        MERGE (q:Quarter {quarterId: row.id})
+        SET q.year = row.year, q.quarter = row.quarter,
+            q.current_median = row.current_median, q.prev_median = row.prev_median
+    """),
+    ('terminal_quarter.csv', {':START_ID(Terminal)': 'terminal', ':END_ID(Quarter)': 'quarter'}, """
+        UNWIND $rows AS row
+        MATCH (t:Terminal {terminalId: row.terminal})
+        MATCH (q:Quarter {quarterId: row.quarter})
+        MERGE (t)-[:HAS_QUARTER]->(q)
+    """),
+    # outlier_ratio e potentialOutlier ci sono solo con generate --outliers:
+    # senza colonne le proprietà restano assenti
+    ('transactions.csv', {
+        'transactionId:ID(Transaction)': 'id', 'amount': 'amount',
+        'datetime': 'datetime', 'fraud': 'fraud',
+        'outlier_ratio:float': 'outlier_ratio', 'potentialOutlier:boolean': 'outlier'
+    }, """
+        UNWIND $rows AS row
+        MERGE (tx:Transaction {transactionId: row.id})
+        SET tx.amount = row.amount, tx.datetime = row.datetime, tx.fraud = row.fraud,
+            tx.outlier_ratio = toFloat(row.outlier_ratio),
+            tx.potentialOutlier = CASE WHEN row.outlier = 'true' THEN true END
+    """),
+    ('transactions_updated.csv', {
+        'transactionId:ID(Transaction)': 'id', 'amount': 'amount', 'fraud': 'fraud',
+        'outlier_ratio:float': 'outlier_ratio', 'potentialOutlier:boolean': 'outlier'
+    }, """
+        UNWIND $rows AS row
+        MATCH (tx:Transaction {transactionId: row.id})
+        SET tx.amount = row.amount, tx.fraud = row.fraud,
+            tx.outlier_ratio = toFloat(row.outlier_ratio),
+            tx.potentialOutlier = CASE WHEN row.outlier = 'true' THEN true END
+    """),
+    ('cust_tx.csv', {':START_ID(Customer)': 'customer', ':END_ID(Transaction)': 'tx'}, """
+        UNWIND $rows AS row
+        MATCH (c:Customer {customerId: row.customer})
+        MATCH (tx:Transaction {transactionId: row.tx})
+        MERGE (c)-[:MADE_TRANSACTION]->(tx)
+    """),
+    ('tx_term.csv', {':START_ID(Transaction)': 'tx', ':END_ID(Terminal)': 'terminal'}, """
+        UNWIND $rows AS row
+        MATCH (tx:Transaction {transactionId: row.tx})
+        MATCH (t:Terminal {terminalId: row.terminal})
+        MERGE (tx)-[:AT_TERMINAL]->(t)
+    """),
+    ('transaction_quarter.csv', {':START_ID(Transaction)': 'tx', ':END_ID(Quarter)': 'quarter'}, """
+        UNWIND $rows AS row
+        MATCH (tx:Transaction {transactionId: row.tx})
+        MATCH (q:Quarter {quarterId: row.quarter})
+        MERGE (tx)-[:IN_QUARTER]->(q)
+    """),
+    # Gli incrementi dei contatori non sono idempotenti: tx_delta, scritto nella
+    # stessa transazione del batch, salta le righe già applicate da una run
+    # interrotta a metà passo
+    ('customer_tx_count.csv', {'customerId': 'customer', 'tx_count': 'tx_count'}, """
+        UNWIND $rows AS row
+        MATCH (c:Customer {customerId: row.customer})
+        WHERE coalesce(c.tx_delta, '') <> $delta
+        SET c.total_tx_count = CASE
+            WHEN c.total_tx_count CONTAINS '.'
+            THEN toString(toFloat(c.total_tx_count) + toInteger(row.tx_count))
+            ELSE toString(coalesce(toInteger(c.total_tx_count), 0) + toInteger(row.tx_count))
+        END,
+            c.tx_delta = $delta
+    """),
+    # Le coppie nuove vengono marcate con l'ID del delta (delta) per creare
+    # SHARES_TERMINAL una sola volta per coppia di customer; tx_delta è
+    # separato e protegge l'incremento di tx_count
+    ('used_terminal.csv', {':START_ID(Customer)': 'customer', ':END_ID(Terminal)': 'terminal',
+                           'tx_count': 'tx_count'}, """
+        UNWIND $rows AS row
+        MATCH (c:Customer {customerId: row.customer})
+        MATCH (t:Terminal {terminalId: row.terminal})
+        MERGE (c)-[u:USED_TERMINAL]->(t)
+        ON CREATE SET u.tx_count = row.tx_count, u.delta = $delta, u.tx_delta = $delta
+        ON MATCH SET u.tx_count = CASE
+            WHEN coalesce(u.tx_delta, '') = $delta THEN u.tx_count
+            ELSE toString(toInteger(u.tx_count) + toInteger(row.tx_count))
+        END,
+            u.tx_delta = $delta
+    """),
+    ('used_terminal.csv', {':START_ID(Customer)': 'customer', ':END_ID(Terminal)': 'terminal'}, """
+        UNWIND $rows AS row
+        MATCH (c:Customer {customerId: row.customer})-[u:USED_TERMINAL]->(t:Terminal {terminalId: row.terminal})
+        WHERE u.delta = $delta
+        MATCH (t)<-[v:USED_TERMINAL]-(other:Customer)
+        WHERE other <> c
+          AND (coalesce(v.delta, '') <> $delta OR toInteger(c.customerId) < toInteger(other.customerId))
+        WITH t, CASE WHEN toInteger(c.customerId) < toInteger(other.customerId)
+                     THEN [c, other] ELSE [other, c] END AS pair
+        WITH t, pair[0] AS c1, pair[1] AS c2
+        MERGE (c1)-[:SHARES_TERMINAL {terminal_id: toString(t.terminalId)}]->(c2)
+    """),
+    ('used_terminal.csv', {':START_ID(Customer)': 'customer', ':END_ID(Terminal)': 'terminal'}, """
+        UNWIND $rows AS row
+        MATCH (c:Customer {customerId: row.customer})-[u:USED_TERMINAL]->(t:Terminal {terminalId: row.terminal})
+        WHERE u.delta = $delta
+        REMOVE u.delta
+    """),
+]
+
+
+def read_delta_rows(path: str, columns: Dict[str, str], batch_size: int = DEFAULT_BATCH_SIZE,
+                    integer_keys: Iterable[str] = ()) -> Iterator[Dict[str, Any]]:
+    """
+    Righe di un CSV del delta come dizionari di stringhe, letto a blocchi.
+    Le chiavi in integer_keys (ID importati con --id-type=integer) sono interi
+    """
+    integer_keys = set(integer_keys)
+    if not os.path.exists(path) and os.path.exists(path + '.gz'):
+        path += '.gz'
+    # Le colonne assenti nel file non vengono passate (row.<chiave> è null)
+    for chunk in pd.read_csv(path, dtype=str, keep_default_na=False,
+                             usecols=lambda column: column in columns, chunksize=batch_size):
+        chunk = chunk.rename(columns=columns)
+        # Come neo4j-admin import: un campo vuoto non crea la proprietà
+        for row in chunk.to_dict('records'):
+            yield {key: (None if value == '' else int(value) if key in integer_keys else value)
+                   for key, value in row.items()}
+
+
+class DeltaIngestor:
+    """
+    Applica i CSV di un delta a un database in esecuzione
+
+    Ogni file viene inviato a batch di UNWIND/MERGE tramite Neo4jManager,
+    quindi il tempo dipende dalle righe del delta e non dalla storia. Un nodo
+    :DeltaImport con l'ID del delta, creato prima del primo passo, registra
+    i passi completati (steps) e la fine (completed): una nuova esecuzione
+    dopo un errore riparte dal primo passo non completato. Dentro un passo
+    i batch già scritti vengono riscritti, quindi ogni passo è idempotente;
+    gli incrementi dei contatori lo sono grazie a tx_delta.
+    """
+
+    def __init__(self, manager: Neo4jManager, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.manager = manager
+        self.batch_size = batch_size
+
+    def ingest(self, folder: str) -> bool:
+        """
+        Args:
+            folder: Cartella scritta da Converters.to_csv_delta
+
+        Returns:
+            True se il delta è stato applicato (o lo era già)
+        """
+        state = read_state(folder)
+        delta_id = f"{state['base_days']}-{state['nb_days']}"
+        integer_keys = ID_KEYS if state.get('id_type') == 'integer' else ()
+
+        marker = self.manager.run_cypher(
+            """
+            MERGE (d:DeltaImport {deltaId: $delta})
+            ON CREATE SET d.steps = 0, d.completed = false, d.nb_days = $nb_days
+            RETURN d.completed AS completed, coalesce(d.steps, 0) AS steps
+            """,
+            {'delta': delta_id, 'nb_days': state['nb_days']}, parser='list'
+        )
+        if not marker.success or not marker.data:
+            print(f"❌ Marker :DeltaImport non scritto: {marker.error}")
+            return False
+        if marker.data[0]['completed']:
+            print(f"Delta {delta_id} già applicato")
+            return True
+        done_steps = marker.data[0]['steps']
+
+        print(f"Ingestione delta {delta_id} da {folder}/ (batch da {self.batch_size} righe)")
+        start_time = time.perf_counter()
+        for step, (filename, columns, query) in enumerate(DELTA_STEPS):
+            if step < done_steps:
+                print(f"   {filename:<26} già applicato")
+                continue
+            rows = read_delta_rows(os.path.join(folder, filename), columns, self.batch_size,
+                                   integer_keys)
+            result = self.manager.write_batches(query, rows, self.batch_size, {'delta': delta_id})
+            if not result.success:
+                print(f"❌ {filename}: {result.error}")
+                return False
+            print(f"   {filename:<26} {result.data.rows:>9} righe {result.execution_time:7.2f}s "
+                  f"({result.data.rows_per_second:,.0f} righe/s, {result.data.retries} retry)")
+            if not self._mark(delta_id, "SET d.steps = $steps", {'steps': step + 1}):
+                return False
+
+        if not self._mark(delta_id, "SET d.completed = true", {}):
+            return False
+        print(f"Delta applicato in {time.perf_counter() - start_time:.2f}s")
+        return True
+
+    def _mark(self, delta_id: str, update: str, params: Dict[str, Any]) -> bool:
+        """Aggiorna il marker :DeltaImport; un errore interrompe l'ingestione"""
+        result = self.manager.run_cypher(
+            f"MATCH (d:DeltaImport {{deltaId: $delta}}) {update} RETURN d.deltaId AS id",
+            {'delta': delta_id, **params}, parser='single'
+        )
+        if not result.success or result.data is None:
+            print(f"❌ Marker :DeltaImport non aggiornato: {result.error}")
+            return False
+        return True
@@ -0,0 +1,66 @@
+"""Estensione delle transazioni (3.d) calcolata in Python e scritta a batch"""
+
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+
+from base import QueryResult
+from manager import Neo4jManager
+
+
+# Stessi valori e probabilità di queries/extend_transactions.cypher
+PAYMENT_METHODS = ['credit_card', 'mobile_payment', 'paypal', 'debit_card']
+PROMOTIONAL_OFFER_PROBABILITY = 0.3
+
+PENDING_TRANSACTIONS_QUERY = """
+MATCH (tx:Transaction)
+WHERE tx.payment_method IS NULL
+RETURN tx.transactionId AS id
+"""
+
+EXTEND_TRANSACTIONS_QUERY = """
+UNWIND $rows AS row
+MATCH (tx:Transaction {transactionId: row.id})
+SET tx.payment_method = row.payment_method,
+    tx.promotional_offer = row.promotional_offer,
+    tx.satisfaction_rating = row.satisfaction_rating
+"""
+
+
+def extension_rows(transaction_ids: Sequence, seed: Optional[int] = None) -> Iterator[Dict]:
+    """Righe per EXTEND_TRANSACTIONS_QUERY: attributi estratti in blocco con numpy"""
+    rng = np.random.default_rng(seed)
+    n = len(transaction_ids)
+    methods = rng.integers(0, len(PAYMENT_METHODS), n)
+    offers = rng.random(n) < PROMOTIONAL_OFFER_PROBABILITY
+    ratings = rng.integers(1, 6, n)
+    # tolist(): il driver accetta solo tipi Python, non scalari numpy
+    for tx_id, method, offer, rating in zip(transaction_ids, methods.tolist(),
+                                            offers.tolist(), ratings.tolist()):
+        yield {
+            'id': tx_id,
+            'payment_method': PAYMENT_METHODS[method],
+            'promotional_offer': offer,
+            'satisfaction_rating': rating
+        }
+
+
+def extend_transactions(manager: Neo4jManager, batch_size: int = 10000,
+                        parallelism: int = 4, seed: Optional[int] = None) -> QueryResult:
+    """
+    Aggiunge payment_method, promotional_offer e satisfaction_rating a tutte
+    le transazioni che non li hanno ancora
+
+    Gli ID da estendere vengono letti con una sola query, gli attributi
+    generati in Python e scritti con write_batches: ogni batch tocca
+    transazioni diverse, quindi i batch possono andare in parallelo.
+
+    Returns:
+        QueryResult di write_batches (WriteMetrics in data)
+    """
+    pending = manager.run_cypher(PENDING_TRANSACTIONS_QUERY, parser='columnar')
+    if not pending.success:
+        return pending
+    rows = extension_rows(pending.data['id'].tolist(), seed)
+    return manager.write_batches(EXTEND_TRANSACTIONS_QUERY, rows, batch_size,
+                                 parallelism=parallelism)
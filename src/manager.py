@@ -1,72 +1,138 @@
 """neo4j_manager/manager.py - Manager principale per Neo4j"""
 
-from typing import Dict, Any, Optional, Union
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Union
 import time
-from neo4j import GraphDatabase, Driver, Result
+from neo4j import GraphDatabase, Driver, Result, Session
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
 
-from base import Neo4jConfig, QueryResult, ResponseParser
-from parsers import DataFrameParser, ListParser, CountParser, SingleValueParser
+from base import Neo4jConfig, QueryResult, ResponseParser, WriteMetrics
+from parsers import default_parsers
+
+
+# Attesa prima della prima riesecuzione di un batch (raddoppia a ogni tentativo)
+RETRY_BACKOFF = 1.0
 
 
 class Neo4jManager:
-    """Gestisce connessione ed esecuzione query Neo4j"""
+    """
+    Gestisce connessione ed esecuzione query Neo4j
+    
+    La connessione non viene verificata prima di ogni query: il manager la
+    considera attiva finché il driver non segnala che il server non è
+    raggiungibile (ServiceUnavailable, SessionExpired), e solo allora la
+    query successiva riconnette. Con config.reuse_session le query usano la
+    stessa sessione invece di aprirne una per chiamata.
+    """
     
     def __init__(self, config: Optional[Neo4jConfig] = None):
         self.config = config or Neo4jConfig()
         self.driver: Optional[Driver] = None
+        self._alive = False
+        self._session: Optional[Session] = None
+        # Query con scritture eseguite da questo manager (invalida le cache dei risultati)
+        self.write_count = 0
         self._setup_parsers()
     
     def _setup_parsers(self):
         """Configura parser predefiniti"""
-        self.parsers = {
-            'dataframe': DataFrameParser(),
-            'list': ListParser(),
-            'count': CountParser(),
-            'single': SingleValueParser()
-        }
+        self.parsers = default_parsers()
     
     def connect(self) -> bool:
         """Stabilisce la connessione"""
+        if self.driver:
+            # Riconnessione dopo un errore: il pool precedente non serve più
+            self._close_session()
+            self.driver.close()
         try:
             self.driver = GraphDatabase.driver(
                 self.config.uri,
-                auth=(self.config.username, self.config.password)
+                auth=(self.config.username, self.config.password),
+                max_connection_pool_size=self.config.max_connection_pool_size,
+                connection_acquisition_timeout=self.config.connection_acquisition_timeout
             )
             
             # Test connessione
             with self.driver.session(database=self.config.database) as session:
                 session.run("RETURN 1").single()
             
+            self._alive = True
             print(f"✅ Connesso a Neo4j: {self.config.uri}")
             return True
             
         except Exception as e:
             print(f"❌ Errore connessione: {e}")
+            if self.driver:
+                self.driver.close()
             self.driver = None
+            self._alive = False
             return False
     
     def disconnect(self):
         """Chiude la connessione"""
+        self._close_session()
+        self._alive = False
         if self.driver:
             self.driver.close()
             self.driver = None
             print("🔌 Connessione chiusa")
     
     def is_connected(self) -> bool:
-        """Verifica se è connesso"""
+        """Verifica se è connesso (stato dell'ultima operazione, senza round trip)"""
+        return self.driver is not None and self._alive
+    
+    def ping(self) -> bool:
+        """Verifica la connessione con una query al server"""
         if not self.driver:
             return False
         try:
-            with self.driver.session() as session:
+            with self.driver.session(database=self.config.database) as session:
                 session.run("RETURN 1").single()
-            return True
+            self._alive = True
         except Exception:
-            return False
+            self._alive = False
+        return self._alive
+    
+    def _ensure_connected(self) -> bool:
+        """Riconnette solo se non c'è un driver o l'ultimo errore era di connessione"""
+        return self.is_connected() or self.connect()
+    
+    @contextmanager
+    def _session_scope(self) -> Iterator[Session]:
+        """Sessione per una query: quella riusata o una nuova chiusa all'uscita"""
+        if not self.config.reuse_session:
+            with self.driver.session(database=self.config.database) as session:
+                yield session
+            return
+        if self._session is None:
+            self._session = self.driver.session(database=self.config.database)
+        try:
+            yield self._session
+        except Exception:
+            # Una sessione con una transazione fallita non va riusata
+            self._close_session()
+            raise
+    
+    def _close_session(self) -> None:
+        if self._session is not None:
+            try:
+                self._session.close()
+            except Exception:
+                pass
+            self._session = None
+    
+    def _connection_error(self, error: Exception) -> None:
+        """Un errore di connessione fa riconnettere alla query successiva"""
+        if isinstance(error, (ServiceUnavailable, SessionExpired)):
+            self._alive = False
+            self._close_session()
     
     def run_cypher(self, 
                   query: str, 
                   params: Optional[Dict] = None,
-                  parser: Union[str, ResponseParser] = 'list') -> QueryResult:
+                  parser: Union[str, ResponseParser] = 'list',
+                  profile: bool = False) -> QueryResult:
         """
         Esegue una query Cypher
         
@@ -74,23 +140,24 @@ class Neo4jManager:
             query: Query Cypher da eseguire
             params: Parametri per la query
             parser: Nome parser o istanza ResponseParser
+            profile: Esegue la query con PROFILE e restituisce il piano
+                con db hits, righe e page cache per operatore
             
         Returns:
-            QueryResult con il risultato
+            QueryResult con il risultato e i tempi del server
         """
-        if not self.is_connected():
-            if not self.connect():
-                return QueryResult(
-                    success=False,
-                    error="Non connesso a Neo4j"
-                )
+        if not self._ensure_connected():
+            return QueryResult(
+                success=False,
+                error="Non connesso a Neo4j"
+            )
         
         start_time = time.time()
         params = params or {}
         
         try:
-            with self.driver.session(database=self.config.database) as session:
-                result = session.run(query, params)
+            with self._session_scope() as session:
+                result = session.run(f"PROFILE {query}" if profile else query, params)
                 
                 # Ottieni il parser
                 if isinstance(parser, str):
@@ -100,15 +167,22 @@ class Neo4jManager:
                 
                 # Parsing della risposta
                 data = response_parser.parse(result, query, params)
+                summary = result.consume()
+                if summary.counters.contains_updates:
+                    self.write_count += 1
                 
                 return QueryResult(
                     success=True,
                     data=data,
                     execution_time=time.time() - start_time,
-                    query=query
+                    query=query,
+                    result_available_after=summary.result_available_after,
+                    result_consumed_after=summary.result_consumed_after,
+                    profile=summary.profile if profile else None
                 )
                 
         except Exception as e:
+            self._connection_error(e)
             return QueryResult(
                 success=False,
                 error=str(e),
@@ -116,8 +190,173 @@ class Neo4jManager:
                 query=query
             )
     
+    def explain(self, query: str, params: Optional[Dict] = None) -> QueryResult:
+        """
+        Piano di esecuzione della query (EXPLAIN), senza eseguirla
+        
+        Returns:
+            QueryResult con l'albero di ResultSummary.plan in data
+        """
+        if not self._ensure_connected():
+            return QueryResult(
+                success=False,
+                error="Non connesso a Neo4j"
+            )
+        
+        start_time = time.time()
+        try:
+            with self._session_scope() as session:
+                plan = session.run(f"EXPLAIN {query}", params or {}).consume().plan
+            return QueryResult(
+                success=True,
+                data=plan,
+                execution_time=time.time() - start_time,
+                query=query
+            )
+        except Exception as e:
+            self._connection_error(e)
+            return QueryResult(
+                success=False,
+                error=str(e),
+                execution_time=time.time() - start_time,
+                query=query
+            )
+    
+    def write_batches(self,
+                      query: str,
+                      rows: Iterable[Dict],
+                      batch_size: int = 10000,
+                      params: Optional[Dict] = None,
+                      parallelism: int = 1,
+                      max_retries: int = 3) -> QueryResult:
+        """
+        Esegue una query di scrittura con UNWIND $rows a batch di righe
+        
+        Ogni batch è una transazione gestita dal driver (execute_write), che
+        ritenta già gli errori transitori; un batch che fallisce comunque per
+        un errore ritentabile viene rieseguito fino a max_retries volte con
+        una sessione nuova. Con parallelism > 1 i batch vengono scritti da
+        più thread, ognuno con la propria sessione: adatto a batch che
+        toccano nodi diversi, altrimenti i lock rendono i retry frequenti.
+        
+        Args:
+            query: Query Cypher che legge le righe da $rows
+            rows: Righe (dizionari), anche un generatore
+            batch_size: Righe per transazione
+            params: Parametri aggiuntivi, uguali per ogni batch
+            parallelism: Batch scritti contemporaneamente
+            max_retries: Riesecuzioni di un batch dopo che il driver ha rinunciato
+            
+        Returns:
+            QueryResult con WriteMetrics (righe, batch, retry, throughput) in data
+        """
+        if not self._ensure_connected():
+            return QueryResult(
+                success=False,
+                error="Non connesso a Neo4j"
+            )
+        
+        start_time = time.time()
+        metrics = WriteMetrics()
+        params = params or {}
+        
+        def done(batch: List[Dict], retries: int) -> None:
+            metrics.rows += len(batch)
+            metrics.batches += 1
+            metrics.retries += retries
+        
+        try:
+            if parallelism <= 1:
+                for batch in self._batches(rows, batch_size):
+                    done(batch, self._write_batch(query, batch, params, max_retries, True))
+            else:
+                with ThreadPoolExecutor(max_workers=parallelism) as pool:
+                    # Al massimo 2 batch in coda per thread: le righe restano uno stream
+                    pending = {}
+                    try:
+                        for batch in self._batches(rows, batch_size):
+                            if len(pending) >= 2 * parallelism:
+                                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                                for future in finished:
+                                    done(pending.pop(future), future.result())
+                            future = pool.submit(self._write_batch, query, batch, params,
+                                                 max_retries, False)
+                            pending[future] = batch
+                        for future in as_completed(list(pending)):
+                            done(pending.pop(future), future.result())
+                    finally:
+                        for future in pending:
+                            future.cancel()
+            
+            metrics.seconds = time.time() - start_time
+            if metrics.rows:
+                self.write_count += 1
+            return QueryResult(
+                success=True,
+                data=metrics,
+                execution_time=metrics.seconds,
+                query=query
+            )
+            
+        except Exception as e:
+            self._connection_error(e)
+            if metrics.rows:
+                self.write_count += 1
+            metrics.seconds = time.time() - start_time
+            return QueryResult(
+                success=False,
+                data=metrics,
+                error=str(e),
+                execution_time=metrics.seconds,
+                query=query
+            )
+    
+    @staticmethod
+    def _batches(rows: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+        batch: List[Dict] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def _write_batch(self, query: str, batch: List[Dict], params: Dict,
+                     max_retries: int, shared_session: bool) -> int:
+        """
+        Scrive un batch in una transazione
+        
+        Returns:
+            Tentativi oltre il primo (retry del driver e di questo metodo)
+        """
+        attempts = 0
+        
+        def work(tx):
+            nonlocal attempts
+            attempts += 1
+            tx.run(query, {**params, 'rows': batch}).consume()
+        
+        for retry in range(max_retries + 1):
+            try:
+                # I thread paralleli non possono usare la sessione riusata
+                scope = (self._session_scope() if shared_session
+                         else self.driver.session(database=self.config.database))
+                with scope as session:
+                    session.execute_write(work)
+                return attempts - 1
+            except (ServiceUnavailable, SessionExpired, TransientError):
+                if retry == max_retries:
+                    raise
+                time.sleep(RETRY_BACKOFF * 2 ** retry)
+    
     def register_parser(self, name: str, parser: ResponseParser):
-        """Registra un nuovo parser"""
+        """
+        Registra un nuovo parser
+
+        Es. register_parser('q1b_file', SinkParser('results/query_3b.csv'))
+        per scrivere il risultato su file senza tenerlo in memoria
+        """
         self.parsers[name] = parser
     
     def __enter__(self):
@@ -4,40 +4,34 @@ import datetime
 import time
 import random
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 def generate_customer_profiles_table(n_customers, random_state=0):
     np.random.seed(random_state)
-    customer_id_properties=[]
-    
-    for customer_id in range(n_customers):
-        x_customer_id = np.random.uniform(0,100)
-        y_customer_id = np.random.uniform(0,100)
-        mean_amount = np.random.uniform(5,100)
-        std_amount = mean_amount/2
-        mean_nb_tx_per_day = np.random.uniform(0,4)
-        
-        customer_id_properties.append([
-            customer_id, x_customer_id, y_customer_id,
-            mean_amount, std_amount, mean_nb_tx_per_day
-        ])
-    
-    return pd.DataFrame(customer_id_properties, columns=[
-        'CUSTOMER_ID', 'x_customer_id', 'y_customer_id',
-        'mean_amount', 'std_amount', 'mean_nb_tx_per_day'
-    ])
+    
+    # Stessa sequenza di estrazioni del loop per customer (x, y, mean_amount,
+    # mean_nb_tx_per_day), fatta in un'unica chiamata
+    properties = np.random.uniform([0, 0, 5, 0], [100, 100, 100, 4], size=(n_customers, 4))
+    
+    return pd.DataFrame({
+        'CUSTOMER_ID': np.arange(n_customers),
+        'x_customer_id': properties[:,0],
+        'y_customer_id': properties[:,1],
+        'mean_amount': properties[:,2],
+        'std_amount': properties[:,2]/2,
+        'mean_nb_tx_per_day': properties[:,3]
+    })
 
 def generate_terminal_profiles_table(n_terminals, random_state=0):
     np.random.seed(random_state)
-    terminal_id_properties=[]
     
-    for terminal_id in range(n_terminals):
-        x_terminal_id = np.random.uniform(0,100)
-        y_terminal_id = np.random.uniform(0,100)
-        terminal_id_properties.append([terminal_id, x_terminal_id, y_terminal_id])
+    x_y_terminals = np.random.uniform(0, 100, size=(n_terminals, 2))
     
-    return pd.DataFrame(terminal_id_properties, columns=[
-        'TERMINAL_ID', 'x_terminal_id', 'y_terminal_id'
-    ])
+    return pd.DataFrame({
+        'TERMINAL_ID': np.arange(n_terminals),
+        'x_terminal_id': x_y_terminals[:,0],
+        'y_terminal_id': x_y_terminals[:,1]
+    })
 
 def get_list_terminals_within_radius(customer_profile, x_y_terminals, r):
     x_y_customer = customer_profile[['x_customer_id','y_customer_id']].values.astype(float)
@@ -46,6 +40,80 @@ def get_list_terminals_within_radius(customer_profile, x_y_terminals, r):
     available_terminals = list(np.where(dist_x_y<r)[0])
     return available_terminals
 
+# Massimo numero di coppie (customer, terminale candidato) valutate per volta
+RADIUS_MAX_PAIRS = 5000000
+
+def get_lists_terminals_within_radius(x_y_customers, x_y_terminals, r):
+    # Indice a griglia con celle di lato r: un terminale a distanza < r da un
+    # customer sta nella sua cella o in una delle 8 adiacenti. La distanza viene
+    # poi calcolata come in get_list_terminals_within_radius, quindi i terminali
+    # restituiti (array int64 ordinati, uno per customer) sono identici.
+    x_y_customers = np.asarray(x_y_customers, dtype=float)
+    x_y_terminals = np.asarray(x_y_terminals, dtype=float)
+    n_customers = len(x_y_customers)
+    n_terminals = len(x_y_terminals)
+    
+    if n_terminals==0 or r<=0:
+        return [np.array([], dtype=np.int64) for _ in range(n_customers)]
+    
+    # Margine sulla cella per non perdere coppie al bordo per arrotondamenti
+    cell_size = r*(1+1e-9)
+    origin = x_y_terminals.min(axis=0)
+    terminal_cells = np.floor((x_y_terminals-origin)/cell_size).astype(np.int64)
+    n_cells_x = terminal_cells[:,0].max()+1
+    n_cells_y = terminal_cells[:,1].max()+1
+    terminal_keys = terminal_cells[:,0]*n_cells_y + terminal_cells[:,1]
+    terminal_order = np.argsort(terminal_keys, kind='stable')
+    sorted_keys = terminal_keys[terminal_order]
+    # Coordinate dei terminali nell'ordine delle celle: le letture per cella sono contigue
+    x_terminals = x_y_terminals[terminal_order,0]
+    y_terminals = x_y_terminals[terminal_order,1]
+    
+    customer_cells = np.floor((x_y_customers-origin)/cell_size).astype(np.int64)
+    
+    candidates_per_customer = 9*n_terminals/(n_cells_x*n_cells_y)
+    chunk_size = max(1, int(RADIUS_MAX_PAIRS/max(candidates_per_customer, 1)))
+    
+    available_terminals = []
+    for chunk_start in range(0, n_customers, chunk_size):
+        chunk = np.arange(chunk_start, min(chunk_start+chunk_size, n_customers))
+        
+        starts, counts, owners = [], [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cx = customer_cells[chunk,0]+dx
+                cy = customer_cells[chunk,1]+dy
+                inside = (cx>=0) & (cx<n_cells_x) & (cy>=0) & (cy<n_cells_y)
+                keys = cx*n_cells_y + cy
+                start = np.searchsorted(sorted_keys, keys, side='left')
+                end = np.searchsorted(sorted_keys, keys, side='right')
+                starts.append(start)
+                counts.append(np.where(inside, end-start, 0))
+                owners.append(chunk)
+        
+        starts = np.concatenate(starts)
+        counts = np.concatenate(counts)
+        owners = np.concatenate(owners)
+        
+        pair_customer = np.repeat(owners, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts, counts)
+        pair_position = np.repeat(starts, counts) + offsets
+        
+        # Stesse operazioni di get_list_terminals_within_radius, per colonna
+        diff_x = x_y_customers[:,0][pair_customer] - x_terminals[pair_position]
+        diff_y = x_y_customers[:,1][pair_customer] - y_terminals[pair_position]
+        dist_x_y = np.sqrt(np.square(diff_x) + np.square(diff_y))
+        within = dist_x_y<r
+        
+        # Ordina per (customer, terminale) con un'unica chiave intera
+        pair_keys = np.sort(
+            (pair_customer[within]-chunk_start)*n_terminals + terminal_order[pair_position[within]]
+        )
+        per_customer = np.bincount(pair_keys//n_terminals, minlength=len(chunk))
+        available_terminals.extend(np.split(pair_keys%n_terminals, np.cumsum(per_customer)[:-1]))
+    
+    return available_terminals
+
 def generate_transactions_table(customer_profile, start_date="2018-04-01", nb_days=10):
     customer_transactions = []
     
@@ -91,8 +159,134 @@ def generate_transactions_table(customer_profile, start_date="2018-04-01", nb_da
     
     return customer_transactions
 
-def generate_dataset(n_customers=10000, n_terminals=1000000, nb_days=90, 
-                     start_date="2018-04-01", r=5):
+# Tipi ridotti della modalita' compact: ID e tempi int32, flag int8, coordinate
+# float32. Gli importi restano float64 (mediane e scenario 3 invariati).
+COMPACT_DTYPES = {
+    'TRANSACTION_ID': np.int32,
+    'CUSTOMER_ID': np.int32,
+    'TERMINAL_ID': np.int32,
+    'TX_TIME_SECONDS': np.int32,
+    'TX_TIME_DAYS': np.int32,
+    'TX_FRAUD': np.int8,
+    'TX_FRAUD_SCENARIO': np.int8,
+    'x_customer_id': np.float32,
+    'y_customer_id': np.float32,
+    'x_terminal_id': np.float32,
+    'y_terminal_id': np.float32,
+}
+
+def compact_dtypes(df):
+    # Converte in place le colonne note; gli interi restano int64 se non entrano
+    for column, dtype in COMPACT_DTYPES.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if np.issubdtype(dtype, np.integer) and len(df) > 0:
+            limits = np.iinfo(dtype)
+            if df[column].min() < limits.min or df[column].max() > limits.max:
+                continue
+        df[column] = df[column].astype(dtype)
+    return df
+
+# Numero di giorni generati per ogni estrazione vettoriale di un customer.
+# Ogni blocco ha un proprio seed (CUSTOMER_ID, blocco), quindi i giorni gia'
+# generati non cambiano se si aumenta nb_days.
+DAYS_PER_BLOCK = 64
+
+def draw_customer_block(customer_id, mean_nb_tx_per_day, mean_amount, std_amount,
+                        available_terminals, block):
+    rng = np.random.default_rng([int(customer_id), int(block)])
+    first_day = block*DAYS_PER_BLOCK
+    
+    nb_tx = rng.poisson(mean_nb_tx_per_day, size=DAYS_PER_BLOCK)
+    days = np.repeat(np.arange(first_day, first_day+DAYS_PER_BLOCK), nb_tx)
+    n = len(days)
+    
+    time_tx = rng.normal(86400/2, 20000, size=n).astype(np.int64)
+    
+    amount = rng.normal(mean_amount, std_amount, size=n)
+    negative = amount<0
+    amount[negative] = rng.uniform(0, mean_amount*2, size=negative.sum())
+    amount = np.round(amount, decimals=2)
+    
+    available_terminals = np.asarray(available_terminals, dtype=np.int64)
+    if len(available_terminals)==0:
+        valid = np.zeros(n, dtype=bool)
+        terminal_id = np.zeros(n, dtype=np.int64)
+    else:
+        valid = (time_tx>0) & (time_tx<86400)
+        terminal_id = available_terminals[rng.integers(0, len(available_terminals), size=n)]
+    
+    return (time_tx[valid]+days[valid]*86400, days[valid], terminal_id[valid], amount[valid])
+
+def generate_transactions_batch(customer_profiles_table, start_date="2018-04-01", nb_days=10,
+                                first_day=0, compact=False):
+    columns = {'TX_TIME_SECONDS': [], 'TX_TIME_DAYS': [], 'CUSTOMER_ID': [],
+               'TERMINAL_ID': [], 'TX_AMOUNT': []}
+    # In modalita' compact i blocchi vengono ridotti prima della concatenazione
+    int_dtype = np.int32 if compact else np.int64
+    
+    first_block = first_day//DAYS_PER_BLOCK
+    last_block = (nb_days-1)//DAYS_PER_BLOCK if nb_days>0 else first_block-1
+    
+    profiles = zip(
+        customer_profiles_table.CUSTOMER_ID.values,
+        customer_profiles_table.mean_nb_tx_per_day.values,
+        customer_profiles_table.mean_amount.values,
+        customer_profiles_table.std_amount.values,
+        customer_profiles_table.available_terminals.values
+    )
+    
+    for customer_id, mean_nb_tx_per_day, mean_amount, std_amount, available_terminals in profiles:
+        for block in range(first_block, last_block+1):
+            seconds, days, terminal_id, amount = draw_customer_block(
+                customer_id, mean_nb_tx_per_day, mean_amount, std_amount,
+                available_terminals, block
+            )
+            # L'ultimo blocco viene estratto per intero e poi tagliato a nb_days
+            in_range = (days>=first_day) & (days<nb_days)
+            columns['TX_TIME_SECONDS'].append(seconds[in_range].astype(int_dtype))
+            columns['TX_TIME_DAYS'].append(days[in_range].astype(int_dtype))
+            columns['CUSTOMER_ID'].append(np.full(in_range.sum(), customer_id, dtype=int_dtype))
+            columns['TERMINAL_ID'].append(terminal_id[in_range].astype(int_dtype))
+            columns['TX_AMOUNT'].append(amount[in_range])
+    
+    customer_transactions = pd.DataFrame({
+        name: np.concatenate(arrays) if arrays else np.array([], dtype=int_dtype)
+        for name, arrays in columns.items()
+    })
+    customer_transactions['TX_DATETIME'] = pd.to_datetime(
+        customer_transactions["TX_TIME_SECONDS"], unit='s', origin=start_date
+    )
+    
+    return customer_transactions[[
+        'TX_DATETIME','CUSTOMER_ID', 'TERMINAL_ID', 'TX_AMOUNT',
+        'TX_TIME_SECONDS', 'TX_TIME_DAYS'
+    ]]
+
+# Shard per worker: piu' shard dei worker bilanciano customer con molte transazioni
+SHARDS_PER_WORKER = 4
+
+def generate_transactions_parallel(customer_profiles_table, start_date="2018-04-01", nb_days=10,
+                                   workers=2, first_day=0, compact=False):
+    # Ogni customer dipende solo dal proprio profilo e seed: gli shard vengono
+    # generati in parallelo e concatenati nell'ordine dei customer, quindi il
+    # risultato e' identico a generate_transactions_batch sull'intera tabella
+    profiles = customer_profiles_table[[
+        'CUSTOMER_ID', 'mean_nb_tx_per_day', 'mean_amount', 'std_amount', 'available_terminals'
+    ]]
+    n_shards = max(1, min(len(profiles), workers*SHARDS_PER_WORKER))
+    shards = [profiles.iloc[idx] for idx in np.array_split(np.arange(len(profiles)), n_shards)]
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            generate_transactions_batch, shards,
+            [start_date]*n_shards, [nb_days]*n_shards, [first_day]*n_shards,
+            [compact]*n_shards
+        ))
+    
+    return pd.concat(results, ignore_index=True)
+
+def generate_profiles(n_customers=10000, n_terminals=1000000, r=5, engine="batch", compact=False):
     start_time=time.time()
     customer_profiles_table = generate_customer_profiles_table(n_customers, random_state=0)
     print("Time to generate customer profiles table: {0:.2}s".format(time.time()-start_time))
@@ -101,72 +295,277 @@ def generate_dataset(n_customers=10000, n_terminals=1000000, nb_days=90,
     terminal_profiles_table = generate_terminal_profiles_table(n_terminals, random_state=1)
     print("Time to generate terminal profiles table: {0:.2}s".format(time.time()-start_time))
     
+    assign_terminals(customer_profiles_table, terminal_profiles_table, r=r, engine=engine, compact=compact)
+    
+    return (customer_profiles_table, terminal_profiles_table)
+
+def assign_terminals(customer_profiles_table, terminal_profiles_table, r=5, engine="batch", compact=False):
+    # Aggiunge available_terminals e nb_terminals ai profili dei customer (in place)
     start_time=time.time()
     x_y_terminals = terminal_profiles_table[['x_terminal_id','y_terminal_id']].values.astype(float)
-    customer_profiles_table['available_terminals'] = customer_profiles_table.apply(
-        lambda x: get_list_terminals_within_radius(x, x_y_terminals=x_y_terminals, r=r), axis=1
-    )
+    if engine == "loop":
+        customer_profiles_table['available_terminals'] = customer_profiles_table.apply(
+            lambda x: get_list_terminals_within_radius(x, x_y_terminals=x_y_terminals, r=r), axis=1
+        )
+    else:
+        x_y_customers = customer_profiles_table[['x_customer_id','y_customer_id']].values.astype(float)
+        customer_profiles_table['available_terminals'] = get_lists_terminals_within_radius(
+            x_y_customers, x_y_terminals, r
+        )
     customer_profiles_table['nb_terminals'] = customer_profiles_table.available_terminals.apply(len)
     print("Time to associate terminals to customers: {0:.2}s".format(time.time()-start_time))
     
+    # Riduzione dopo l'assegnazione dei terminali: le distanze restano in float64
+    # e le transazioni generate sono le stesse della modalita' normale
+    if compact:
+        compact_dtypes(customer_profiles_table)
+        compact_dtypes(terminal_profiles_table)
+        customer_profiles_table['available_terminals'] = [
+            np.asarray(terminals, dtype=np.int32)
+            for terminals in customer_profiles_table.available_terminals
+        ]
+    
+    return customer_profiles_table
+
+def generate_dataset(n_customers=10000, n_terminals=1000000, nb_days=90, 
+                     start_date="2018-04-01", r=5, engine="batch", workers=1, compact=False):
+    customer_profiles_table, terminal_profiles_table = generate_profiles(
+        n_customers=n_customers, n_terminals=n_terminals, r=r, engine=engine, compact=compact
+    )
+    
+    transactions_df = generate_transactions(
+        customer_profiles_table, start_date=start_date, nb_days=nb_days, engine=engine,
+        workers=workers, compact=compact
+    )
+    
+    return (customer_profiles_table, terminal_profiles_table, transactions_df)
+
+def generate_transactions(customer_profiles_table, start_date="2018-04-01", nb_days=90,
+                          engine="batch", workers=1, compact=False):
     start_time=time.time()
-    transactions_df = customer_profiles_table.groupby('CUSTOMER_ID').apply(
-        lambda x: generate_transactions_table(x.iloc[0], nb_days=nb_days)
-    ).reset_index(drop=True)
+    if engine == "loop":
+        transactions_df = customer_profiles_table.groupby('CUSTOMER_ID').apply(
+            lambda x: generate_transactions_table(x.iloc[0], nb_days=nb_days)
+        ).reset_index(drop=True)
+    elif workers > 1:
+        transactions_df = generate_transactions_parallel(
+            customer_profiles_table, start_date=start_date, nb_days=nb_days, workers=workers,
+            compact=compact
+        )
+    else:
+        transactions_df = generate_transactions_batch(
+            customer_profiles_table, start_date=start_date, nb_days=nb_days, compact=compact
+        )
     
     print("Time to generate transactions: {0:.2}s".format(time.time()-start_time))
     
-    transactions_df = transactions_df.sort_values('TX_DATETIME')
+    # Ordinamento stabile: a parita' di TX_DATETIME conta l'ordine dei customer,
+    # cosi' gli ID coincidono con quelli di generate_transactions_chunks
+    transactions_df = transactions_df.sort_values('TX_DATETIME', kind='stable')
     transactions_df.reset_index(inplace=True, drop=True)
     transactions_df.reset_index(inplace=True)
     transactions_df.rename(columns={'index':'TRANSACTION_ID'}, inplace=True)
     
-    return (customer_profiles_table, terminal_profiles_table, transactions_df)
+    if compact:
+        compact_dtypes(transactions_df)
+    
+    return transactions_df
 
-def add_frauds(customer_profiles_table, terminal_profiles_table, transactions_df):
-    transactions_df['TX_FRAUD'] = 0
-    transactions_df['TX_FRAUD_SCENARIO'] = 0
+def generate_transactions_chunks(customer_profiles_table, start_date="2018-04-01", nb_days=10,
+                                 chunk_days=DAYS_PER_BLOCK, workers=1, compact=False):
+    # Transazioni a finestre di giorni consecutive, gia' ordinate per TX_DATETIME
+    # e con TRANSACTION_ID progressivi (identici a quelli di generate_dataset).
+    # Le finestre sono multipli di DAYS_PER_BLOCK per non rigenerare blocchi.
+    chunk_days = max(1, -(-chunk_days//DAYS_PER_BLOCK))*DAYS_PER_BLOCK
+    next_transaction_id = 0
     
-    transactions_df.loc[transactions_df.TX_AMOUNT>220, 'TX_FRAUD'] = 1
-    transactions_df.loc[transactions_df.TX_AMOUNT>220, 'TX_FRAUD_SCENARIO'] = 1
-    nb_frauds_scenario_1 = transactions_df.TX_FRAUD.sum()
-    print("Number of frauds from scenario 1: " + str(nb_frauds_scenario_1))
+    for first_day in range(0, nb_days, chunk_days):
+        last_day = min(first_day+chunk_days, nb_days)
+        if workers > 1:
+            chunk = generate_transactions_parallel(
+                customer_profiles_table, start_date=start_date, nb_days=last_day,
+                workers=workers, first_day=first_day, compact=compact
+            )
+        else:
+            chunk = generate_transactions_batch(
+                customer_profiles_table, start_date=start_date, nb_days=last_day,
+                first_day=first_day, compact=compact
+            )
+        
+        chunk = chunk.sort_values('TX_DATETIME', kind='stable')
+        chunk.index = pd.RangeIndex(next_transaction_id, next_transaction_id+len(chunk))
+        chunk.insert(0, 'TRANSACTION_ID', chunk.index.values)
+        next_transaction_id += len(chunk)
+        
+        if compact:
+            compact_dtypes(chunk)
+        
+        yield chunk
+
+def index_transactions_by(keys, days):
+    # Ordina le transazioni per (chiave, TX_TIME_DAYS) e restituisce l'ordine e
+    # una chiave composta crescente su cui cercare le finestre con searchsorted
+    span = int(days.max())+1 if len(days) else 1
+    order = np.lexsort((days, keys))
+    return order, keys[order]*span + days[order], span
+
+def window_slices(sorted_keys, span, keys, first_days, nb_window_days):
+    # Per ogni (chiave, primo giorno) la slice [lo, hi) delle sue transazioni
+    # con TX_TIME_DAYS in [primo giorno, primo giorno + nb_window_days)
+    keys = np.asarray(keys, dtype=np.int64)
+    first_days = np.asarray(first_days, dtype=np.int64)
+    lo = np.searchsorted(sorted_keys, keys*span + np.minimum(first_days, span), side='left')
+    hi = np.searchsorted(sorted_keys, keys*span + np.minimum(first_days+nb_window_days, span), side='left')
+    return lo, hi
+
+def apply_frauds_scenario_2(terminal_profiles_table, transactions_df, first_day, last_day):
+    if len(transactions_df)==0 or first_day>=last_day:
+        return
     
-    for day in range(transactions_df.TX_TIME_DAYS.max()):
-        compromised_terminals = terminal_profiles_table.TERMINAL_ID.sample(n=2, random_state=day)
-        compromised_transactions = transactions_df[
-            (transactions_df.TX_TIME_DAYS >= day) &
-            (transactions_df.TX_TIME_DAYS < day + 28) &
-            (transactions_df.TERMINAL_ID.isin(compromised_terminals))
-        ]
-        transactions_df.loc[compromised_transactions.index, 'TX_FRAUD'] = 1
-        transactions_df.loc[compromised_transactions.index, 'TX_FRAUD_SCENARIO'] = 2
+    days = transactions_df.TX_TIME_DAYS.values.astype(np.int64)
+    terminals = transactions_df.TERMINAL_ID.values.astype(np.int64)
+    order, sorted_keys, span = index_transactions_by(terminals, days)
     
-    nb_frauds_scenario_2 = transactions_df.TX_FRAUD.sum() - nb_frauds_scenario_1
-    print("Number of frauds from scenario 2: " + str(nb_frauds_scenario_2))
+    window_days = np.arange(first_day, last_day)
+    compromised_terminals = np.array([
+        terminal_profiles_table.TERMINAL_ID.sample(n=2, random_state=day).values
+        for day in window_days
+    ], dtype=np.int64)
+    lo, hi = window_slices(
+        sorted_keys, span, compromised_terminals.ravel(), np.repeat(window_days, 2), 28
+    )
+    
+    # Unione delle finestre: +1 all'inizio e -1 alla fine di ogni slice
+    coverage = np.zeros(len(sorted_keys)+1, dtype=np.int64)
+    np.add.at(coverage, lo, 1)
+    np.add.at(coverage, hi, -1)
+    compromised = order[np.cumsum(coverage[:-1])>0]
+    
+    fraud = transactions_df.TX_FRAUD.values.copy()
+    scenario = transactions_df.TX_FRAUD_SCENARIO.values.copy()
+    fraud[compromised] = 1
+    scenario[compromised] = 2
+    transactions_df['TX_FRAUD'] = fraud
+    transactions_df['TX_FRAUD_SCENARIO'] = scenario
+
+def apply_frauds_scenario_3(customer_profiles_table, transactions_df, first_day, last_day):
+    if len(transactions_df)==0 or first_day>=last_day:
+        return
+    
+    days = transactions_df.TX_TIME_DAYS.values.astype(np.int64)
+    customers = transactions_df.CUSTOMER_ID.values.astype(np.int64)
+    order, sorted_keys, span = index_transactions_by(customers, days)
     
-    for day in range(transactions_df.TX_TIME_DAYS.max()):
+    amount = transactions_df.TX_AMOUNT.values.astype(float)
+    fraud = transactions_df.TX_FRAUD.values.copy()
+    scenario = transactions_df.TX_FRAUD_SCENARIO.values.copy()
+    
+    # Le finestre vanno applicate in ordine: una transazione scelta da piu'
+    # finestre viene moltiplicata piu' volte
+    for day in range(first_day, last_day):
         compromised_customers = customer_profiles_table.CUSTOMER_ID.sample(
             n=3, random_state=day
         ).values
-        compromised_transactions = transactions_df[
-            (transactions_df.TX_TIME_DAYS >= day) &
-            (transactions_df.TX_TIME_DAYS < day + 14) &
-            (transactions_df.CUSTOMER_ID.isin(compromised_customers))
-        ]
+        lo, hi = window_slices(sorted_keys, span, compromised_customers, [day]*3, 14)
+        # Posizioni nell'ordine del DataFrame, come compromised_transactions.index
+        compromised_transactions = np.sort(np.concatenate([
+            order[start:end] for start, end in zip(lo, hi)
+        ]))
         nb_compromised_transactions = len(compromised_transactions)
         
+        # random.sample dipende solo dalla lunghezza della popolazione
         random.seed(day)
-        index_frauds = random.sample(
-            list(compromised_transactions.index.values),
+        index_frauds = compromised_transactions[random.sample(
+            range(nb_compromised_transactions),
             k=int(nb_compromised_transactions/3)
-        )
+        )]
         
-        transactions_df.loc[index_frauds, 'TX_AMOUNT'] = transactions_df.loc[index_frauds, 'TX_AMOUNT'] * 5
-        transactions_df.loc[index_frauds, 'TX_FRAUD'] = 1
-        transactions_df.loc[index_frauds, 'TX_FRAUD_SCENARIO'] = 3
+        amount[index_frauds] = amount[index_frauds] * 5
+        fraud[index_frauds] = 1
+        scenario[index_frauds] = 3
+    
+    transactions_df['TX_AMOUNT'] = amount
+    transactions_df['TX_FRAUD'] = fraud
+    transactions_df['TX_FRAUD_SCENARIO'] = scenario
+
+def add_frauds(customer_profiles_table, terminal_profiles_table, transactions_df, compact=False,
+               first_day=0):
+    # first_day: prima finestra degli scenari 2 e 3 (delta su un intervallo di giorni)
+    fraud_dtype = np.int8 if compact else np.int64
+    transactions_df['TX_FRAUD'] = np.zeros(len(transactions_df), dtype=fraud_dtype)
+    transactions_df['TX_FRAUD_SCENARIO'] = np.zeros(len(transactions_df), dtype=fraud_dtype)
+    
+    transactions_df.loc[transactions_df.TX_AMOUNT>220, 'TX_FRAUD'] = 1
+    transactions_df.loc[transactions_df.TX_AMOUNT>220, 'TX_FRAUD_SCENARIO'] = 1
+    nb_frauds_scenario_1 = transactions_df.TX_FRAUD.sum()
+    print("Number of frauds from scenario 1: " + str(nb_frauds_scenario_1))
+    
+    apply_frauds_scenario_2(terminal_profiles_table, transactions_df, first_day, transactions_df.TX_TIME_DAYS.max())
+    
+    nb_frauds_scenario_2 = transactions_df.TX_FRAUD.sum() - nb_frauds_scenario_1
+    print("Number of frauds from scenario 2: " + str(nb_frauds_scenario_2))
+    
+    apply_frauds_scenario_3(customer_profiles_table, transactions_df, first_day, transactions_df.TX_TIME_DAYS.max())
     
     nb_frauds_scenario_3 = transactions_df.TX_FRAUD.sum() - nb_frauds_scenario_2 - nb_frauds_scenario_1
     print("Number of frauds from scenario 3: " + str(nb_frauds_scenario_3))
     
-    return transactions_df
\ No newline at end of file
+    return transactions_df
+
+def add_frauds_stream(customer_profiles_table, terminal_profiles_table, chunks, compact=False):
+    # Stessi scenari di add_frauds su chunk ordinati per giorno. Una transazione
+    # viene restituita solo quando nessuna finestra dello scenario 3 non ancora
+    # applicata puo' piu' toccarla, quindi in memoria restano al massimo il chunk
+    # corrente e gli ultimi 14 giorni.
+    # Come in add_frauds le finestre partono dai giorni [0, ultimo giorno): la
+    # finestra dell'ultimo giorno visto si applica solo quando arriva un chunk
+    # successivo, cioe' quando si sa che non e' l'ultimo giorno del dataset.
+    fraud_dtype = np.int8 if compact else np.int64
+    nb_frauds = [0, 0, 0]
+    pending = None
+    last_day = None
+    next_window = 0
+    
+    for chunk in chunks:
+        if len(chunk)==0:
+            continue
+        
+        chunk['TX_FRAUD'] = np.zeros(len(chunk), dtype=fraud_dtype)
+        chunk['TX_FRAUD_SCENARIO'] = np.zeros(len(chunk), dtype=fraud_dtype)
+        chunk.loc[chunk.TX_AMOUNT>220, 'TX_FRAUD'] = 1
+        chunk.loc[chunk.TX_AMOUNT>220, 'TX_FRAUD_SCENARIO'] = 1
+        nb_frauds[0] += chunk.TX_FRAUD.sum()
+        
+        chunk_last_day = chunk.TX_TIME_DAYS.max()
+        
+        nb_before = chunk.TX_FRAUD.sum() + (pending.TX_FRAUD.sum() if pending is not None else 0)
+        if pending is not None:
+            apply_frauds_scenario_2(terminal_profiles_table, pending, last_day, last_day+1)
+        apply_frauds_scenario_2(
+            terminal_profiles_table, chunk, max(0, chunk.TX_TIME_DAYS.min()-27), chunk_last_day
+        )
+        
+        buffer = chunk if pending is None else pd.concat([pending, chunk])
+        nb_frauds[1] += buffer.TX_FRAUD.sum() - nb_before
+        
+        # Finestre dello scenario 3 interamente contenute nei giorni gia' visti
+        nb_before = buffer.TX_FRAUD.sum()
+        windows_end = max(next_window, chunk_last_day-13)
+        apply_frauds_scenario_3(customer_profiles_table, buffer, next_window, windows_end)
+        nb_frauds[2] += buffer.TX_FRAUD.sum() - nb_before
+        next_window = windows_end
+        
+        last_day = chunk_last_day
+        done = buffer.TX_TIME_DAYS < next_window
+        pending = buffer[~done].copy()
+        if done.any():
+            yield buffer[done]
+    
+    if pending is not None:
+        nb_before = pending.TX_FRAUD.sum()
+        apply_frauds_scenario_3(customer_profiles_table, pending, next_window, last_day)
+        nb_frauds[2] += pending.TX_FRAUD.sum() - nb_before
+        yield pending
+    
+    for scenario, nb in enumerate(nb_frauds, start=1):
+        print("Number of frauds from scenario {0}: {1}".format(scenario, nb))
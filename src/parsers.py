@@ -1,16 +1,75 @@
 """neo4j_manager/parsers.py - Parser per le risposte"""
 
+import csv
+import gzip
+import os
+import time
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 from neo4j import Result
 
 
+# Righe per chunk dei parser colonnari
+DEFAULT_CHUNK_SIZE = 65536
+
+
+def record_chunks(result: Result, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Legge il risultato a chunk di al massimo chunk_size righe
+
+    I valori di ogni record finiscono in array object preallocati, uno per
+    colonna e riusati tra i chunk: nessun dict per record e in memoria solo
+    un chunk alla volta. Ogni chunk viene convertito in colonne tipizzate
+    (int64, float64, bool dove possibile). Un risultato vuoto produce un
+    solo chunk vuoto con le colonne della query.
+    """
+    keys = list(result.keys())
+    buffers = [np.empty(chunk_size, dtype=object) for _ in keys]
+
+    def flush(n: int) -> pd.DataFrame:
+        return pd.DataFrame({
+            key: pd.Series(buffer[:n].copy()).infer_objects()
+            for key, buffer in zip(keys, buffers)
+        })
+
+    filled = 0
+    chunks = 0
+    for record in result:
+        for buffer, value in zip(buffers, record.values()):
+            buffer[filled] = value
+        filled += 1
+        if filled == chunk_size:
+            yield flush(filled)
+            chunks += 1
+            filled = 0
+    if filled or not chunks:
+        yield flush(filled)
+
+
 class DataFrameParser:
     """Parser che converte in DataFrame pandas"""
     def parse(self, result: Result, query: str, params: Dict) -> pd.DataFrame:
         return pd.DataFrame([dict(record) for record in result])
 
 
+class ColumnarParser:
+    """
+    Parser che converte in DataFrame senza passare da un dict per record
+
+    Stesso risultato di DataFrameParser con meno copie: le colonne vengono
+    riempite a chunk (record_chunks) e concatenate alla fine.
+    """
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def parse(self, result: Result, query: str, params: Dict) -> pd.DataFrame:
+        chunks = list(record_chunks(result, self.chunk_size))
+        if len(chunks) == 1:
+            return chunks[0]
+        return pd.concat(chunks, ignore_index=True)
+
+
 class ListParser:
     """Parser che restituisce lista di dizionari"""
     def parse(self, result: Result, query: str, params: Dict) -> List[Dict]:
@@ -18,13 +77,105 @@ class ListParser:
 
 
 class CountParser:
-    """Parser che restituisce conteggio"""
+    """Parser che restituisce conteggio, senza tenere i record in memoria"""
     def parse(self, result: Result, query: str, params: Dict) -> int:
-        return len(list(result))
+        count = 0
+        for _ in result:
+            count += 1
+        return count
+
+
+class SinkParser:
+    """
+    Parser che scrive le righe direttamente su file (CSV o Parquet)
+
+    Le righe arrivano a chunk da record_chunks e vengono scritte man mano,
+    quindi la memoria resta limitata a un chunk anche per risultati grandi.
+    Il formato si ricava dall'estensione (.csv, .csv.gz, .parquet); Parquet
+    richiede pyarrow.
+
+    Returns (parse):
+        Numero di righe scritte
+    """
+    def __init__(self, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.format = 'parquet' if path.endswith('.parquet') else 'csv'
+        # Secondi spesi a scrivere il file nell'ultimo parse (il resto è lettura)
+        self.write_seconds = 0.0
+
+    def parse(self, result: Result, query: str, params: Dict) -> int:
+        self.write_seconds = 0.0
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if self.format == 'parquet':
+            return self._write_parquet(result)
+        return self._write_csv(result)
+
+    def _write_csv(self, result: Result) -> int:
+        rows = 0
+        # Un solo handle per tutti i chunk: un solo stream gzip per i .csv.gz
+        opener = gzip.open if self.path.endswith('.gz') else open
+        with opener(self.path, 'wt', newline='') as f:
+            for chunk in record_chunks(result, self.chunk_size):
+                start_time = time.perf_counter()
+                chunk.to_csv(f, index=False, header=rows == 0)
+                self.write_seconds += time.perf_counter() - start_time
+                rows += len(chunk)
+        return rows
+
+    def _write_parquet(self, result: Result) -> int:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("SinkParser su .parquet richiede pyarrow (pip install pyarrow)")
+
+        rows = 0
+        writer = None
+        try:
+            for chunk in record_chunks(result, self.chunk_size):
+                start_time = time.perf_counter()
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(self.path, table.schema)
+                else:
+                    # Un chunk con una colonna tutta null non cambia lo schema del file
+                    table = table.cast(writer.schema)
+                writer.write_table(table)
+                self.write_seconds += time.perf_counter() - start_time
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
+
+def count_file_rows(path: str) -> int:
+    """Righe di un file scritto da SinkParser, senza caricarlo in memoria"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='') as f:
+        # csv.reader: un valore tra virgolette può contenere a capo
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
 
 
 class SingleValueParser:
     """Parser per singolo valore"""
     def parse(self, result: Result, query: str, params: Dict) -> Any:
         record = result.single()
-        return record[0] if record else None
\ No newline at end of file
+        return record[0] if record else None
+
+
+def default_parsers() -> Dict[str, Any]:
+    """Parser registrati di default nei manager"""
+    return {
+        'dataframe': DataFrameParser(),
+        'columnar': ColumnarParser(),
+        'list': ListParser(),
+        'count': CountParser(),
+        'single': SingleValueParser()
+    }
@@ -0,0 +1,147 @@
+"""Confronto dei piani EXPLAIN delle query con una baseline versionata"""
+
+import json
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from query_engine import DEFAULT_PARAMS, QueryEngine
+
+
+DEFAULT_BASELINE = 'queries/plan_baseline.json'
+
+# Crescita delle righe stimate (somma sugli operatori) oltre cui il piano è una regressione
+DEFAULT_ROW_FACTOR = 10.0
+
+# Nomi generati dal planner (anon_12, UNNAMED34) che cambiano senza che cambi il piano
+ANONYMOUS_NAMES = re.compile(r'\b(?:anon_|UNNAMED)\d+\b')
+
+
+def normalize_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Albero del piano ridotto a ciò che conta per il confronto: operatore
+    (senza suffisso @runtime), righe stimate, dettagli senza nomi anonimi
+    """
+    args = plan.get('args', {})
+    return {
+        'operator': plan.get('operatorType', '').split('@')[0],
+        'estimated_rows': round(float(args.get('EstimatedRows', 0.0)), 1),
+        'details': ANONYMOUS_NAMES.sub('anon', str(args.get('Details', ''))),
+        'children': [normalize_plan(child) for child in plan.get('children', [])],
+    }
+
+
+def _walk(tree: Dict[str, Any], depth: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    yield depth, tree
+    for child in tree['children']:
+        yield from _walk(child, depth + 1)
+
+
+def plan_features(tree: Dict[str, Any]) -> Dict[str, Any]:
+    """Conteggi confrontati con la baseline"""
+    operators = [node['operator'] for _, node in _walk(tree)]
+    return {
+        'index_operators': sum('Index' in op for op in operators),
+        'scans': sum(op.endswith('Scan') and 'Index' not in op for op in operators),
+        'eager': operators.count('Eager'),
+        'cartesian_products': operators.count('CartesianProduct'),
+        'estimated_rows': round(sum(node['estimated_rows'] for _, node in _walk(tree)), 1),
+        'shape': ' '.join(f"{depth}:{node['operator']}" for depth, node in _walk(tree)),
+    }
+
+
+def compare_features(baseline: Dict[str, Any], current: Dict[str, Any],
+                     row_factor: float = DEFAULT_ROW_FACTOR) -> Tuple[List[str], bool]:
+    """
+    Returns:
+        Tuple (differenze che sono regressioni, piano cambiato)
+    """
+    regressions = []
+    if current['index_operators'] < baseline['index_operators']:
+        regressions.append(f"operatori su indice {baseline['index_operators']} → {current['index_operators']}")
+    if current['scans'] > baseline['scans']:
+        regressions.append(f"scan senza indice {baseline['scans']} → {current['scans']}")
+    if current['eager'] > baseline['eager']:
+        regressions.append(f"Eager {baseline['eager']} → {current['eager']}")
+    if current['cartesian_products'] > baseline['cartesian_products']:
+        regressions.append(f"CartesianProduct {baseline['cartesian_products']} → "
+                           f"{current['cartesian_products']}")
+    if current['estimated_rows'] > max(baseline['estimated_rows'], 1.0) * row_factor:
+        regressions.append(f"righe stimate {baseline['estimated_rows']:,.0f} → "
+                           f"{current['estimated_rows']:,.0f}")
+    return regressions, current['shape'] != baseline['shape']
+
+
+def read_baseline(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['queries']
+
+
+def write_baseline(path: str, plans: Dict[str, Dict[str, Any]]) -> None:
+    with open(path, 'w') as f:
+        json.dump({'version': 1, 'queries': plans}, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
+
+
+def check_plans(engine: QueryEngine, baseline_path: str = DEFAULT_BASELINE,
+                update: bool = False, row_factor: float = DEFAULT_ROW_FACTOR) -> bool:
+    """
+    EXPLAIN di tutte le query caricate nell'engine e confronto con la baseline
+
+    Args:
+        engine: QueryEngine connesso, con le query già caricate
+        baseline_path: File JSON della baseline (versionato con le query)
+        update: Riscrive la baseline con i piani attuali invece di confrontare
+        row_factor: Crescita massima delle righe stimate
+
+    Returns:
+        True se nessuna query ha regressioni (o la baseline è stata aggiornata)
+    """
+    current = {}
+    failed = []
+    for name in sorted(engine.queries):
+        result = engine.manager.explain(engine.queries[name], DEFAULT_PARAMS.get(name))
+        if not result.success:
+            failed.append(name)
+            print(f"❌ {name}: EXPLAIN fallito: {result.error}")
+            continue
+        tree = normalize_plan(result.data)
+        current[name] = {'features': plan_features(tree), 'plan': tree}
+
+    if update:
+        if failed:
+            print(f"Baseline non aggiornata: {len(failed)} query senza piano")
+            return False
+        write_baseline(baseline_path, current)
+        print(f"✅ Baseline aggiornata: {len(current)} piani in {baseline_path}")
+        return True
+
+    baseline = read_baseline(baseline_path)
+    if baseline is None:
+        print(f"❌ Baseline {baseline_path} non trovata (creala con --update-baseline)")
+        return False
+
+    regressed = []
+    for name, entry in current.items():
+        if name not in baseline:
+            print(f"⚠️  {name}: nuova query, non nella baseline")
+            continue
+        regressions, changed = compare_features(baseline[name]['features'], entry['features'],
+                                                row_factor)
+        if regressions:
+            regressed.append(name)
+            print(f"❌ {name}: REGRESSIONE")
+            for regression in regressions:
+                print(f"     {regression}")
+        elif changed:
+            print(f"⚠️  {name}: piano cambiato senza regressioni")
+        else:
+            print(f"✅ {name}: OK")
+    for name in sorted(set(baseline) - set(current) - set(failed)):
+        print(f"⚠️  {name}: nella baseline ma non caricata")
+
+    print(f"\n{len(current)} piani confrontati, {len(regressed)} regressioni, "
+          f"{len(failed)} errori")
+    return not regressed and not failed
@@ -0,0 +1,70 @@
+"""Lettura dei piani PROFILE restituiti nel ResultSummary e statistiche di latenza"""
+
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+
+# Statistiche per operatore del piano: (chiave del server, nome della colonna)
+OPERATOR_STATS = (
+    ('rows', 'rows'),
+    ('dbHits', 'db_hits'),
+    ('pageCacheHits', 'page_cache_hits'),
+    ('pageCacheMisses', 'page_cache_misses'),
+    ('time', 'time'),
+)
+
+# Percentili riportati da latency_stats
+PERCENTILES = (50, 95, 99)
+
+
+def plan_operators(plan: Dict[str, Any], depth: int = 0) -> List[Dict[str, Any]]:
+    """
+    Operatori del piano in pre-ordine, uno per riga
+
+    Args:
+        plan: Albero di ResultSummary.profile (operatorType, args, children, ...)
+        depth: Profondità del nodo radice
+
+    Returns:
+        Lista di dizionari con depth, operator, details, estimated_rows e le
+        statistiche di OPERATOR_STATS (None se il server non le riporta)
+    """
+    args = plan.get('args', {})
+    row = {
+        'depth': depth,
+        'operator': plan.get('operatorType'),
+        'details': args.get('Details'),
+        'estimated_rows': args.get('EstimatedRows'),
+    }
+    for key, column in OPERATOR_STATS:
+        row[column] = plan.get(key, args.get(key[0].upper() + key[1:]))
+    rows = [row]
+    for child in plan.get('children', []):
+        rows.extend(plan_operators(child, depth + 1))
+    return rows
+
+
+def plan_totals(plan: Dict[str, Any]) -> Dict[str, int]:
+    """Db hits e page cache hit/miss sommati su tutti gli operatori"""
+    operators = plan_operators(plan)
+    return {
+        column: sum(op[column] or 0 for op in operators)
+        for column in ('db_hits', 'page_cache_hits', 'page_cache_misses')
+    }
+
+
+def latency_stats(seconds: Sequence[float]) -> Dict[str, float]:
+    """min, max, media, deviazione standard e percentili in ms"""
+    ms = np.asarray(seconds, dtype=float) * 1000
+    if len(ms) == 0:
+        return {}
+    stats = {
+        'min_ms': float(ms.min()),
+        'max_ms': float(ms.max()),
+        'mean_ms': float(ms.mean()),
+        'std_ms': float(ms.std(ddof=1)) if len(ms) > 1 else 0.0,
+    }
+    for p in PERCENTILES:
+        stats[f'p{p}_ms'] = float(np.percentile(ms, p))
+    return stats
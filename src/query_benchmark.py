@@ -0,0 +1,215 @@
+"""Benchmark statistico delle query: riscaldamento, iterazioni, sweep di parametri"""
+
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import neo4j
+import numpy as np
+import pandas as pd
+
+from profiling import latency_stats
+from query_engine import DEFAULT_PARAMS, QueryEngine
+
+
+DEFAULT_QUERIES = ('q1a', 'q1b', 'q1c')
+
+# Regressione se il p50 supera quello della baseline di più di questa frazione
+DEFAULT_THRESHOLD = 0.10
+
+
+def parse_sweep(spec: str) -> Dict[str, Any]:
+    """
+    Interpreta uno sweep QUERY.PARAM=VALORI
+
+    VALORI può essere una lista (1,2,3), un intervallo inclusivo (0..99) o
+    @file con un valore per riga. I valori restano stringhe: le query del
+    progetto convertono gli ID (toString/toInteger).
+
+    Returns:
+        Dizionario con query, param e values
+    """
+    try:
+        target, values = spec.split('=', 1)
+        query, param = target.split('.', 1)
+    except ValueError:
+        raise ValueError(f"Sweep non valido: {spec} (es. q1c.customerId=0..99)")
+
+    if values.startswith('@'):
+        with open(values[1:]) as f:
+            parsed = [line.strip() for line in f if line.strip()]
+    elif '..' in values:
+        start, end = values.split('..', 1)
+        parsed = [str(v) for v in range(int(start), int(end) + 1)]
+    else:
+        parsed = [v.strip() for v in values.split(',') if v.strip()]
+    if not parsed:
+        raise ValueError(f"Sweep senza valori: {spec}")
+    return {'query': query, 'param': param, 'values': parsed}
+
+
+class QueryBenchmark:
+    """
+    Misura le query con più iterazioni invece di una sola esecuzione
+
+    Ogni query viene eseguita warmup volte senza misurare e poi iterations
+    volte; con uno sweep ogni iterazione passa su tutti i valori del
+    parametro, quindi i campioni sono iterations × valori. Le query vanno
+    direttamente al manager (niente cache dei risultati) con il parser
+    scelto: 'count' misura server e trasferimento senza costruire DataFrame.
+    """
+
+    def __init__(self, engine: QueryEngine, warmup: int = 3, iterations: int = 20,
+                 parser: str = 'count'):
+        self.engine = engine
+        self.warmup = warmup
+        self.iterations = iterations
+        self.parser = parser
+        self.samples: List[Dict[str, Any]] = []
+
+    def cases(self, name: str, sweeps: Sequence[Dict[str, Any]]) -> List[Optional[Dict]]:
+        """Parametri delle esecuzioni di una query: i valori dello sweep o i default"""
+        base = DEFAULT_PARAMS.get(name, {})
+        for sweep in sweeps:
+            if sweep['query'] == name:
+                return [{**base, sweep['param']: value} for value in sweep['values']]
+        return [base or None]
+
+    def run(self, names: Sequence[str], sweeps: Sequence[Dict[str, Any]] = ()) -> pd.DataFrame:
+        """
+        Returns:
+            DataFrame con una riga di statistiche per query
+        """
+        rows = []
+        for name in names:
+            if name not in self.engine.queries:
+                print(f"⚠️  Query '{name}' non trovata")
+                continue
+            query = self.engine.queries[name]
+            cases = self.cases(name, sweeps)
+            print(f"Benchmark {name}: {self.warmup} riscaldamento + {self.iterations} iterazioni"
+                  f" × {len(cases)} parametri...", end=" ", flush=True)
+
+            for _ in range(self.warmup):
+                for params in cases:
+                    self.engine.manager.run_cypher(query, params, self.parser)
+
+            wall, server, errors, result_rows = [], [], 0, None
+            for iteration in range(self.iterations):
+                for params in cases:
+                    start_time = time.perf_counter()
+                    result = self.engine.manager.run_cypher(query, params, self.parser)
+                    elapsed = time.perf_counter() - start_time
+                    if not result.success:
+                        errors += 1
+                        continue
+                    server_ms = None
+                    if result.result_available_after is not None and result.result_consumed_after is not None:
+                        server_ms = result.result_available_after + result.result_consumed_after
+                        server.append(server_ms / 1000)
+                    wall.append(elapsed)
+                    if isinstance(result.data, int):
+                        result_rows = result.data
+                    self.samples.append({
+                        'query': name,
+                        'params': json.dumps(params, sort_keys=True) if params else '',
+                        'iteration': iteration,
+                        'wall_ms': elapsed * 1000,
+                        'server_ms': server_ms
+                    })
+
+            stats = latency_stats(wall)
+            rows.append({
+                'query': name,
+                'cases': len(cases),
+                'samples': len(wall),
+                'errors': errors,
+                'rows': result_rows,
+                **stats,
+                'server_p50_ms': float(np.percentile(np.asarray(server) * 1000, 50)) if server else None,
+            })
+            if wall:
+                print(f"p50 {stats['p50_ms']:.1f}ms, p95 {stats['p95_ms']:.1f}ms, {errors} errori")
+            else:
+                print(f"ERRORE: nessuna esecuzione riuscita ({errors} errori)")
+        return pd.DataFrame(rows)
+
+    def environment(self) -> Dict[str, Any]:
+        """Metadati della misura: dataset, connessione e versioni"""
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'neo4j_driver': neo4j.__version__,
+            'uri': self.engine.manager.config.uri,
+            'database': self.engine.manager.config.database,
+            'warmup': self.warmup,
+            'iterations': self.iterations,
+            'parser': self.parser,
+            'dataset': self.engine.get_dataset_info(),
+        }
+
+
+def save_benchmark(output_dir: str, stats: pd.DataFrame, environment: Dict[str, Any],
+                   samples: List[Dict[str, Any]]) -> str:
+    """
+    Scrive benchmark.json (ambiente, statistiche, campioni), benchmark.csv
+    (statistiche) e benchmark_samples.csv
+
+    Returns:
+        Percorso di benchmark.json, da usare come baseline
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    json_file = os.path.join(output_dir, 'benchmark.json')
+    with open(json_file, 'w') as f:
+        json.dump({
+            'environment': environment,
+            'stats': stats.to_dict(orient='records'),
+            'samples': samples
+        }, f, indent=2, default=str)
+    stats.to_csv(os.path.join(output_dir, 'benchmark.csv'), index=False)
+    pd.DataFrame(samples).to_csv(os.path.join(output_dir, 'benchmark_samples.csv'), index=False)
+    print(f"Risultati salvati in {output_dir}/ (benchmark.json, benchmark.csv, benchmark_samples.csv)")
+    return json_file
+
+
+def compare_benchmark(stats: pd.DataFrame, environment: Dict[str, Any], baseline_file: str,
+                      threshold: float = DEFAULT_THRESHOLD) -> bool:
+    """
+    Confronta p50 e p95 con una run salvata
+
+    Args:
+        stats: Statistiche della run corrente
+        environment: Metadati della run corrente
+        baseline_file: benchmark.json di una run precedente
+        threshold: Peggioramento relativo del p50 oltre cui la query è in regressione
+
+    Returns:
+        True se nessuna query è in regressione
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    baseline_stats = {row['query']: row for row in baseline['stats']}
+
+    if baseline['environment'].get('dataset') != environment.get('dataset'):
+        print(f"⚠️  Dataset diverso dalla baseline: {baseline['environment'].get('dataset')} "
+              f"vs {environment.get('dataset')}")
+
+    print(f"\n=== CONFRONTO CON {baseline_file} (soglia +{threshold:.0%}) ===")
+    regressions = 0
+    for row in stats.to_dict(orient='records'):
+        before = baseline_stats.get(row['query'])
+        if before is None or pd.isna(row.get('p50_ms')) or before.get('p50_ms') is None:
+            print(f"   {row['query']}: non confrontabile")
+            continue
+        change = row['p50_ms'] / before['p50_ms'] - 1
+        p95_change = row['p95_ms'] / before['p95_ms'] - 1
+        regressed = change > threshold
+        regressions += regressed
+        print(f"{'❌' if regressed else '✅'} {row['query']}: p50 {before['p50_ms']:.1f} → "
+              f"{row['p50_ms']:.1f}ms ({change:+.1%}), p95 {before['p95_ms']:.1f} → "
+              f"{row['p95_ms']:.1f}ms ({p95_change:+.1%})")
+    return regressions == 0
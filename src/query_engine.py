@@ -1,14 +1,35 @@
 """Query Engine per eseguire e misurare performance delle query Neo4j"""
 
+import asyncio
 import os
 import json
 import time
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Sequence, Tuple, Union
 from dataclasses import dataclass, asdict
 import pandas as pd
 
 from manager import Neo4jManager
-from base import Neo4jConfig, QueryResult
+from async_manager import AsyncNeo4jManager
+from base import Neo4jConfig, QueryResult, ResponseParser, WriteMetrics
+from cn3_batch import DEFAULT_WORKERS, read_customers, run_cn3_batch
+from parsers import SinkParser, count_file_rows
+from extend import extend_transactions
+from profiling import plan_operators, plan_totals
+from result_cache import CACHEABLE_PARSERS, ResultCache, database_fingerprint
+
+
+# Parametri delle query del progetto quando non indicati (customer di esempio di 3.c)
+DEFAULT_PARAMS = {
+    'q1c': {'customerId': '889'},
+}
+
+# Conteggi di get_dataset_info, indipendenti tra loro
+DATASET_INFO_QUERIES = {
+    'customers': "MATCH (c:Customer) RETURN count(c) as count",
+    'terminals': "MATCH (t:Terminal) RETURN count(t) as count",
+    'transactions': "MATCH (tx:Transaction) RETURN count(tx) as count",
+    'quarters': "MATCH (q:Quarter) RETURN count(q) as count"
+}
 
 
 @dataclass
@@ -20,16 +41,34 @@ class QueryMetrics:
     success: bool
     error: Optional[str] = None
     dataset_info: Optional[Dict] = None
+    # Esito della cache dei risultati (0/0 se la cache non è usata)
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # Tempi del server (ms, None se il risultato arriva dalla cache)
+    result_available_after: Optional[int] = None
+    result_consumed_after: Optional[int] = None
+    # Solo in modalità profile: totali e albero del piano PROFILE
+    db_hits: Optional[int] = None
+    page_cache_hits: Optional[int] = None
+    page_cache_misses: Optional[int] = None
+    plan: Optional[Dict] = None
+    # Solo per export_query: server fino al primo record, lettura, scrittura del file (s)
+    server_seconds: Optional[float] = None
+    fetch_seconds: Optional[float] = None
+    write_seconds: Optional[float] = None
 
 
-class QueryEngine:
-    """Engine per eseguire query e raccogliere metriche"""
+class BaseQueryEngine:
+    """
+    Parte comune di QueryEngine e AsyncQueryEngine: caricamento delle query,
+    metriche e salvataggio dei tempi, senza accesso al database
+    """
     
-    def __init__(self, config: Optional[Neo4jConfig] = None):
-        self.manager = Neo4jManager(config)
+    def __init__(self, manager: Union[Neo4jManager, AsyncNeo4jManager]):
+        self.manager = manager
         self.metrics: List[QueryMetrics] = []
         self.queries: Dict[str, str] = {}
-        
+    
     def load_query(self, name: str, filepath: str) -> bool:
         """Carica una query da file"""
         try:
@@ -58,30 +97,21 @@ class QueryEngine:
         print(f"\n📊 {loaded} query caricate")
         return loaded
     
-    def execute_query(
-        self, 
-        name: str, 
-        params: Optional[Dict] = None,
-        parser: str = 'dataframe',
-        dataset_info: Optional[Dict] = None
-    ) -> QueryMetrics:
-        """Esegue una query e registra le metriche"""
-        if name not in self.queries:
-            return QueryMetrics(
-                query_name=name,
-                execution_time=0.0,
-                rows_returned=0,
-                success=False,
-                error=f"Query '{name}' non trovata"
-            )
-        
-        query = self.queries[name]
-        
-        print(f"Esecuzione {name}...", end=" ")
-        
-        # Esegui query
-        result = self.manager.run_cypher(query, params, parser)
-        
+    @staticmethod
+    def _missing_query(name: str) -> QueryMetrics:
+        """Metriche di una query non caricata"""
+        return QueryMetrics(
+            query_name=name,
+            execution_time=0.0,
+            rows_returned=0,
+            success=False,
+            error=f"Query '{name}' non trovata"
+        )
+    
+    def _record_metrics(self, name: str, result: QueryResult,
+                        dataset_info: Optional[Dict] = None,
+                        cache_hit: Optional[bool] = None) -> QueryMetrics:
+        """Metriche di un QueryResult, registrate in self.metrics"""
         # Calcola righe restituite
         rows_returned = 0
         if result.success and result.data is not None:
@@ -91,43 +121,76 @@ class QueryEngine:
                 rows_returned = len(result.data)
             elif isinstance(result.data, int):
                 rows_returned = result.data
+            elif isinstance(result.data, WriteMetrics):
+                rows_returned = result.data.rows
         
-        # Crea metriche
         metrics = QueryMetrics(
             query_name=name,
             execution_time=result.execution_time,
             rows_returned=rows_returned,
             success=result.success,
             error=result.error,
-            dataset_info=dataset_info
+            dataset_info=dataset_info,
+            cache_hits=int(cache_hit is True),
+            cache_misses=int(cache_hit is False),
+            result_available_after=result.result_available_after,
+            result_consumed_after=result.result_consumed_after
         )
-        
-        # Registra metriche
+        if result.profile:
+            metrics.plan = result.profile
+            totals = plan_totals(result.profile)
+            metrics.db_hits = totals['db_hits']
+            metrics.page_cache_hits = totals['page_cache_hits']
+            metrics.page_cache_misses = totals['page_cache_misses']
         self.metrics.append(metrics)
-        
-        # Stampa risultato
-        if result.success:
-            print(f"OK ({result.execution_time:.3f}s, {rows_returned} righe)")
-        else:
-            print(f"ERRORE: {result.error}")
-        
         return metrics
     
     def save_results_simple(self, output_dir: str = "results"):
         """Salva risultati query in file separati"""
         os.makedirs(output_dir, exist_ok=True)
         
-        # Salva tempi esecuzione
+        # Salva tempi esecuzione; client_seconds è il tempo fuori dal server
+        # (sessione, trasferimento, parsing)
         times_df = pd.DataFrame([{
             'query': m.query_name,
             'execution_time_seconds': m.execution_time,
             'rows': m.rows_returned,
-            'success': m.success
+            'success': m.success,
+            'cache_hits': m.cache_hits,
+            'cache_misses': m.cache_misses,
+            'result_available_after_ms': m.result_available_after,
+            'result_consumed_after_ms': m.result_consumed_after,
+            'client_seconds': (
+                m.execution_time - (m.result_available_after + m.result_consumed_after) / 1000
+                if m.result_available_after is not None and m.result_consumed_after is not None
+                else None
+            ),
+            'db_hits': m.db_hits,
+            'page_cache_hits': m.page_cache_hits,
+            'page_cache_misses': m.page_cache_misses,
+            'server_seconds': m.server_seconds,
+            'fetch_seconds': m.fetch_seconds,
+            'write_seconds': m.write_seconds
         } for m in self.metrics])
         
         times_file = os.path.join(output_dir, 'execution_times.csv')
         times_df.to_csv(times_file, index=False)
         print(f"Tempi salvati in {times_file}")
+        
+        # Piani PROFILE: albero completo in JSON, operatori in CSV
+        profiled = [(run, m) for run, m in enumerate(self.metrics) if m.plan]
+        if profiled:
+            plans_file = os.path.join(output_dir, 'query_plans.json')
+            with open(plans_file, 'w') as f:
+                json.dump([{'run': run, 'query': m.query_name, 'plan': m.plan}
+                           for run, m in profiled], f, indent=2, default=str)
+            operators_df = pd.DataFrame([
+                {'run': run, 'query': m.query_name, **operator}
+                for run, m in profiled for operator in plan_operators(m.plan)
+            ])
+            operators_file = os.path.join(output_dir, 'query_operators.csv')
+            operators_df.to_csv(operators_file, index=False)
+            print(f"Piani salvati in {plans_file} e {operators_file}")
     
     def get_last_result(self) -> Optional[Any]:
         """Ritorna i dati dell'ultima query eseguita"""
@@ -135,18 +198,155 @@ class QueryEngine:
             return None
         return self.metrics[-1]
     
+
+class QueryEngine(BaseQueryEngine):
+    """
+    Engine per eseguire query e raccogliere metriche
+    
+    Con una ResultCache i risultati delle query di sola lettura vengono
+    riusati finché l'impronta del database non cambia; le scritture fatte
+    dal manager forzano il ricalcolo dell'impronta. Scritture di altri
+    client durante la sessione non vengono viste.
+    
+    Con profile=True ogni query viene eseguita con PROFILE (mai dalla
+    cache) e le metriche includono piano, db hits e page cache.
+    """
+    
+    def __init__(self, config: Optional[Neo4jConfig] = None,
+                 cache: Optional[ResultCache] = None,
+                 profile: bool = False):
+        super().__init__(Neo4jManager(config))
+        self.cache = cache
+        self.profile = profile
+        self._fingerprint: Optional[Dict[str, Any]] = None
+        self._fingerprint_writes = 0
+        
+    def execute_query(
+        self, 
+        name: str, 
+        params: Optional[Dict] = None,
+        parser: Union[str, ResponseParser] = 'columnar',
+        dataset_info: Optional[Dict] = None
+    ) -> QueryMetrics:
+        """Esegue una query e registra le metriche"""
+        return self._execute(name, params, parser, dataset_info)[0]
+    
+    def export_query(
+        self,
+        name: str,
+        output_file: str,
+        params: Optional[Dict] = None,
+        dataset_info: Optional[Dict] = None
+    ) -> QueryMetrics:
+        """
+        Esegue una query una sola volta e ne scrive il risultato in output_file
+        
+        Le righe vanno direttamente su file (SinkParser) mentre arrivano. Con
+        la cache dei risultati il file di una query di sola lettura viene
+        salvato nella cache e a un hit copiato in output_file. Le metriche
+        separano il tempo del server, della lettura e della scrittura del file.
+        """
+        sink = SinkParser(output_file)
+        metrics, result = self._execute(name, params, sink, dataset_info)
+        if result is not None and result.success:
+            # Da un hit il tempo è tutto copia del file
+            self._set_phases(metrics, metrics.execution_time if metrics.cache_hits
+                             else sink.write_seconds)
+            print(f"   {output_file}: server {metrics.server_seconds or 0:.3f}s, "
+                  f"lettura {metrics.fetch_seconds:.3f}s, scrittura {metrics.write_seconds:.3f}s")
+        return metrics
+    
+    @staticmethod
+    def _set_phases(metrics: QueryMetrics, write_seconds: float) -> None:
+        """
+        Fasi di un export: server fino al primo record (result_available_after),
+        scrittura del file, lettura = il resto (trasferimento e parsing)
+        """
+        metrics.write_seconds = write_seconds
+        if metrics.result_available_after is not None:
+            metrics.server_seconds = metrics.result_available_after / 1000
+        metrics.fetch_seconds = max(
+            0.0, metrics.execution_time - (metrics.server_seconds or 0.0) - write_seconds
+        )
+    
+    def _execute(
+        self,
+        name: str,
+        params: Optional[Dict],
+        parser: Union[str, ResponseParser],
+        dataset_info: Optional[Dict]
+    ) -> Tuple[QueryMetrics, Optional[QueryResult]]:
+        """Esecuzione (o risultato dalla cache) con metriche e risultato"""
+        if name not in self.queries:
+            return self._missing_query(name), None
+        
+        query = self.queries[name]
+        
+        print(f"Esecuzione {name}...", end=" ")
+        
+        # Risultato dalla cache o esecuzione
+        # Un SinkParser va in cache come file: un hit lo copia al suo posto
+        sink = parser if isinstance(parser, SinkParser) else None
+        cache_key = self._cache_key(query, params, parser)
+        cache_hit = False
+        if cache_key is not None:
+            start_time = time.time()
+            if sink is not None:
+                cache_hit = self.cache.get_file(cache_key, name, sink.path)
+                data = count_file_rows(sink.path) if cache_hit else None
+            else:
+                cache_hit, data = self.cache.get(cache_key, name)
+            if cache_hit:
+                result = QueryResult(success=True, data=data,
+                                     execution_time=time.time() - start_time, query=query)
+        if not cache_hit:
+            writes = self.manager.write_count
+            result = self.manager.run_cypher(query, params, parser, profile=self.profile)
+            # Una query che scrive non va mai servita dalla cache
+            if cache_key is not None and result.success and self.manager.write_count == writes:
+                if sink is not None:
+                    self.cache.put_file(cache_key, name, sink.path)
+                else:
+                    self.cache.put(cache_key, name, result.data)
+        metrics = self._record_metrics(name, result, dataset_info,
+                                       None if cache_key is None else cache_hit)
+        
+        # Stampa risultato
+        if result.success:
+            source = "cache, " if cache_hit else ""
+            print(f"OK ({source}{result.execution_time:.3f}s, {metrics.rows_returned} righe)")
+        else:
+            print(f"ERRORE: {result.error}")
+        
+        return metrics, result
+    
+    def _cache_key(self, query: str, params: Optional[Dict],
+                   parser: Union[str, ResponseParser]) -> Optional[str]:
+        """Chiave della cache dei risultati, None se il risultato non va in cache"""
+        if isinstance(parser, SinkParser):
+            # Il nome del file è nella voce della cache (e ne decide il formato)
+            variant = {'sink': os.path.basename(parser.path)}
+        elif isinstance(parser, str) and parser in CACHEABLE_PARSERS:
+            variant = {'parser': parser}
+        else:
+            return None
+        if self.cache is None or self.profile:
+            return None
+        if self._fingerprint is None or self._fingerprint_writes != self.manager.write_count:
+            if self._fingerprint is not None:
+                # Il manager ha scritto: le voci in memoria non valgono più
+                self.cache.invalidate()
+            self._fingerprint_writes = self.manager.write_count
+            self._fingerprint = database_fingerprint(self.manager)
+        if self._fingerprint is None:
+            return None
+        return self.cache.key(query, {'params': params, **variant}, self._fingerprint)
+    
     def get_dataset_info(self) -> Dict[str, Any]:
         """Recupera informazioni sul dataset dal database"""
         info = {}
         
-        queries = {
-            'customers': "MATCH (c:Customer) RETURN count(c) as count",
-            'terminals': "MATCH (t:Terminal) RETURN count(t) as count",
-            'transactions': "MATCH (tx:Transaction) RETURN count(tx) as count",
-            'quarters': "MATCH (q:Quarter) RETURN count(q) as count"
-        }
-        
-        for name, query in queries.items():
+        for name, query in DATASET_INFO_QUERIES.items():
             result = self.manager.run_cypher(query, parser='single')
             if result.success:
                 info[name] = result.data
@@ -171,11 +371,96 @@ class QueryEngine:
         self.disconnect()
 
 
+class AsyncQueryEngine(BaseQueryEngine):
+    """
+    Engine su AsyncNeo4jManager
+
+    Caricamento delle query, metriche e salvataggio dei tempi sono quelli di
+    BaseQueryEngine, come in QueryEngine; esecuzione, connessione e
+    get_dataset_info sono coroutine, quindi query indipendenti possono
+    girare in parallelo entro config.max_concurrency (execute_many,
+    get_dataset_info). Niente cache dei risultati né PROFILE.
+    """
+    
+    def __init__(self, config: Optional[Neo4jConfig] = None):
+        super().__init__(AsyncNeo4jManager(config))
+    
+    async def execute_query(
+        self,
+        name: str,
+        params: Optional[Dict] = None,
+        parser: Union[str, ResponseParser] = 'columnar',
+        dataset_info: Optional[Dict] = None
+    ) -> QueryMetrics:
+        """Esegue una query e registra le metriche"""
+        if name not in self.queries:
+            return self._missing_query(name)
+        
+        result = await self.manager.run_cypher(self.queries[name], params, parser)
+        metrics = self._record_metrics(name, result, dataset_info)
+        
+        # Una riga per query: con più query in parallelo le stampe si alternano
+        if result.success:
+            print(f"{name}: OK ({result.execution_time:.3f}s, {metrics.rows_returned} righe)")
+        else:
+            print(f"{name}: ERRORE: {result.error}")
+        
+        return metrics
+    
+    async def execute_many(
+        self,
+        name: str,
+        params_list: Sequence[Optional[Dict]],
+        parser: Union[str, ResponseParser] = 'columnar'
+    ) -> List[QueryMetrics]:
+        """
+        Esegue la stessa query con parametri diversi, in parallelo
+        
+        Args:
+            name: Nome della query
+            params_list: Parametri di ogni esecuzione (es. un customerId per q1c)
+            parser: Parser usato per tutte le esecuzioni
+            
+        Returns:
+            QueryMetrics nello stesso ordine di params_list
+        """
+        return list(await asyncio.gather(*(
+            self.execute_query(name, params, parser) for params in params_list
+        )))
+    
+    async def get_dataset_info(self) -> Dict[str, Any]:
+        """Recupera informazioni sul dataset dal database, con i conteggi in parallelo"""
+        names = list(DATASET_INFO_QUERIES)
+        results = await self.manager.run_many(
+            [(DATASET_INFO_QUERIES[name], None) for name in names], parser='single'
+        )
+        return {name: result.data for name, result in zip(names, results) if result.success}
+    
+    async def connect(self) -> bool:
+        """Connetti al database"""
+        return await self.manager.connect()
+    
+    async def disconnect(self):
+        """Disconnetti dal database"""
+        await self.manager.disconnect()
+    
+    async def __aenter__(self):
+        """Context manager"""
+        await self.connect()
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Context manager cleanup"""
+        await self.disconnect()
+
+
 class QueryExecutor:
     """Executor specifico per le query del progetto"""
     
-    def __init__(self, config: Optional[Neo4jConfig] = None):
-        self.engine = QueryEngine(config)
+    def __init__(self, config: Optional[Neo4jConfig] = None,
+                 cache: Optional[ResultCache] = None,
+                 profile: bool = False):
+        self.engine = QueryEngine(config, cache, profile)
     
     def run_query_3a(
         self, 
@@ -232,47 +517,104 @@ class QueryExecutor:
             }
         )
     
-    def run_all_queries_simple(self, output_dir: str = "results"):
-        """Esegue tutte e 3 le query e salva risultati"""
+    def extend_transactions(
+        self,
+        batch_size: int = 10000,
+        parallelism: int = 4,
+        seed: Optional[int] = None
+    ) -> QueryMetrics:
+        """
+        Estensione 3.d calcolata in Python (extend.extend_transactions),
+        registrata come 'extend_tx' come la versione Cypher
+        
+        Args:
+            batch_size: Transazioni per batch di scrittura
+            parallelism: Batch scritti in parallelo
+            seed: Seed degli attributi generati
+        """
+        print("Esecuzione extend_tx...", end=" ")
+        result = extend_transactions(self.engine.manager, batch_size, parallelism, seed)
+        metrics = self.engine._record_metrics('extend_tx', result)
+        if result.success:
+            write = result.data
+            print(f"OK ({result.execution_time:.3f}s, {write.rows} righe, "
+                  f"{write.rows_per_second:,.0f} righe/s, {write.retries} retry)")
+        else:
+            print(f"ERRORE: {result.error}")
+        return metrics
+    
+    def run_cn3_batch(self, customers: str, output_dir: str = "results",
+                      workers: int = DEFAULT_WORKERS) -> bool:
+        """
+        Query 3.c per molti customer, con workers lookup in parallelo
+        
+        Le righe di tutte le lookup finiscono in query_3c_batch.csv, la
+        latenza di ognuna in query_3c_batch_latencies.csv.
+        
+        Args:
+            customers: 'all' o file con un customerId per riga
+            output_dir: Cartella dei risultati
+            workers: Lookup q1c in esecuzione contemporaneamente
+            
+        Returns:
+            True se tutte le lookup sono riuscite
+        """
+        if 'q1c' not in self.engine.queries:
+            print("❌ Query q1c non caricata")
+            return False
+        customer_ids = read_customers(customers, self.engine.manager)
+        if not customer_ids:
+            print("⚠️  Nessun customer da elaborare")
+            return True
+        
+        output_file = os.path.join(output_dir, 'query_3c_batch.csv')
+        print(f"CN3 per {len(customer_ids)} customer con {workers} worker...")
+        report = run_cn3_batch(self.engine.manager.config, self.engine.queries['q1c'],
+                               customer_ids, output_file, workers)
+        
+        report['lookups'].to_csv(os.path.join(output_dir, 'query_3c_batch_latencies.csv'),
+                                 index=False)
+        print(f"\n{'✅' if not report['errors'] else '⚠️ '} {report['customers']} customer in "
+              f"{report['seconds']:.2f}s ({report['customers_per_second']:,.1f} customer/s), "
+              f"{report['rows']:,} righe, {report['errors']} errori")
+        if 'p50_ms' in report:
+            print(f"   Latenza per lookup: p50 {report['p50_ms']:.1f}ms, "
+                  f"p95 {report['p95_ms']:.1f}ms, p99 {report['p99_ms']:.1f}ms, "
+                  f"max {report['max_ms']:.1f}ms")
+        print(f"   Risultati in {output_file}")
+        return not report['errors']
+    
+    def run_all_queries_simple(self, output_dir: str = "results",
+                               precomputed_outliers: bool = False):
+        """
+        Esegue tutte e 3 le query e salva risultati
+        
+        Args:
+            output_dir: Cartella dei risultati
+            precomputed_outliers: Query 3.b con q1b_precomputed (dataset
+                generato con --outliers) invece di ricalcolare gli outlier
+        """
         import os
         os.makedirs(output_dir, exist_ok=True)
         
         print("Esecuzione query...")
         
         # Query 3.a
-        self.engine.execute_query('q1a')
-        if self.engine.metrics[-1].success:
-            result = self.engine.manager.run_cypher(
-                self.engine.queries['q1a'],
-                parser='dataframe'
-            )
-            if result.success and isinstance(result.data, pd.DataFrame):
-                result.data.to_csv(f"{output_dir}/query_3a.csv", index=False)
+        self.engine.export_query('q1a', f"{output_dir}/query_3a.csv")
         
         # Query 3.b
-        self.engine.execute_query('q1b')
-        if self.engine.metrics[-1].success:
-            result = self.engine.manager.run_cypher(
-                self.engine.queries['q1b'],
-                parser='dataframe'
-            )
-            if result.success and isinstance(result.data, pd.DataFrame):
-                result.data.to_csv(f"{output_dir}/query_3b.csv", index=False)
+        q1b = 'q1b_precomputed' if precomputed_outliers else 'q1b'
+        self.engine.export_query(q1b, f"{output_dir}/query_3b.csv")
         
         # Query 3.c
         if 'q1c' in self.engine.queries:
-            self.engine.execute_query('q1c', params={'customerId': '889'})
-            if self.engine.metrics[-1].success:
-                result = self.engine.manager.run_cypher(
-                    self.engine.queries['q1c'],
-                    params={'customerId': '889'},
-                    parser='dataframe'
-                )
-                if result.success and isinstance(result.data, pd.DataFrame):
-                    result.data.to_csv(f"{output_dir}/query_3c.csv", index=False)
+            self.engine.export_query('q1c', f"{output_dir}/query_3c.csv",
+                                     params=DEFAULT_PARAMS['q1c'])
         
         # Salva tempi
         self.engine.save_results_simple(output_dir)
+        if self.engine.cache is not None:
+            print(self.engine.cache.summary())
         
         print(f"\nRisultati salvati in {output_dir}/")
     
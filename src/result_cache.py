@@ -0,0 +1,131 @@
+"""Cache dei risultati delle query: LRU in memoria più StageCache su disco"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from cache import DEFAULT_MAX_BYTES, StageCache
+
+
+# Parser con risultati riutilizzabili in memoria; un SinkParser viene messo
+# in cache come file (get_file/put_file), gli altri parser istanza mai
+CACHEABLE_PARSERS = ('dataframe', 'columnar', 'list', 'count', 'single')
+
+# Impronta economica del database: i conteggi vengono dal count store, la
+# transazione più recente cambia a ogni scrittura, ID e data di creazione
+# cambiano a ogni reimport (anche con gli stessi conteggi e transazioni)
+FINGERPRINT_QUERY = """
+CALL { MATCH (n) RETURN count(n) AS nodes }
+CALL { MATCH ()-[r]->() RETURN count(r) AS relationships }
+RETURN nodes, relationships
+"""
+
+DATABASE_STATE_QUERY = """
+SHOW DATABASES YIELD name, databaseID, creationTime, lastCommittedTxn
+WHERE name = $database
+RETURN databaseID AS database_id, toString(creationTime) AS creation_time,
+       lastCommittedTxn AS last_transaction
+"""
+
+
+class ResultCache:
+    """
+    Cache dei risultati di QueryEngine.execute_query
+
+    La chiave è l'hash di testo della query, parametri e impronta del
+    database (database_fingerprint): dopo un reimport o una scrittura
+    l'impronta cambia e le voci precedenti non vengono più trovate. Le
+    ultime max_entries voci restano in memoria, tutte sono salvate in una
+    StageCache (pickle, LRU per dimensione) e sopravvivono al processo.
+    """
+
+    def __init__(self, root: str = '.cache/queries', max_entries: int = 32,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.disk = StageCache(root, max_bytes, verbose=False)
+        self.memory: 'OrderedDict[str, Any]' = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, query: str, params: Optional[Dict], fingerprint: Dict[str, Any]) -> str:
+        query_hash = hashlib.sha256(query.encode()).hexdigest()
+        return self.disk.key('query', {'query': query_hash, 'params': params or {},
+                                       'database': fingerprint})
+
+    def get(self, key: str, name: str) -> Tuple[bool, Any]:
+        """
+        Returns:
+            Tuple (hit, risultato)
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return True, self.memory[key]
+        if self.disk.has(key):
+            value = self.disk.load(key, name)
+            self._remember(key, value)
+            self.hits += 1
+            return True, value
+        self.misses += 1
+        return False, None
+
+    def put(self, key: str, name: str, value: Any) -> None:
+        self._remember(key, value)
+        self.disk.save(key, name, value)
+
+    def get_file(self, key: str, name: str, output_file: str) -> bool:
+        """
+        Copia in output_file il file in cache sotto la chiave
+
+        Returns:
+            True se il file era in cache
+        """
+        if not self.disk.has(key):
+            self.misses += 1
+            return False
+        self._store_file(key, name, output_file)
+        self.hits += 1
+        return True
+
+    def put_file(self, key: str, name: str, output_file: str) -> None:
+        """Salva su disco una copia di output_file, appena scritto da un SinkParser"""
+        self._store_file(key, name, output_file)
+
+    def _store_file(self, key: str, name: str, output_file: str) -> None:
+        # files copia dalla cache se la chiave c'è, altrimenti salva il file già scritto
+        folder, filename = os.path.split(output_file)
+        self.disk.files(key, name, folder or '.', [filename], lambda _: None)
+
+    def invalidate(self) -> None:
+        """Svuota la memoria; su disco le voci hanno l'impronta precedente e non vengono più lette"""
+        self.memory.clear()
+
+    def summary(self) -> str:
+        return f"Cache risultati: {self.hits} hit, {self.misses} miss ({self.disk.root})"
+
+    def _remember(self, key: str, value: Any) -> None:
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+
+def database_fingerprint(manager) -> Optional[Dict[str, Any]]:
+    """
+    Conteggi di nodi e relazioni, identità e ultima transazione del database
+
+    Returns:
+        Dizionario dell'impronta, None se non è completa: senza ultima
+        transazione una scrittura non cambierebbe l'impronta, quindi i
+        risultati non vanno in cache
+    """
+    counts = manager.run_cypher(FINGERPRINT_QUERY, parser='list')
+    if not counts.success or not counts.data:
+        return None
+    # SHOW DATABASES può non essere disponibile (permessi, versione)
+    state = manager.run_cypher(DATABASE_STATE_QUERY, {'database': manager.config.database},
+                               parser='list')
+    if not state.success or not state.data or state.data[0]['last_transaction'] is None:
+        return None
+    return {**counts.data[0], **state.data[0]}
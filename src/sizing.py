@@ -0,0 +1,264 @@
+"""Modello di dimensione del dataset calibrato su un campione pilota"""
+
+import contextlib
+import io
+import os
+import re
+import tempfile
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from original import generate_dataset, add_frauds
+from converters import Converters
+
+
+# File scritti da Converters.to_csv: (righe da cui dipendono, colonne ID che
+# crescono in larghezza con il numero di entità)
+CSV_FILES: Dict[str, Tuple[str, List[str]]] = {
+    'customers.csv': ('customers', ['customer']),
+    'terminals.csv': ('terminals', ['terminal']),
+    'transactions.csv': ('transactions', ['transaction']),
+    'cust_tx.csv': ('transactions', ['customer', 'transaction']),
+    'tx_term.csv': ('transactions', ['transaction', 'terminal']),
+    'transaction_quarter.csv': ('transactions', ['transaction', 'terminal']),
+    'quarters.csv': ('quarters', ['terminal']),
+    'terminal_quarter.csv': ('quarters', ['terminal', 'terminal']),
+    'used_terminal.csv': ('used_terminals', ['customer', 'terminal']),
+    'shares_terminal.csv': ('shares_terminal', ['customer', 'customer', 'terminal']),
+}
+
+SHAPE_POLICIES = ('days', 'customers', 'balanced')
+
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(size: str) -> int:
+    """Converte '500MB', '2GB', '1.5GB' in byte"""
+    match = re.fullmatch(r'\s*([0-9]*\.?[0-9]+)\s*([KMG]B)\s*', size.upper())
+    if not match:
+        raise ValueError(f"Dimensione non valida: {size} (es. 200MB, 2GB)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def average_digits(n: int) -> float:
+    """Numero medio di cifre degli ID 0..n-1"""
+    if n <= 0:
+        return 0.0
+    total = 0
+    low = 0
+    digits = 1
+    while low < n:
+        high = min(n, 10 ** digits)
+        total += (high - low) * digits
+        low = high
+        digits += 1
+    return total / n
+
+
+def count_quarters(nb_days: int, start_date: str = "2018-04-01") -> int:
+    """Quarter di calendario coperti da nb_days giorni a partire da start_date"""
+    if nb_days <= 0:
+        return 0
+    start = pd.Timestamp(start_date)
+    end = start + pd.Timedelta(days=nb_days - 1)
+    return (end.year * 4 + end.quarter) - (start.year * 4 + start.quarter) + 1
+
+
+class SizeModel:
+    """
+    Stima la dimensione dei CSV di Converters.to_csv per (clienti, terminali, giorni).
+
+    Un dataset pilota viene generato e convertito per misurare i byte per riga di
+    ogni file (al netto della larghezza degli ID) e i fattori di calibrazione dei
+    conteggi di righe; le righe per il target sono stimate con un modello
+    della geometria del generatore.
+    """
+
+    def __init__(self, pilot_customers: int = 1000, pilot_terminals: int = 200,
+                 pilot_days: int = 60, r: float = 5, id_type: str = 'string'):
+        self.pilot_customers = pilot_customers
+        self.pilot_terminals = pilot_terminals
+        self.pilot_days = pilot_days
+        self.r = r
+        self.id_type = id_type
+        self.bytes_per_row: Dict[str, float] = {}
+        self.header_bytes: Dict[str, int] = {}
+        self.tx_per_customer_day = 0.0
+        self.terminal_fraction = 0.0
+        self.active_customer_factor = 1.0
+        self.quarter_coverage = 1.0
+        self.used_factor = 1.0
+        self.shares_factor = 1.0
+
+    def calibrate(self) -> 'SizeModel':
+        """Genera il pilota e ne misura byte e righe per file"""
+        with tempfile.TemporaryDirectory() as folder:
+            with contextlib.redirect_stdout(io.StringIO()):
+                customers, terminals, transactions = generate_dataset(
+                    n_customers=self.pilot_customers,
+                    n_terminals=self.pilot_terminals,
+                    nb_days=self.pilot_days,
+                    r=self.r
+                )
+                transactions = add_frauds(customers, terminals, transactions)
+                Converters(id_type=self.id_type).to_csv(customers, terminals, transactions, folder)
+
+            # Frazione dei terminali nel raggio di un customer (indipendente dal numero di terminali)
+            self.terminal_fraction = customers['nb_terminals'].mean() / self.pilot_terminals
+            # Solo i customer con almeno un terminale nel raggio fanno transazioni
+            active_customers = (customers['nb_terminals'] > 0).sum()
+            self.active_customer_factor = self._ratio(
+                active_customers / self.pilot_customers,
+                self._active_customer_probability(self.pilot_terminals)
+            )
+            self.tx_per_customer_day = len(transactions) / (max(active_customers, 1) * self.pilot_days)
+
+            pilot_rows = self._structural_rows(
+                self.pilot_customers, self.pilot_terminals, self.pilot_days
+            )
+            measured_rows = {}
+            for filename, (rows_key, id_columns) in CSV_FILES.items():
+                path = os.path.join(folder, filename)
+                with open(path, 'rb') as f:
+                    header = f.readline()
+                    rows = sum(1 for _ in f)
+                size = os.path.getsize(path)
+                measured_rows[rows_key] = rows
+                self.header_bytes[filename] = len(header)
+                id_bytes = rows * self._id_width(
+                    id_columns, self.pilot_customers, self.pilot_terminals, len(transactions)
+                )
+                self.bytes_per_row[filename] = (size - len(header) - id_bytes) / rows if rows else 0.0
+
+        # Correzione dei conteggi modellati sulle righe effettive del pilota
+        self.quarter_coverage = self._ratio(measured_rows['quarters'], pilot_rows['quarters'])
+        self.used_factor = self._ratio(measured_rows['used_terminals'], pilot_rows['used_terminals'])
+        self.shares_factor = self._ratio(
+            measured_rows['shares_terminal'],
+            self._shares_rows(measured_rows['used_terminals'], self.pilot_terminals)
+        )
+        return self
+
+    def predict(self, n_customers: int, n_terminals: int, nb_days: int) -> Dict[str, int]:
+        """Byte stimati per ogni CSV"""
+        rows = self._structural_rows(n_customers, n_terminals, nb_days)
+        rows['quarters'] *= self.quarter_coverage
+        rows['used_terminals'] *= self.used_factor
+        rows['shares_terminal'] = self.shares_factor * self._shares_rows(
+            rows['used_terminals'], n_terminals
+        )
+
+        sizes = {}
+        for filename, (rows_key, id_columns) in CSV_FILES.items():
+            n_rows = rows[rows_key]
+            width = self.bytes_per_row[filename] + self._id_width(
+                id_columns, n_customers, n_terminals, rows['transactions']
+            )
+            sizes[filename] = int(self.header_bytes[filename] + n_rows * width)
+        return sizes
+
+    def predict_total(self, n_customers: int, n_terminals: int, nb_days: int) -> int:
+        return sum(self.predict(n_customers, n_terminals, nb_days).values())
+
+    def solve(self, target_bytes: int, policy: str = 'days', n_customers: int = 1000,
+              n_terminals: int = 200, nb_days: int = 90) -> Tuple[int, int, int]:
+        """
+        Parametri che avvicinano il target secondo la forma scelta
+
+        Args:
+            target_bytes: Dimensione totale desiderata dei CSV
+            policy: 'days' (cresce solo nb_days), 'customers' (crescono clienti e
+                terminali nello stesso rapporto, giorni fissi) o 'balanced'
+                (clienti, terminali e giorni crescono dello stesso fattore)
+            n_customers, n_terminals, nb_days: Forma di partenza
+
+        Returns:
+            Tuple (n_customers, n_terminals, nb_days)
+        """
+        if policy not in SHAPE_POLICIES:
+            raise ValueError(f"Policy non valida: {policy} ({', '.join(SHAPE_POLICIES)})")
+
+        def shape(scale: float) -> Tuple[int, int, int]:
+            if policy == 'days':
+                return n_customers, n_terminals, max(1, int(round(nb_days * scale)))
+            if policy == 'customers':
+                return (max(1, int(round(n_customers * scale))),
+                        max(1, int(round(n_terminals * scale))), nb_days)
+            return (max(1, int(round(n_customers * scale))),
+                    max(1, int(round(n_terminals * scale))),
+                    max(1, int(round(nb_days * scale))))
+
+        # Bisezione sul fattore di scala: la dimensione cresce con ogni parametro
+        low, high = 0.0, 1.0
+        while self.predict_total(*shape(high)) < target_bytes and high < 1e6:
+            low, high = high, high * 2
+        for _ in range(60):
+            mid = (low + high) / 2
+            if self.predict_total(*shape(mid)) < target_bytes:
+                low = mid
+            else:
+                high = mid
+
+        candidates = {shape(low), shape(high)}
+        return min(candidates, key=lambda p: abs(self.predict_total(*p) - target_bytes))
+
+    def _structural_rows(self, n_customers: int, n_terminals: int, nb_days: int) -> Dict[str, float]:
+        """Righe attese per gruppo di file, prima dei fattori di calibrazione"""
+        active_customers = n_customers * min(
+            1.0, self.active_customer_factor * self._active_customer_probability(n_terminals)
+        )
+        n_transactions = active_customers * nb_days * self.tx_per_customer_day
+        terminals_per_customer = self.terminal_fraction * n_terminals
+        # Terminali nel raggio di almeno un customer
+        active_terminals = n_terminals * (1 - (1 - self.terminal_fraction) ** n_customers)
+        # Coppie (customer, terminale) usate: un terminale nel raggio viene usato
+        # con probabilità crescente con le transazioni del customer
+        if terminals_per_customer > 0:
+            tx_per_terminal = (n_transactions / max(active_customers, 1)) / max(terminals_per_customer, 1)
+            used = n_customers * terminals_per_customer * (1 - np.exp(-tx_per_terminal))
+        else:
+            used = 0.0
+        return {
+            'customers': n_customers,
+            'terminals': n_terminals,
+            'transactions': n_transactions,
+            'quarters': active_terminals * count_quarters(nb_days),
+            'used_terminals': used,
+            'shares_terminal': 0.0,
+        }
+
+    def _active_customer_probability(self, n_terminals: int) -> float:
+        """Probabilità che un customer abbia almeno un terminale nel raggio"""
+        return 1 - (1 - self.terminal_fraction) ** n_terminals
+
+    def _shares_rows(self, used_terminals: float, n_terminals: int) -> float:
+        """Triple (c1, c2, t): per terminale ~ C(m, 2) con m customer che lo usano"""
+        if n_terminals <= 0:
+            return 0.0
+        customers_per_terminal = used_terminals / n_terminals
+        return n_terminals * customers_per_terminal ** 2 / 2
+
+    def _id_width(self, id_columns: List[str], n_customers: int, n_terminals: int,
+                  n_transactions: float) -> float:
+        widths = {
+            'customer': average_digits(n_customers),
+            'terminal': average_digits(n_terminals),
+            'transaction': average_digits(int(n_transactions)),
+        }
+        return sum(widths[column] for column in id_columns)
+
+    @staticmethod
+    def _ratio(measured: float, modelled: float) -> float:
+        return measured / modelled if modelled > 0 else 1.0
+
+
+def dataset_size(output_folder: str) -> int:
+    """Dimensione totale dei CSV di import presenti in output_folder (.csv o .csv.gz)"""
+    total = 0
+    for filename in CSV_FILES:
+        for path in (os.path.join(output_folder, filename), os.path.join(output_folder, filename + '.gz')):
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+    return total
@@ -0,0 +1,131 @@
+"""
+DeltaIngestor: una run interrotta a metà di un passo dei contatori non deve
+contare due volte gli incrementi già scritti
+
+Richiede Neo4j in esecuzione (make start); senza connessione il test viene
+saltato. Connessione da NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from base import Neo4jConfig  # noqa: E402
+from delta import DELTA_STEPS, DeltaIngestor, write_state  # noqa: E402
+from manager import Neo4jManager  # noqa: E402
+
+
+# ID fuori dall'intervallo dei dataset generati, rimossi a fine test
+CUSTOMERS = ['990000001', '990000002', '990000003']
+TERMINAL = '990000001'
+STATE = {'base_days': 990000, 'nb_days': 1}
+DELTA_ID = f"{STATE['base_days']}-{STATE['nb_days']}"
+
+
+class FailAfterFirstBatch:
+    """Neo4jManager il cui write_batches fallisce dopo il primo batch di una query"""
+
+    def __init__(self, manager: Neo4jManager, query: str):
+        self.manager = manager
+        self.query = query
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+    def write_batches(self, query, rows, batch_size=10000, params=None, **kwargs):
+        if query == self.query:
+            rows = self._fail_after(rows, batch_size)
+        return self.manager.write_batches(query, rows, batch_size, params, **kwargs)
+
+    @staticmethod
+    def _fail_after(rows, batch_size):
+        for n, row in enumerate(rows):
+            if n == batch_size:
+                raise RuntimeError("errore simulato dopo il primo batch")
+            yield row
+
+
+def cleanup(manager: Neo4jManager) -> None:
+    manager.run_cypher("MATCH (c:Customer) WHERE c.customerId IN $ids DETACH DELETE c",
+                       {'ids': CUSTOMERS})
+    manager.run_cypher("MATCH (t:Terminal {terminalId: $id}) DETACH DELETE t", {'id': TERMINAL})
+    manager.run_cypher("MATCH (d:DeltaImport {deltaId: $id}) DELETE d", {'id': DELTA_ID})
+
+
+@pytest.fixture
+def manager():
+    manager = Neo4jManager(Neo4jConfig(
+        uri=os.environ.get('NEO4J_URI', 'bolt://localhost:7687'),
+        username=os.environ.get('NEO4J_USER', 'neo4j'),
+        password=os.environ.get('NEO4J_PASSWORD', 'StrongPassword123')
+    ))
+    if not manager.connect():
+        pytest.skip("Neo4j non raggiungibile")
+    cleanup(manager)
+    # Stato di partenza: 5 transazioni per customer, solo il primo ha già usato il terminale
+    manager.run_cypher("""
+        UNWIND $ids AS id
+        CREATE (:Customer {customerId: id, total_tx_count: '5'})
+    """, {'ids': CUSTOMERS})
+    manager.run_cypher("""
+        MATCH (c:Customer {customerId: $customer})
+        CREATE (c)-[:USED_TERMINAL {tx_count: '2'}]->(:Terminal {terminalId: $terminal})
+    """, {'customer': CUSTOMERS[0], 'terminal': TERMINAL})
+    yield manager
+    cleanup(manager)
+    manager.disconnect()
+
+
+@pytest.fixture
+def delta_folder(tmp_path):
+    """Delta con un batch per riga: solo contatori e coppie customer-terminale"""
+    rows = {
+        'customer_tx_count.csv': [{'customerId': c, 'tx_count': '1'} for c in CUSTOMERS],
+        'used_terminal.csv': [
+            {':START_ID(Customer)': c, ':END_ID(Terminal)': TERMINAL,
+             ':TYPE': 'USED_TERMINAL', 'tx_count': n}
+            for c, n in zip(CUSTOMERS, ['1', '3', '4'])
+        ],
+    }
+    for filename, columns, _ in DELTA_STEPS:
+        path = tmp_path / filename
+        if filename in rows:
+            pd.DataFrame(rows[filename]).to_csv(path, index=False)
+        elif not path.exists():
+            pd.DataFrame(columns=list(columns)).to_csv(path, index=False)
+    write_state(str(tmp_path), STATE)
+    return str(tmp_path)
+
+
+def step_query(filename: str) -> str:
+    return next(query for name, _, query in DELTA_STEPS if name == filename)
+
+
+def test_rerun_after_partial_counter_steps(manager, delta_folder):
+    # Prima run: fallisce dopo il primo customer aggiornato
+    failing = FailAfterFirstBatch(manager, step_query('customer_tx_count.csv'))
+    assert not DeltaIngestor(failing, batch_size=1).ingest(delta_folder)
+
+    # Seconda run: contatori dei customer completati, fallisce dopo la prima coppia
+    failing = FailAfterFirstBatch(manager, step_query('used_terminal.csv'))
+    assert not DeltaIngestor(failing, batch_size=1).ingest(delta_folder)
+
+    # Terza run: completa
+    assert DeltaIngestor(manager, batch_size=1).ingest(delta_folder)
+
+    totals = manager.run_cypher("""
+        MATCH (c:Customer) WHERE c.customerId IN $ids
+        RETURN c.customerId AS id, c.total_tx_count AS total
+    """, {'ids': CUSTOMERS}, parser='list')
+    assert {row['id']: row['total'] for row in totals.data} == dict.fromkeys(CUSTOMERS, '6')
+
+    used = manager.run_cypher("""
+        MATCH (c:Customer)-[u:USED_TERMINAL]->(:Terminal {terminalId: $terminal})
+        WHERE c.customerId IN $ids
+        RETURN c.customerId AS id, u.tx_count AS tx_count
+    """, {'ids': CUSTOMERS, 'terminal': TERMINAL}, parser='list')
+    assert {row['id']: row['tx_count'] for row in used.data} == dict(zip(CUSTOMERS, ['3', '3', '4']))